@@ -0,0 +1,200 @@
+"""Throughput benchmark for event ingestion.
+
+Records the same stream of call and agent events once through
+``EventService.record_event``, one commit and one Redis pipeline per
+event as the synchronous API path does, and once through ``EventIngestor``,
+which buffers them and records each batch with one commit and one
+pipeline. Reports events per second, the speedup over the synchronous
+path and database commits for each mode.
+
+Usage (from plugins/call-distribution)::
+
+    python -m benchmarks.ingest --events 5000
+    python -m benchmarks.ingest --redis-url redis://localhost:6379 --db-url postgresql://user@localhost/bench
+
+Without ``--redis-url`` and ``--db-url`` the run uses a fake Redis and an
+in-memory SQLite database; both emulate commands in process, with no
+network round trips, so they understate what batching saves on a real
+deployment. ``--redis-db`` must name an empty database: it is emptied
+again after each mode. Events written to a ``--db-url`` database are
+deleted after the run.
+"""
+
+import argparse
+import json
+import random
+import re
+import time
+from typing import Dict, List, Optional, Tuple
+
+import fakeredis
+import redis
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import scoped_session, sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from wazo_call_distributor.models import Base, Queue, Agent, Event
+from wazo_call_distributor.ingest import EventIngestor
+from wazo_call_distributor.services.event import EventService
+
+TENANT_UUID = 'benchmark'
+MODES = ('sync', 'buffered')
+
+def event_stream(count: int, queue_ids: List[int], agent_ids: List[int],
+                 rng: random.Random) -> List[Tuple[str, str, str, Dict]]:
+    """Build call lifecycles (entered, answered, ended) with a few agent pauses in between."""
+    items = []
+    call = 0
+    while len(items) < count:
+        call += 1
+        call_id = f'call-{call}'
+        queue_id = rng.choice(queue_ids)
+        agent_id = rng.choice(agent_ids)
+        items.append((TENANT_UUID, 'call', 'call_entered', {'queue_id': queue_id, 'call_id': call_id,
+                                                             'caller_id': f'+1555{call:07d}'}))
+        items.append((TENANT_UUID, 'call', 'call_answered', {'queue_id': queue_id, 'call_id': call_id,
+                                                              'agent_id': agent_id, 'wait_time': rng.randint(0, 60),
+                                                              'caller_id': f'+1555{call:07d}'}))
+        items.append((TENANT_UUID, 'call', 'call_ended', {'queue_id': queue_id, 'call_id': call_id,
+                                                           'agent_id': agent_id, 'talk_time': rng.randint(30, 600)}))
+        if rng.random() < 0.1:
+            items.append((TENANT_UUID, 'agent', 'agent_paused', {'agent_id': agent_id, 'queue_id': queue_id}))
+            items.append((TENANT_UUID, 'agent', 'agent_unpaused', {'agent_id': agent_id, 'queue_id': queue_id}))
+    return items[:count]
+
+class IngestRun:
+    """One ingestion mode against a fresh database and Redis."""
+
+    def __init__(self, mode: str, args: argparse.Namespace):
+        self.mode = mode
+        self.args = args
+        self.commits = 0
+
+        if args.db_url:
+            self.engine = create_engine(args.db_url)
+        else:
+            # One connection shared by the benchmark and the ingestor thread
+            self.engine = create_engine('sqlite://', poolclass=StaticPool,
+                                        connect_args={'check_same_thread': False})
+        Base.metadata.create_all(self.engine)
+        event.listen(self.engine, 'commit', self._count_commit)
+        self.session_factory = scoped_session(sessionmaker(bind=self.engine))
+
+        if args.redis_url:
+            self.redis = redis.Redis.from_url(args.redis_url, db=args.redis_db)
+            if self.redis.dbsize():
+                raise SystemExit(f"Redis database {args.redis_db} is not empty; pick another with --redis-db")
+        else:
+            self.redis = fakeredis.FakeRedis()
+
+    def _count_commit(self, *args) -> None:
+        self.commits += 1
+
+    def run(self) -> Dict:
+        """Record the events and return the mode's report."""
+        session = self.session_factory()
+        queues = [Queue(tenant_uuid=TENANT_UUID, name=f'bench-{i}', strategy='ringall')
+                  for i in range(self.args.queues)]
+        agents = [Agent(tenant_uuid=TENANT_UUID, name=f'agent-{i}', number=str(1000 + i))
+                  for i in range(self.args.agents)]
+        session.add_all(queues + agents)
+        session.commit()
+        items = event_stream(self.args.events, [q.id for q in queues], [a.id for a in agents],
+                             random.Random(self.args.seed))
+        self.session_factory.remove()
+
+        self.commits = 0
+        try:
+            started = time.perf_counter()
+            if self.mode == 'sync':
+                self._record_each(items)
+            else:
+                self._record_buffered(items)
+            elapsed = time.perf_counter() - started
+        finally:
+            self._cleanup(queues, agents)
+
+        return {
+            'mode': self.mode,
+            'events': len(items),
+            'seconds': elapsed,
+            'events_per_sec': len(items) / elapsed if elapsed else 0,
+            'commits': self.commits
+        }
+
+    def _record_each(self, items: List[Tuple[str, str, str, Dict]]) -> None:
+        """Record every event with its own service call, like ``POST /events`` without buffering."""
+        for item in items:
+            session = self.session_factory()
+            EventService(session, self.redis).record_event(*item)
+            self.session_factory.remove()
+
+    def _record_buffered(self, items: List[Tuple[str, str, str, Dict]]) -> None:
+        """Submit every event to an ingestor and wait until it has recorded them all."""
+        ingestor = EventIngestor()
+        ingestor.configure(batch_size=self.args.batch_size, flush_interval=self.args.flush_interval,
+                           max_pending=max(len(items), 1))
+        ingestor.start(self.session_factory, self.redis)
+        ingestor.submit_many(items)
+        ingestor.stop()
+
+    def _cleanup(self, queues: List[Queue], agents: List[Agent]) -> None:
+        """Delete what the run wrote to a real database and empty its Redis database."""
+        if self.args.redis_url:
+            self.redis.flushdb()
+        if self.args.db_url:
+            session = self.session_factory()
+            session.query(Event).filter(Event.tenant_uuid == TENANT_UUID).delete(synchronize_session=False)
+            session.query(Queue).filter(Queue.id.in_([q.id for q in queues])).delete(synchronize_session=False)
+            session.query(Agent).filter(Agent.id.in_([a.id for a in agents])).delete(synchronize_session=False)
+            session.commit()
+        self.session_factory.remove()
+        self.engine.dispose()
+
+# Report columns: result key, header and value format
+COLUMNS = (
+    ('mode', 'mode', '{:<9}'),
+    ('events', 'events', '{:>7}'),
+    ('seconds', 'seconds', '{:>8.2f}'),
+    ('events_per_sec', 'ev/s', '{:>8.0f}'),
+    ('speedup', 'speedup', '{:>7.1f}'),
+    ('commits', 'commits', '{:>7}')
+)
+
+def _header(header: str, fmt: str) -> str:
+    """Align a column header with its value format."""
+    align, width = re.match(r'\{:([<>])(\d+)', fmt).groups()
+    return f'{header:{align}{width}}'
+
+def main(argv: Optional[List[str]] = None) -> None:
+    """Run each ingestion mode over the same events and print a comparison."""
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--modes', default=','.join(MODES), help='comma-separated ingestion modes to run')
+    parser.add_argument('--events', type=int, default=5000)
+    parser.add_argument('--queues', type=int, default=10)
+    parser.add_argument('--agents', type=int, default=50)
+    parser.add_argument('--batch-size', type=int, default=500, help='events recorded per flush')
+    parser.add_argument('--flush-interval', type=float, default=0.05, help='seconds an event may wait')
+    parser.add_argument('--redis-url', help='use a real Redis server')
+    parser.add_argument('--redis-db', type=int, default=15,
+                        help='empty database used on the --redis-url server unless the URL names one')
+    parser.add_argument('--db-url', help='use a real database, such as PostgreSQL')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--json', action='store_true', help='print results as JSON')
+    args = parser.parse_args(argv)
+
+    results = [IngestRun(mode, args).run() for mode in args.modes.split(',')]
+    baseline = next((result['events_per_sec'] for result in results if result['mode'] == 'sync'), None)
+    for result in results:
+        result['speedup'] = result['events_per_sec'] / baseline if baseline else 0.0
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    print(' '.join(_header(header, fmt) for _, header, fmt in COLUMNS))
+    for result in results:
+        print(' '.join(fmt.format(result[key]) for key, _, fmt in COLUMNS))
+
+if __name__ == '__main__':
+    main()
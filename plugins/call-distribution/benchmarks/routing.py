@@ -0,0 +1,278 @@
+"""Discrete-event simulator for call distribution strategies.
+
+Drives synthetic or recorded call arrivals through ``DistributionService``
+backed by an in-memory SQLite database and a fake Redis, and reports
+decision latency, queries per decision, fairness and service-level outcomes
+for each strategy.
+
+Usage (from plugins/call-distribution)::
+
+    python -m benchmarks.routing --agents 50 --rate 2 --duration 3600
+    python -m benchmarks.routing --strategies leastrecent,fewestcalls --trace calls.csv
+
+Recorded traces are CSV files with an ``arrival`` column (seconds from the
+start of the run) and optional ``handle_time`` and ``patience`` columns.
+"""
+
+import argparse
+import csv
+import heapq
+import json
+import random
+import re
+import statistics
+import time
+from collections import deque
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import fakeredis
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import sessionmaker
+
+from wazo_call_distributor.models import Base, Queue, Agent, QueueMember
+from wazo_call_distributor.availability import availability_index
+from wazo_call_distributor.leases import AgentLeases
+from wazo_call_distributor.services.distribution import DistributionService, strategy_cache
+from wazo_call_distributor.strategies import STRATEGY_MAPPING, precomputed_candidates
+
+TENANT_UUID = 'benchmark'
+
+ARRIVAL, CALL_END, ABANDON = 'arrival', 'call_end', 'abandon'
+
+class Call:
+    """A simulated caller."""
+
+    __slots__ = ('call_id', 'arrival', 'handle_time', 'patience', 'answered_at', 'abandoned')
+
+    def __init__(self, call_id: str, arrival: float, handle_time: float, patience: float):
+        self.call_id = call_id
+        self.arrival = arrival
+        self.handle_time = handle_time
+        self.patience = patience
+        self.answered_at: Optional[float] = None
+        self.abandoned = False
+
+def synthetic_calls(rate: float, duration: float, handle_time: float,
+                    patience: float, rng: random.Random) -> Iterator[Call]:
+    """Generate Poisson arrivals with exponential handle times and patience."""
+    clock = 0.0
+    count = 0
+    while True:
+        clock += rng.expovariate(rate)
+        if clock >= duration:
+            return
+        count += 1
+        yield Call(f'call-{count}', clock,
+                   rng.expovariate(1 / handle_time),
+                   rng.expovariate(1 / patience))
+
+def recorded_calls(path: str, handle_time: float, patience: float,
+                   rng: random.Random) -> Iterator[Call]:
+    """Read arrivals from a CSV trace, sampling missing handle times and patience."""
+    with open(path, newline='') as trace:
+        for count, row in enumerate(csv.DictReader(trace), 1):
+            yield Call(f'call-{count}', float(row['arrival']),
+                       float(row.get('handle_time') or rng.expovariate(1 / handle_time)),
+                       float(row.get('patience') or rng.expovariate(1 / patience)))
+
+class Simulation:
+    """One strategy run over a stream of calls."""
+
+    def __init__(self, strategy: str, agents: int, service_level: int, penalties: int):
+        engine = create_engine('sqlite://')
+        Base.metadata.create_all(engine)
+        self.session = sessionmaker(bind=engine)()
+        self.redis = fakeredis.FakeRedis()
+        self.queries = 0
+        event.listen(engine, 'before_cursor_execute', self._count_query)
+
+        strategy_cache.clear()
+        availability_index.invalidate()
+        precomputed_candidates.clear()
+
+        self.queue = Queue(tenant_uuid=TENANT_UUID, name=f'bench-{strategy}',
+                           strategy=strategy, service_level=service_level)
+        self.session.add(self.queue)
+        self.session.flush()
+
+        self.agents = [Agent(tenant_uuid=TENANT_UUID, name=f'agent-{i}', number=str(1000 + i))
+                       for i in range(agents)]
+        self.session.add_all(self.agents)
+        self.session.flush()
+        self.session.add_all(
+            QueueMember(queue_id=self.queue.id, agent_id=agent.id, penalty=i % penalties)
+            for i, agent in enumerate(self.agents)
+        )
+        self.session.commit()
+
+        self.service = DistributionService(self.session, self.redis)
+        self.leases = AgentLeases(self.redis)
+        self.service_level = service_level
+
+        self.latencies: List[float] = []
+        self.decision_queries: List[int] = []
+        self.handled: Dict[int, int] = {agent.id: 0 for agent in self.agents}
+        self.calls: List[Call] = []
+
+    def _count_query(self, *args) -> None:
+        self.queries += 1
+
+    def run(self, calls: Iterator[Call]) -> Dict:
+        """Process every event and return the run's report."""
+        events: List[Tuple[float, int, str, object]] = []
+        sequence = 0
+        waiting: deque = deque()
+
+        def schedule(at, kind, payload):
+            nonlocal sequence
+            sequence += 1
+            heapq.heappush(events, (at, sequence, kind, payload))
+
+        for call in calls:
+            self.calls.append(call)
+            schedule(call.arrival, ARRIVAL, call)
+
+        started = time.perf_counter()
+        while events:
+            clock, _, kind, payload = heapq.heappop(events)
+
+            if kind == ARRIVAL:
+                if not self._route(payload, clock, schedule):
+                    waiting.append(payload)
+                    schedule(clock + payload.patience, ABANDON, payload)
+
+            elif kind == ABANDON:
+                if payload.answered_at is None:
+                    payload.abandoned = True
+
+            elif kind == CALL_END:
+                agent_id = payload
+                availability_index.set_agent_state(agent_id, paused=False)
+                while waiting:
+                    call = waiting[0]
+                    if call.abandoned:
+                        waiting.popleft()
+                    elif self._route(call, clock, schedule):
+                        waiting.popleft()
+                    else:
+                        break
+
+        return self._report(time.perf_counter() - started)
+
+    def _route(self, call: Call, clock: float, schedule) -> bool:
+        """Ask the distribution service for an agent and connect the call."""
+        queries = self.queries
+        started = time.perf_counter()
+        agents = self.service.get_next_agents(self.queue.id, TENANT_UUID, call.call_id)
+        self.latencies.append(time.perf_counter() - started)
+        self.decision_queries.append(self.queries - queries)
+
+        if not agents:
+            return False
+
+        # Ringall offers a group; the first agent answers
+        agent = agents[0] if isinstance(agents, list) else agents
+        self.leases.release_call(call.call_id)
+
+        call.answered_at = clock
+        self.handled[agent.id] += 1
+        availability_index.set_agent_state(agent.id, paused=True)
+        self.service.update_agent_stats(self.queue.id, TENANT_UUID, agent.id, int(call.handle_time))
+        schedule(clock + call.handle_time, CALL_END, agent.id)
+        return True
+
+    def _report(self, elapsed: float) -> Dict:
+        """Summarize latency, fairness and service-level outcomes."""
+        answered = [c for c in self.calls if c.answered_at is not None]
+        waits = [c.answered_at - c.arrival for c in answered]
+        within_sla = sum(1 for w in waits if w <= self.service_level)
+        latencies = sorted(self.latencies)
+        counts = list(self.handled.values())
+
+        return {
+            'calls': len(self.calls),
+            'decisions': len(latencies),
+            'decisions_per_sec': len(latencies) / elapsed if elapsed else 0,
+            'p50_ms': _percentile(latencies, 50) * 1000,
+            'p99_ms': _percentile(latencies, 99) * 1000,
+            'queries_per_decision': statistics.mean(self.decision_queries) if self.decision_queries else 0,
+            'answered': len(answered),
+            'abandoned': sum(1 for c in self.calls if c.abandoned),
+            'service_level': within_sla / len(self.calls) if self.calls else 0,
+            'average_wait': statistics.mean(waits) if waits else 0,
+            'fairness': _jain_index(counts)
+        }
+
+def _percentile(values: List[float], percentile: float) -> float:
+    """Get a percentile from sorted values."""
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, int(len(values) * percentile / 100))]
+
+def _jain_index(counts: List[int]) -> float:
+    """Jain's fairness index of calls handled per agent (1.0 is perfectly even)."""
+    total = sum(counts)
+    squares = sum(c * c for c in counts)
+    return total * total / (len(counts) * squares) if squares else 1.0
+
+# Report columns: result key, header and value format
+COLUMNS = (
+    ('strategy', 'strategy', '{:<12}'),
+    ('calls', 'calls', '{:>7}'),
+    ('decisions_per_sec', 'dec/s', '{:>8.0f}'),
+    ('p50_ms', 'p50 ms', '{:>8.3f}'),
+    ('p99_ms', 'p99 ms', '{:>8.3f}'),
+    ('queries_per_decision', 'q/dec', '{:>6.2f}'),
+    ('answered', 'answered', '{:>8}'),
+    ('abandoned', 'abandoned', '{:>9}'),
+    ('service_level', 'SL', '{:>7.1%}'),
+    ('average_wait', 'wait s', '{:>7.1f}'),
+    ('fairness', 'fairness', '{:>8.3f}')
+)
+
+def _header(header: str, fmt: str) -> str:
+    """Align a column header with its value format."""
+    align, width = re.match(r'\{:([<>])(\d+)', fmt).groups()
+    return f'{header:{align}{width}}'
+
+def main(argv: Optional[List[str]] = None) -> None:
+    """Run each strategy over the same calls and print a comparison."""
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--strategies', default=','.join(STRATEGY_MAPPING),
+                        help='comma-separated strategies to run')
+    parser.add_argument('--agents', type=int, default=20)
+    parser.add_argument('--penalties', type=int, default=1, help='number of penalty levels')
+    parser.add_argument('--rate', type=float, default=1.0, help='call arrivals per second')
+    parser.add_argument('--duration', type=float, default=1800, help='simulated seconds')
+    parser.add_argument('--handle-time', type=float, default=180, help='mean handle time in seconds')
+    parser.add_argument('--patience', type=float, default=120, help='mean caller patience in seconds')
+    parser.add_argument('--service-level', type=int, default=20, help='SLA threshold in seconds')
+    parser.add_argument('--trace', help='CSV file of recorded arrivals')
+    parser.add_argument('--precompute', action='store_true', help='route from precomputed candidates')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--json', action='store_true', help='print results as JSON')
+    args = parser.parse_args(argv)
+
+    precomputed_candidates.configure(enabled=args.precompute)
+
+    results = []
+    for strategy in args.strategies.split(','):
+        rng = random.Random(args.seed)
+        if args.trace:
+            calls = recorded_calls(args.trace, args.handle_time, args.patience, rng)
+        else:
+            calls = synthetic_calls(args.rate, args.duration, args.handle_time, args.patience, rng)
+
+        simulation = Simulation(strategy, args.agents, args.service_level, args.penalties)
+        results.append(dict(strategy=strategy, **simulation.run(calls)))
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    print(' '.join(_header(header, fmt) for _, header, fmt in COLUMNS))
+    for result in results:
+        print(' '.join(fmt.format(result[key]) for key, _, fmt in COLUMNS))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,318 @@
+"""Load generator for WebSocket event fan-out.
+
+Opens thousands of simulated clients against ``WebSocketHandler``, drives
+events at a fixed rate through ``EventService._publish_event`` and reports
+fan-out latency, handler memory per connection and dropped messages for
+each event transport. Events go through a fake Redis shared by the
+publisher and the handler unless ``--redis-url`` points at a real server,
+where the benchmark uses database ``--redis-db`` and deletes the stream
+entries and consumer group it created when it is done.
+
+Usage (from plugins/call-distribution)::
+
+    python -m benchmarks.websocket --clients 5000 --queues 50 --rate 200 --duration 10
+    python -m benchmarks.websocket --transports pubsub --slow-clients 0.1 --policy coalesce
+
+Clients are spread evenly over the queues and each event goes to one queue,
+so every event is delivered to about ``clients / queues`` connections.
+Latency runs from the publishing pipeline's execution to the moment a
+client's ``send`` is called by its writer task. Deliveries that neither
+arrived nor were counted as dropped are reported as missing; they are the
+events a client closed as too slow no longer receives.
+"""
+
+import argparse
+import asyncio
+import itertools
+import json
+import logging
+import random
+import re
+import time
+import tracemalloc
+from datetime import datetime
+from typing import Dict, List, Optional
+
+import fakeredis
+import fakeredis.aioredis
+import redis
+import redis.asyncio as aioredis
+
+from wazo_call_distributor.models import Event
+from wazo_call_distributor.services.event import EventService
+from wazo_call_distributor.streams import EVENTS_STREAM, TRANSPORTS, event_publisher, stream_key, websocket_group
+from wazo_call_distributor.websocket import WebSocketHandler, DEFAULT_SEND_QUEUE_SIZE, SLOW_CONSUMER_POLICIES
+
+TENANT_UUID = 'benchmark'
+NODE_ID = 'benchmark'
+
+class SimulatedClient:
+    """Stand-in for a server-side connection that records delivery latency.
+
+    A slow client takes ``delay`` seconds to accept each message.
+    """
+
+    def __init__(self, published: Dict[int, float], delay: float = 0.0):
+        self.published = published
+        self.delay = delay
+        self.latencies: List[float] = []
+        self.received = 0
+        self.close_code: Optional[int] = None
+        self._closed = asyncio.Event()
+
+    async def send(self, message: str):
+        """Record the latency of a delivered event."""
+        if self.delay:
+            await asyncio.sleep(self.delay)
+        event_id = json.loads(message)['data']['id']
+        self.latencies.append(time.perf_counter() - self.published[event_id])
+        self.received += 1
+
+    async def close(self, code: int = 1000, reason: str = ''):
+        """Close the connection from the server side."""
+        self.close_code = code
+        self._closed.set()
+
+    async def wait_closed(self):
+        """Wait until the connection is closed."""
+        await self._closed.wait()
+
+class LoadTest:
+    """One run of a transport against a fresh handler and Redis."""
+
+    def __init__(self, transport: str, args: argparse.Namespace):
+        self.transport = transport
+        self.args = args
+        self.published: Dict[int, float] = {}
+        self.expected = 0
+        self.server = None
+        # Stream entry IDs of the published events, by queue
+        self.entries: Dict[int, List[bytes]] = {}
+
+        if args.redis_url:
+            self.redis = redis.Redis.from_url(args.redis_url, db=args.redis_db)
+            async_redis = aioredis.from_url(args.redis_url, db=args.redis_db)
+            self.created_stream = not self.redis.exists(EVENTS_STREAM)
+        else:
+            self.server = fakeredis.FakeServer()
+            self.redis = fakeredis.FakeRedis(server=self.server)
+            async_redis = fakeredis.aioredis.FakeRedis(server=self.server)
+
+        self.handler = WebSocketHandler(args.redis_url or 'redis://benchmark', node_id=NODE_ID,
+                                        block=100, send_queue_size=args.queue_size,
+                                        slow_consumer_policy=args.policy)
+        self.handler._redis = async_redis
+        self.service = EventService(None, self.redis)
+
+    async def run(self) -> Dict:
+        """Connect the clients, publish the events and collect the results."""
+        event_publisher.configure(transport=self.transport)
+        rng = random.Random(self.args.seed)
+
+        clients = [
+            SimulatedClient(self.published, self.args.slow_delay if rng.random() < self.args.slow_clients else 0.0)
+            for _ in range(self.args.clients)
+        ]
+        bytes_per_connection = await self._connect(clients)
+
+        delivery = asyncio.ensure_future(self.handler.run())
+        # Let a streams consumer create its group before the first event
+        await asyncio.sleep(0.1)
+
+        started = time.perf_counter()
+        await self._publish(rng)
+        elapsed = time.perf_counter() - started
+        await self._drain(clients)
+
+        disconnected = sum(1 for client in clients if client.close_code is not None)
+        await self._stop(delivery)
+        self._cleanup()
+        for client in clients:
+            await client.close()
+        await asyncio.sleep(0)
+
+        latencies = sorted(itertools.chain.from_iterable(client.latencies for client in clients))
+        dropped = sum(sender.dropped for sender in self.handler.senders.values()) + self.handler.dropped_messages
+        return {
+            'transport': self.transport,
+            'clients': len(clients),
+            'events': len(self.published),
+            'events_per_sec': len(self.published) / elapsed if elapsed else 0,
+            'deliveries': len(latencies),
+            'p50_ms': _percentile(latencies, 50) * 1000,
+            'p99_ms': _percentile(latencies, 99) * 1000,
+            'max_ms': latencies[-1] * 1000 if latencies else 0,
+            'bytes_per_connection': bytes_per_connection,
+            'dropped': dropped,
+            'missing': self.expected - len(latencies) - dropped,
+            'disconnected': disconnected
+        }
+
+    async def _stop(self, delivery: asyncio.Task) -> None:
+        """Stop the handler's event loop and close its Redis client."""
+        logger = logging.getLogger('wazo_call_distributor.websocket')
+        level = logger.level
+        if self.server is not None:
+            # A fake Redis read cannot be cancelled mid-command, so take the
+            # server down first and let the handler back off from the error
+            logger.setLevel(logging.CRITICAL)
+            self.server.connected = False
+            await asyncio.sleep(0.1)
+        delivery.cancel()
+        await asyncio.gather(delivery, return_exceptions=True)
+        logger.setLevel(level)
+        await self.handler._redis.aclose()
+
+    def _cleanup(self) -> None:
+        """Delete the stream entries and consumer group the run created, leaving other keys alone."""
+        if self.server is not None:
+            return
+        pipe = self.redis.pipeline(transaction=False)
+        pipe.xgroup_destroy(EVENTS_STREAM, websocket_group(NODE_ID))
+        for queue_id, entry_ids in self.entries.items():
+            for start in range(0, len(entry_ids), 1000):
+                chunk = entry_ids[start:start + 1000]
+                pipe.xdel(EVENTS_STREAM, *chunk)
+                pipe.xdel(stream_key('queue', queue_id), *chunk)
+        # The tenant stream only holds benchmark events
+        pipe.delete(stream_key('tenant', TENANT_UUID))
+        pipe.execute(raise_on_error=False)
+
+        # Drop the streams the run created and left empty
+        keys = [stream_key('queue', queue_id) for queue_id in self.entries]
+        if self.created_stream:
+            keys.append(EVENTS_STREAM)
+        pipe = self.redis.pipeline(transaction=False)
+        for key in keys:
+            pipe.xlen(key)
+        empty = [key for key, length in zip(keys, pipe.execute()) if not length]
+        if empty:
+            self.redis.delete(*empty)
+    async def _connect(self, clients: List[SimulatedClient]) -> float:
+        """Subscribe every client to a queue and measure what the handler allocates for each."""
+        tracemalloc.start()
+        before = tracemalloc.take_snapshot()
+        for index, client in enumerate(clients):
+            asyncio.ensure_future(self.handler.subscribe_queue(client, index % self.args.queues + 1))
+        # Let every subscription register and start its writer task
+        await asyncio.sleep(0)
+        await asyncio.sleep(0)
+        after = tracemalloc.take_snapshot()
+        tracemalloc.stop()
+
+        # Leave out the first snapshot, which is alive while the second is taken
+        ignored = [tracemalloc.Filter(False, tracemalloc.__file__)]
+        allocated = sum(stat.size_diff for stat in
+                        after.filter_traces(ignored).compare_to(before.filter_traces(ignored), 'filename'))
+        return allocated / len(clients) if clients else 0.0
+
+    async def _publish(self, rng: random.Random) -> None:
+        """Publish events at the configured rate, a pipeline per tick."""
+        total = int(self.args.rate * self.args.duration)
+        audience = {}
+        for index in range(self.args.clients):
+            queue_id = index % self.args.queues + 1
+            audience[queue_id] = audience.get(queue_id, 0) + 1
+
+        started = time.perf_counter()
+        event_id = 0
+        while event_id < total:
+            due = min(total, int((time.perf_counter() - started) * self.args.rate) + 1)
+            pipe = self.redis.pipeline(transaction=False)
+            batch = []
+            queue_ids = []
+            while event_id < due:
+                event_id += 1
+                queue_id = rng.randint(1, self.args.queues)
+                event = Event(id=event_id, tenant_uuid=TENANT_UUID, timestamp=datetime.utcnow(),
+                              event_type='call', event_name='call_entered', queue_id=queue_id,
+                              call_id=f'call-{event_id}', data={})
+                self.service._publish_event(event, pipe)
+                batch.append(event_id)
+                queue_ids.append(queue_id)
+                self.expected += audience.get(queue_id, 0)
+
+            results = pipe.execute()
+            now = time.perf_counter()
+            # pubsub events are only added to the global stream, after their PUBLISH
+            entry_ids = results[1::2] if self.transport == 'pubsub' else results
+            for queue_id, entry_id in zip(queue_ids, entry_ids):
+                self.entries.setdefault(queue_id, []).append(entry_id)
+            for published_id in batch:
+                self.published[published_id] = now
+            await asyncio.sleep(0.01)
+
+    async def _drain(self, clients: List[SimulatedClient]) -> None:
+        """Wait until every event is delivered or dropped, or the drain timeout passes."""
+        deadline = time.perf_counter() + self.args.drain
+        while time.perf_counter() < deadline:
+            delivered = sum(client.received for client in clients)
+            dropped = sum(sender.dropped for sender in self.handler.senders.values()) + self.handler.dropped_messages
+            if delivered + dropped >= self.expected:
+                return
+            await asyncio.sleep(0.05)
+
+def _percentile(values: List[float], percentile: float) -> float:
+    """Get a percentile from sorted values."""
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, int(len(values) * percentile / 100))]
+
+# Report columns: result key, header and value format
+COLUMNS = (
+    ('transport', 'transport', '{:<10}'),
+    ('clients', 'clients', '{:>7}'),
+    ('events', 'events', '{:>7}'),
+    ('events_per_sec', 'ev/s', '{:>7.0f}'),
+    ('deliveries', 'delivered', '{:>9}'),
+    ('p50_ms', 'p50 ms', '{:>8.2f}'),
+    ('p99_ms', 'p99 ms', '{:>8.2f}'),
+    ('max_ms', 'max ms', '{:>8.2f}'),
+    ('bytes_per_connection', 'B/conn', '{:>7.0f}'),
+    ('dropped', 'dropped', '{:>7}'),
+    ('missing', 'missing', '{:>7}'),
+    ('disconnected', 'closed', '{:>6}')
+)
+
+def _header(header: str, fmt: str) -> str:
+    """Align a column header with its value format."""
+    align, width = re.match(r'\{:([<>])(\d+)', fmt).groups()
+    return f'{header:{align}{width}}'
+
+def main(argv: Optional[List[str]] = None) -> None:
+    """Run each transport with the same clients and load and print a comparison."""
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--transports', default=','.join(TRANSPORTS),
+                        help='comma-separated event transports to run')
+    parser.add_argument('--clients', type=int, default=2000)
+    parser.add_argument('--queues', type=int, default=20, help='queues the clients are spread over')
+    parser.add_argument('--rate', type=float, default=100, help='events published per second')
+    parser.add_argument('--duration', type=float, default=5, help='seconds of publishing')
+    parser.add_argument('--drain', type=float, default=10, help='seconds to wait for deliveries to finish')
+    parser.add_argument('--queue-size', type=int, default=DEFAULT_SEND_QUEUE_SIZE,
+                        help='messages buffered per client')
+    parser.add_argument('--policy', choices=SLOW_CONSUMER_POLICIES, default='drop_oldest',
+                        help='slow consumer policy')
+    parser.add_argument('--slow-clients', type=float, default=0.0, help='share of slow clients')
+    parser.add_argument('--slow-delay', type=float, default=0.05, help='seconds a slow client takes per message')
+    parser.add_argument('--redis-url', help='use a real Redis server')
+    parser.add_argument('--redis-db', type=int, default=15,
+                        help='database used on the --redis-url server unless the URL names one')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--json', action='store_true', help='print results as JSON')
+    args = parser.parse_args(argv)
+
+    results = []
+    for transport in args.transports.split(','):
+        results.append(asyncio.run(LoadTest(transport, args).run()))
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    print(' '.join(_header(header, fmt) for _, header, fmt in COLUMNS))
+    for result in results:
+        print(' '.join(fmt.format(result[key]) for key, _, fmt in COLUMNS))
+
+if __name__ == '__main__':
+    main()
@@ -1,21 +1,58 @@
 """Distribution API endpoints."""
 
 from flask import request, jsonify, Blueprint
-from marshmallow import Schema, fields
+from marshmallow import Schema, fields, validate
 from ..services.distribution import DistributionService
+from ..redis_client import get_redis_client
 from ..auth import require_token, get_token_tenant_uuid
-from ..exceptions import QueueNotFound, InvalidQueueStrategy
+from ..exceptions import QueueNotFound, InvalidQueueStrategy, CallerBlacklisted, CallerOutranked
 
 bp = Blueprint('distribution', __name__)
 
 class CallSchema(Schema):
     """Schema for call information."""
     call_id = fields.Str(required=True)
+    caller_id = fields.Str()
+
+class BatchCallSchema(Schema):
+    """Schema for a waiting call in a batch routing request."""
+    call_id = fields.Str(required=True)
+    queue_id = fields.Int(required=True)
+    caller_id = fields.Str()
+    priority = fields.Int()
+
+class BatchSchema(Schema):
+    """Schema for a batch routing request."""
+    calls = fields.List(fields.Nested(BatchCallSchema), required=True,
+                        validate=validate.Length(min=1, max=1000))
+
+class WaitingCallSchema(Schema):
+    """Schema for a caller joining a queue."""
+    call_id = fields.Str(required=True)
+    caller_id = fields.Str()
+    priority = fields.Int()
 
 class StatsSchema(Schema):
     """Schema for call statistics."""
     call_duration = fields.Int(required=True, validate=lambda n: n >= 0)
 
+def get_distribution_service():
+    """Get or create a distribution service."""
+    redis_client = get_redis_client()
+    return DistributionService(request.db_session, redis_client)
+
+def serialize_assignments(assignments):
+    """Convert call-to-agent assignments to JSON-ready dictionaries."""
+    return [{
+        'call_id': assignment['call_id'],
+        'queue_id': assignment['queue_id'],
+        'agents': [{
+            'id': agent.id,
+            'name': agent.name,
+            'number': agent.number
+        } for agent in assignment['agents']]
+    } for assignment in assignments]
+
 @bp.route('/queues/<int:queue_id>/next', methods=['POST'])
 @require_token
 def get_next_agents(queue_id):
@@ -28,10 +65,10 @@ def get_next_agents(queue_id):
         return {'message': 'Validation error', 'errors': errors}, 400
     
     data = schema.load(request.get_json())
-    service = DistributionService(request.db_session)
+    service = get_distribution_service()
     
     try:
-        agents = service.get_next_agents(queue_id, tenant_uuid, data['call_id'])
+        agents = service.get_next_agents(queue_id, tenant_uuid, data['call_id'], data.get('caller_id'))
         if not agents:
             return {'message': 'No available agents'}, 404
         
@@ -50,6 +87,84 @@ def get_next_agents(queue_id):
             })
     except QueueNotFound:
         return {'message': f'Queue {queue_id} not found'}, 404
+    except CallerOutranked as e:
+        return {'message': str(e)}, 409
+    except InvalidQueueStrategy as e:
+        return {'message': str(e)}, 400
+
+@bp.route('/queues/next', methods=['POST'])
+@require_token
+def route_calls():
+    """Assign agents to a batch of waiting calls across one or more queues."""
+    tenant_uuid = get_token_tenant_uuid()
+    
+    schema = BatchSchema()
+    errors = schema.validate(request.get_json())
+    if errors:
+        return {'message': 'Validation error', 'errors': errors}, 400
+    
+    data = schema.load(request.get_json())
+    service = get_distribution_service()
+    
+    assignments, unassigned = service.route_calls(tenant_uuid, data['calls'])
+    return jsonify({
+        'assignments': serialize_assignments(assignments),
+        'unassigned': unassigned
+    })
+
+@bp.route('/queues/<int:queue_id>/calls', methods=['POST'])
+@require_token
+def enqueue_call(queue_id):
+    """Add a caller to a queue's waiting list."""
+    tenant_uuid = get_token_tenant_uuid()
+    
+    schema = WaitingCallSchema()
+    errors = schema.validate(request.get_json())
+    if errors:
+        return {'message': 'Validation error', 'errors': errors}, 400
+    
+    data = schema.load(request.get_json())
+    service = get_distribution_service()
+    
+    try:
+        waiting_call = service.enqueue_call(queue_id, tenant_uuid, data['call_id'],
+                                            data.get('caller_id'), data.get('priority', 0))
+        return jsonify(waiting_call), 201
+    except QueueNotFound:
+        return {'message': f'Queue {queue_id} not found'}, 404
+    except CallerBlacklisted as e:
+        return {'message': str(e)}, 403
+    except InvalidQueueStrategy as e:
+        return {'message': str(e)}, 400
+
+@bp.route('/queues/<int:queue_id>/calls/<string:call_id>', methods=['DELETE'])
+@require_token
+def remove_call(queue_id, call_id):
+    """Remove a caller from a queue's waiting list."""
+    tenant_uuid = get_token_tenant_uuid()
+    service = get_distribution_service()
+    
+    try:
+        if not service.remove_call(queue_id, tenant_uuid, call_id):
+            return {'message': 'Call not found in queue'}, 404
+        return '', 204
+    except QueueNotFound:
+        return {'message': f'Queue {queue_id} not found'}, 404
+    except InvalidQueueStrategy as e:
+        return {'message': str(e)}, 400
+
+@bp.route('/queues/<int:queue_id>/dispatch', methods=['POST'])
+@require_token
+def dispatch_waiting(queue_id):
+    """Assign available agents to waiting callers in priority order."""
+    tenant_uuid = get_token_tenant_uuid()
+    service = get_distribution_service()
+    
+    try:
+        assignments = service.dispatch_waiting(queue_id, tenant_uuid)
+        return jsonify(serialize_assignments(assignments))
+    except QueueNotFound:
+        return {'message': f'Queue {queue_id} not found'}, 404
     except InvalidQueueStrategy as e:
         return {'message': str(e)}, 400
 
@@ -58,10 +173,10 @@ def get_next_agents(queue_id):
 def get_agent_stats(queue_id, agent_id):
     """Get agent statistics for a queue."""
     tenant_uuid = get_token_tenant_uuid()
-    service = DistributionService(request.db_session)
+    service = get_distribution_service()
     
     try:
-        stats = service.get_agent_stats(queue_id, agent_id)
+        stats = service.get_agent_stats(queue_id, tenant_uuid, agent_id)
         return jsonify(stats)
     except QueueNotFound:
         return {'message': f'Queue {queue_id} not found'}, 404
@@ -80,10 +195,10 @@ def update_agent_stats(queue_id, agent_id):
         return {'message': 'Validation error', 'errors': errors}, 400
     
     data = schema.load(request.get_json())
-    service = DistributionService(request.db_session)
+    service = get_distribution_service()
     
     try:
-        service.update_agent_stats(queue_id, agent_id, data['call_duration'])
+        service.update_agent_stats(queue_id, tenant_uuid, agent_id, data['call_duration'])
         return '', 204
     except QueueNotFound:
         return {'message': f'Queue {queue_id} not found'}, 404
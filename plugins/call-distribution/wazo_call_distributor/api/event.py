@@ -1,15 +1,20 @@
 """Event API endpoints."""
 
+import json
 from datetime import datetime
-from flask import request, jsonify, Blueprint, current_app
+from flask import request, jsonify, Blueprint
 from marshmallow import Schema, fields, validate
-import redis
 from ..services.event import EventService
+from ..ingest import event_ingestor
+from ..redis_client import get_redis_client
 from ..auth import get_token_tenant_uuid, require_token
-from ..exceptions import QueueNotFound, AgentNotFound
+from ..exceptions import QueueNotFound, AgentNotFound, ServiceUnavailable
 
 bp = Blueprint('events', __name__)
 
+MAX_BATCH_EVENTS = 1000
+NDJSON_MIMETYPES = ('application/x-ndjson', 'application/jsonl')
+
 class EventSchema(Schema):
     """Schema for event validation."""
     event_type = fields.Str(required=True, validate=validate.OneOf(['call', 'agent', 'queue', 'system']))
@@ -29,9 +34,28 @@ time_range_schema = TimeRangeSchema()
 
 def get_event_service():
     """Get or create an event service."""
-    redis_client = redis.from_url(current_app.config['call_distributor']['redis_url'])
+    redis_client = get_redis_client()
     return EventService(request.db_session, redis_client)
 
+def parse_event_batch():
+    """Get the events of a batch request body, either a JSON array or NDJSON.
+    
+    Undecodable NDJSON lines are kept as None so they get their own result.
+    """
+    if request.mimetype in NDJSON_MIMETYPES:
+        events = []
+        for line in request.get_data(as_text=True).splitlines():
+            if not line.strip():
+                continue
+            try:
+                events.append(json.loads(line))
+            except ValueError:
+                events.append(None)
+        return events
+    
+    events = request.get_json(silent=True)
+    return events if isinstance(events, list) else None
+
 @bp.route('/events', methods=['POST'])
 @require_token
 def record_event():
@@ -43,6 +67,19 @@ def record_event():
     if errors:
         return {'message': 'Validation error', 'errors': errors}, 400
     
+    # With buffering enabled, events are recorded asynchronously in batches
+    if event_ingestor.running:
+        try:
+            event_ingestor.submit(
+                tenant_uuid,
+                data['event_type'],
+                data['event_name'],
+                data.get('data', {})
+            )
+        except ServiceUnavailable as e:
+            return {'message': str(e)}, 503
+        return {'status': 'accepted'}, 202
+    
     service = get_event_service()
     event = service.record_event(
         tenant_uuid,
@@ -53,6 +90,63 @@ def record_event():
     
     return jsonify(event.to_dict), 201
 
+@bp.route('/events/batch', methods=['POST'])
+@require_token
+def record_events():
+    """Record a batch of events sent as a JSON array or as NDJSON."""
+    tenant_uuid = get_token_tenant_uuid()
+    events = parse_event_batch()
+    
+    if events is None:
+        return {'message': 'Expected a JSON array or NDJSON body'}, 400
+    if not events:
+        return {'message': 'No events in batch'}, 400
+    if len(events) > MAX_BATCH_EVENTS:
+        return {'message': f'At most {MAX_BATCH_EVENTS} events per batch'}, 400
+    
+    # Validate everything first; invalid items are reported without failing the batch
+    results = []
+    valid = []
+    for index, data in enumerate(events):
+        if not isinstance(data, dict):
+            results.append({'index': index, 'status': 'invalid', 'errors': {'_schema': ['Invalid event']}})
+            continue
+        errors = event_schema.validate(data)
+        if errors:
+            results.append({'index': index, 'status': 'invalid', 'errors': errors})
+            continue
+        result = {'index': index}
+        results.append(result)
+        valid.append((result, (tenant_uuid, data['event_type'], data['event_name'], data.get('data', {}))))
+    
+    if event_ingestor.running:
+        # One deadline for the whole batch, so a full buffer delays the
+        # request by at most the submit timeout
+        accepted = event_ingestor.submit_many([item for _, item in valid])
+        for position, (result, _) in enumerate(valid):
+            if position < accepted:
+                result['status'] = 'accepted'
+            else:
+                result.update(status='unavailable',
+                              errors={'_schema': [str(ServiceUnavailable('event ingestion'))]})
+        status_code = 202
+    else:
+        recorded = get_event_service().record_events([item for _, item in valid]) if valid else []
+        for (result, _), event in zip(valid, recorded):
+            result.update(status='created', id=event.id)
+        status_code = 201
+    
+    failed = sum(1 for result in results if result['status'] not in ('created', 'accepted'))
+    if failed:
+        status_code = 207
+    
+    return jsonify({
+        'total': len(results),
+        'succeeded': len(results) - failed,
+        'failed': failed,
+        'results': results
+    }), status_code
+
 @bp.route('/queues/<int:queue_id>/metrics', methods=['GET'])
 @require_token
 def get_queue_metrics(queue_id):
@@ -3,6 +3,7 @@
 from flask import request, jsonify, Blueprint
 from marshmallow import Schema, fields, validate
 from ..services.media import MediaService
+from ..redis_client import get_redis_client
 from ..auth import get_token_tenant_uuid, require_token
 from ..exceptions import QueueNotFound
 
@@ -153,7 +154,7 @@ def delete_moh(moh_id):
 def get_queue_position(queue_id, call_id):
     """Get position in queue for a call."""
     tenant_uuid = get_token_tenant_uuid()
-    service = MediaService(request.db_session)
+    service = MediaService(request.db_session, get_redis_client())
     
     try:
         position = service.get_queue_position(queue_id, call_id)
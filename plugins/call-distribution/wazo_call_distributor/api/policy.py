@@ -3,8 +3,9 @@
 from flask import request, jsonify, Blueprint
 from marshmallow import Schema, fields, validate
 from ..services.policy import PolicyService
+from ..redis_client import get_redis_client
 from ..auth import get_token_tenant_uuid, require_token
-from ..exceptions import QueueNotFound
+from ..exceptions import QueueNotFound, AgentNotFound, InvalidConfiguration
 
 bp = Blueprint('policies', __name__)
 
@@ -86,19 +87,23 @@ def set_sticky_agent(queue_id):
     if errors:
         return {'message': 'Validation error', 'errors': errors}, 400
     
-    service = PolicyService(request.db_session)
+    service = PolicyService(request.db_session, get_redis_client())
     try:
         service.set_sticky_agent(queue_id, tenant_uuid, data['caller_id'], data['agent_id'])
         return '', 204
     except QueueNotFound:
         return {'message': f'Queue {queue_id} not found'}, 404
+    except AgentNotFound:
+        return {'message': f'Agent {data["agent_id"]} not found'}, 404
+    except InvalidConfiguration as e:
+        return {'message': str(e)}, 400
 
 @bp.route('/queues/<int:queue_id>/sticky-agent/<string:caller_id>', methods=['GET'])
 @require_token
 def get_sticky_agent(queue_id, caller_id):
     """Get sticky agent for a caller."""
     tenant_uuid = get_token_tenant_uuid()
-    service = PolicyService(request.db_session)
+    service = PolicyService(request.db_session, get_redis_client())
     
     try:
         agent = service.get_sticky_agent(queue_id, tenant_uuid, caller_id)
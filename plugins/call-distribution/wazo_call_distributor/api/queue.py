@@ -3,6 +3,7 @@
 from flask import request, jsonify, Blueprint
 from marshmallow import Schema, fields, validate
 from ..services.queue import QueueService
+from ..redis_client import get_redis_client
 from ..auth import get_token_tenant_uuid, require_token
 from ..exceptions import QueueNotFound, InvalidQueueStrategy
 
@@ -18,6 +19,7 @@ class QueueSchema(Schema):
     max_wait = fields.Int(validate=validate.Range(min=0))
     service_level = fields.Int(validate=validate.Range(min=0))
     weight = fields.Int(validate=validate.Range(min=0))
+    sticky_agent_ttl = fields.Int(validate=validate.Range(min=0))
     max_callers = fields.Int(validate=validate.Range(min=0))
     max_members = fields.Int(validate=validate.Range(min=0))
     announce_position = fields.Bool()
@@ -80,7 +82,7 @@ def update_queue(queue_id):
     if errors:
         return {'message': 'Validation error', 'errors': errors}, 400
     
-    service = QueueService(request.db_session)
+    service = QueueService(request.db_session, get_redis_client())
     try:
         queue = service.update(queue_id, tenant_uuid, data)
         return jsonify(queue.to_dict)
@@ -94,7 +96,7 @@ def update_queue(queue_id):
 def delete_queue(queue_id):
     """Delete a queue."""
     tenant_uuid = get_token_tenant_uuid()
-    service = QueueService(request.db_session)
+    service = QueueService(request.db_session, get_redis_client())
     try:
         service.delete(queue_id, tenant_uuid)
         return '', 204
@@ -106,7 +108,7 @@ def delete_queue(queue_id):
 def get_queue_stats(queue_id):
     """Get real-time statistics for a queue."""
     tenant_uuid = get_token_tenant_uuid()
-    service = QueueService(request.db_session)
+    service = QueueService(request.db_session, get_redis_client())
     try:
         stats = service.get_queue_stats(queue_id, tenant_uuid)
         return jsonify(stats)
@@ -129,7 +131,7 @@ def update_queue_overflow(queue_id):
     if errors:
         return {'message': 'Validation error', 'errors': errors}, 400
     
-    service = QueueService(request.db_session)
+    service = QueueService(request.db_session, get_redis_client())
     try:
         queue = service.update_overflow_settings(
             queue_id,
@@ -0,0 +1,291 @@
+"""In-memory availability index for queue distribution."""
+
+import itertools
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Set, Tuple
+from sqlalchemy.orm import joinedload
+from .models import QueueMember
+
+DEFAULT_REFRESH_INTERVAL = 30  # seconds before a queue is reloaded from the database
+
+_generations = itertools.count(1)
+
+class IndexedAgent:
+    """Snapshot of the agent fields needed to route a call."""
+
+    __slots__ = ('id', 'tenant_uuid', 'name', 'number')
+
+    def __init__(self, agent):
+        self.id = agent.id
+        self.tenant_uuid = agent.tenant_uuid
+        self.name = agent.name
+        self.number = agent.number
+
+    def __repr__(self):
+        return f'<IndexedAgent(name={self.name}, number={self.number})>'
+
+class IndexedMember:
+    """Snapshot of a queue member as seen by the availability index."""
+
+    __slots__ = ('id', 'queue_id', 'agent_id', 'penalty', 'is_available', 'paused', 'agent')
+
+    def __init__(self, member: QueueMember):
+        self.id = member.id
+        self.queue_id = member.queue_id
+        self.agent_id = member.agent_id
+        self.penalty = member.penalty or 0
+        self.is_available = bool(member.is_available)
+        self.paused = bool(member.paused)
+        self.agent = IndexedAgent(member.agent)
+
+    def __repr__(self):
+        return f'<IndexedMember(queue_id={self.queue_id}, agent_id={self.agent_id})>'
+
+class _QueueIndex:
+    """Members of a single queue, with available members bucketed by penalty."""
+
+    __slots__ = ('members', 'by_agent', 'buckets', 'penalties', 'loaded_at', 'generation')
+
+    def __init__(self):
+        self.members: Dict[int, IndexedMember] = {}
+        self.by_agent: Dict[int, IndexedMember] = {}
+        self.buckets: Dict[int, List[IndexedMember]] = {}
+        self.penalties: List[int] = []
+        self.loaded_at = time.monotonic()
+        self.generation = next(_generations)
+
+class AvailabilityIndex:
+    """Process-local index of available queue members.
+
+    Queues are loaded lazily from the database on first use and reloaded
+    every ``refresh_interval`` seconds. Agent login and pause events are
+    applied in place and stored at ``agent_availability:{agent_id}``, which
+    every worker applies when it loads a queue; queue-member events
+    invalidate the queue so the next routing decision reloads it. Other
+    workers learn of both through the queue versions in ``versions.py``.
+
+    Bucket lists are replaced rather than mutated, so readers never need to
+    take the lock and must treat the returned lists as read-only.
+
+    Listeners are called with a queue id and an agent id when that agent's
+    availability changes, and with a queue id and ``None`` after the queue
+    is loaded.
+    """
+
+    def __init__(self, refresh_interval: int = DEFAULT_REFRESH_INTERVAL):
+        self.refresh_interval = refresh_interval
+        self._lock = threading.Lock()
+        self._queues: Dict[int, _QueueIndex] = {}
+        self._agent_members: Dict[int, Set[Tuple[int, int]]] = {}
+        self._agent_state: Dict[int, Dict[str, bool]] = {}
+        self._listeners: List[Callable[[int, Optional[int]], None]] = []
+        self._redis = None
+
+    def configure(self, refresh_interval: Optional[int] = None, redis_client=None) -> None:
+        """Apply plugin configuration; ``redis_client`` shares agent states between workers."""
+        if refresh_interval is not None:
+            self.refresh_interval = refresh_interval
+        if redis_client is not None:
+            self._redis = redis_client
+
+    @staticmethod
+    def agent_state_key(agent_id: int) -> str:
+        """Get the Redis key of an agent's login and pause state."""
+        return f"agent_availability:{agent_id}"
+
+    def store_agent_state(self, agent_id: int, pipe, logged_in: Optional[bool] = None,
+                          paused: Optional[bool] = None) -> None:
+        """Queue the write of an agent login or pause change on a pipeline."""
+        changes = {name: int(value) for name, value in (('logged_in', logged_in), ('paused', paused))
+                   if value is not None}
+        if changes:
+            pipe.hset(self.agent_state_key(agent_id), mapping=changes)
+
+    def add_listener(self, callback: Callable[[int, Optional[int]], None]) -> None:
+        """Register a callback run with the queue and agent ids whenever availability changes."""
+        self._listeners.append(callback)
+
+    def ensure_loaded(self, queue_id: int, session) -> None:
+        """Load or refresh a queue so later reads can be served without a session."""
+        self._get_queue(queue_id, session)
+
+    def get_available(self, queue_id: int, session=None) -> List[IndexedMember]:
+        """Get all available members of a queue, ordered by penalty then join order."""
+        index = self._get_queue(queue_id, session)
+        members = []
+        for penalty in index.penalties:
+            members.extend(index.buckets[penalty])
+        return members
+
+    def get_candidates(self, queue_id: int, session=None,
+                       exclude: Optional[Set[int]] = None) -> List[IndexedMember]:
+        """Get the available members of the lowest penalty level, in join order.
+
+        Agents in ``exclude`` are treated as unavailable, so once every agent
+        of a penalty level is excluded the next level is returned.
+        """
+        index = self._get_queue(queue_id, session)
+        for penalty in index.penalties:
+            bucket = index.buckets[penalty]
+            if exclude:
+                bucket = [m for m in bucket if m.agent_id not in exclude]
+            if bucket:
+                return bucket
+        return []
+
+    def get_members(self, queue_id: int, session=None) -> List[IndexedMember]:
+        """Get every member of a queue, available or not."""
+        return list(self._get_queue(queue_id, session).members.values())
+
+    def get_member(self, queue_id: int, agent_id: int, session=None) -> Optional[IndexedMember]:
+        """Get the indexed membership of an agent in a queue."""
+        index = self._queues.get(queue_id)
+        if index is None and session is None:
+            return None
+        return self._get_queue(queue_id, session).by_agent.get(agent_id)
+
+    def is_available(self, queue_id: int, agent_id: int) -> bool:
+        """Check whether an agent is an available member of an indexed queue."""
+        member = self.get_member(queue_id, agent_id)
+        return member is not None and self._is_available(member)
+
+    def get_generation(self, queue_id: int) -> Optional[int]:
+        """Get a number that changes every time a queue is (re)loaded."""
+        index = self._queues.get(queue_id)
+        return index.generation if index else None
+
+    def set_agent_state(self, agent_id: int, logged_in: Optional[bool] = None,
+                        paused: Optional[bool] = None) -> None:
+        """Apply an agent login or pause change to every queue the agent belongs to."""
+        with self._lock:
+            state = self._agent_state.setdefault(agent_id, {})
+            if logged_in is not None:
+                state['logged_in'] = logged_in
+            if paused is not None:
+                state['paused'] = paused
+
+            touched = set()
+            for queue_id, member_id in self._agent_members.get(agent_id, ()):
+                index = self._queues.get(queue_id)
+                member = index.members.get(member_id) if index else None
+                if member:
+                    touched.add((queue_id, member.penalty))
+
+            for queue_id, penalty in touched:
+                self._rebuild_bucket(self._queues[queue_id], penalty)
+
+        self._notify({queue_id for queue_id, _ in touched}, agent_id)
+
+    def invalidate(self, queue_id: Optional[int] = None) -> None:
+        """Drop a queue (or every queue) so it is reloaded on next use."""
+        with self._lock:
+            if queue_id is None:
+                self._queues.clear()
+                self._agent_members.clear()
+                return
+
+            index = self._queues.pop(queue_id, None)
+            if index:
+                self._unlink_members(queue_id, index)
+
+    def _get_queue(self, queue_id: int, session) -> _QueueIndex:
+        """Get the index for a queue, loading it if missing or stale."""
+        index = self._queues.get(queue_id)
+        if index is not None and time.monotonic() - index.loaded_at < self.refresh_interval:
+            return index
+
+        if session is None:
+            if index is not None:
+                return index
+            raise ValueError(f"Queue {queue_id} is not indexed and no session was provided")
+
+        return self._load(queue_id, session)
+
+    def _load(self, queue_id: int, session) -> _QueueIndex:
+        """Load all members of a queue from the database."""
+        members = session.query(QueueMember).options(
+            joinedload(QueueMember.agent)
+        ).filter(
+            QueueMember.queue_id == queue_id
+        ).all()
+
+        index = _QueueIndex()
+        for member in members:
+            indexed = IndexedMember(member)
+            index.members[indexed.id] = indexed
+            index.by_agent[indexed.agent_id] = indexed
+        states = self._read_agent_states(list(index.by_agent))
+
+        with self._lock:
+            # Other workers may have taken in the agents' latest events
+            self._agent_state.update(states)
+
+            previous = self._queues.get(queue_id)
+            if previous:
+                self._unlink_members(queue_id, previous)
+
+            for member in index.members.values():
+                self._agent_members.setdefault(member.agent_id, set()).add((queue_id, member.id))
+
+            for penalty in {m.penalty for m in index.members.values()}:
+                self._rebuild_bucket(index, penalty)
+
+            self._queues[queue_id] = index
+
+        self._notify((queue_id,))
+        return index
+
+    def _read_agent_states(self, agent_ids: List[int]) -> Dict[int, Dict[str, bool]]:
+        """Read the stored login and pause states of agents in one round trip."""
+        if self._redis is None or not agent_ids:
+            return {}
+
+        pipe = self._redis.pipeline(transaction=False)
+        for agent_id in agent_ids:
+            pipe.hgetall(self.agent_state_key(agent_id))
+        return {
+            agent_id: {key.decode(): value == b'1' for key, value in state.items()}
+            for agent_id, state in zip(agent_ids, pipe.execute())
+            if state
+        }
+
+    def _notify(self, queue_ids, agent_id: Optional[int] = None) -> None:
+        """Run listeners for changed queues; must be called without the lock."""
+        for queue_id in queue_ids:
+            for callback in self._listeners:
+                callback(queue_id, agent_id)
+
+    def _unlink_members(self, queue_id: int, index: _QueueIndex) -> None:
+        """Remove a queue's members from the agent reverse index."""
+        for member in index.members.values():
+            links = self._agent_members.get(member.agent_id)
+            if links:
+                links.discard((queue_id, member.id))
+                if not links:
+                    del self._agent_members[member.agent_id]
+
+    def _is_available(self, member: IndexedMember) -> bool:
+        """Check member flags together with the last known agent state."""
+        if not member.is_available or member.paused:
+            return False
+        state = self._agent_state.get(member.agent_id)
+        if state:
+            return state.get('logged_in', True) and not state.get('paused', False)
+        return True
+
+    def _rebuild_bucket(self, index: _QueueIndex, penalty: int) -> None:
+        """Recompute one penalty bucket; must be called with the lock held."""
+        bucket = sorted(
+            (m for m in index.members.values()
+             if m.penalty == penalty and self._is_available(m)),
+            key=lambda m: m.id
+        )
+
+        if bucket:
+            index.buckets[penalty] = bucket
+        else:
+            index.buckets.pop(penalty, None)
+        index.penalties = sorted(index.buckets)
+
+availability_index = AvailabilityIndex()
@@ -53,3 +53,21 @@ class ServiceUnavailable(CallDistributorError):
     def __init__(self, service_name):
         super().__init__(f"Service {service_name} is unavailable")
         self.service_name = service_name
+
+class EventsNotRecorded(CallDistributorError):
+    """Raised when events could not be written to the database."""
+    def __init__(self, count):
+        super().__init__(f"{count} events could not be recorded")
+        self.count = count
+
+class CallerBlacklisted(CallDistributorError):
+    """Raised when a blacklisted caller tries to join a queue."""
+    def __init__(self, number):
+        super().__init__(f"Caller {number} is blacklisted")
+        self.number = number
+
+class CallerOutranked(CallDistributorError):
+    """Raised when a call asks for an agent while a higher-priority caller is waiting."""
+    def __init__(self, call_id):
+        super().__init__(f"Call {call_id} is outranked by a higher-priority caller")
+        self.call_id = call_id
@@ -0,0 +1,154 @@
+"""Buffered, batched event ingestion."""
+
+import logging
+import queue
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+from .services.event import EventService
+from .exceptions import ServiceUnavailable, EventsNotRecorded
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BATCH_SIZE = 500  # events written per flush at most
+DEFAULT_FLUSH_INTERVAL = 0.05  # seconds an event may wait in the buffer
+DEFAULT_MAX_PENDING = 10000  # buffered events before submitters are blocked
+DEFAULT_SUBMIT_TIMEOUT = 1.0  # seconds a submitter waits for buffer space
+
+class EventIngestor:
+    """Buffers events in memory and records them in batches from a worker thread.
+
+    A batch is flushed when it reaches ``batch_size`` events or when its
+    oldest event has waited ``flush_interval`` seconds, whichever comes
+    first. Each flush is one database transaction and one Redis pipeline
+    (see ``EventService.record_events``). The buffer holds at most
+    ``max_pending`` events; once full, ``submit`` blocks for up to
+    ``submit_timeout`` seconds and then raises ``ServiceUnavailable`` so
+    callers can shed load.
+    """
+
+    def __init__(self):
+        self.batch_size = DEFAULT_BATCH_SIZE
+        self.flush_interval = DEFAULT_FLUSH_INTERVAL
+        self.submit_timeout = DEFAULT_SUBMIT_TIMEOUT
+        self._max_pending = DEFAULT_MAX_PENDING
+        self._buffer: Optional[queue.Queue] = None
+        self._session_factory = None
+        self._redis = None
+        self._thread: Optional[threading.Thread] = None
+        self._stopping = threading.Event()
+
+    @property
+    def running(self) -> bool:
+        """Check whether the worker thread is accepting events."""
+        return self._thread is not None and self._thread.is_alive() and not self._stopping.is_set()
+
+    def configure(self, batch_size: Optional[int] = None, flush_interval: Optional[float] = None,
+                  max_pending: Optional[int] = None, submit_timeout: Optional[float] = None) -> None:
+        """Apply plugin configuration; takes effect on the next start."""
+        if batch_size is not None:
+            self.batch_size = batch_size
+        if flush_interval is not None:
+            self.flush_interval = flush_interval
+        if max_pending is not None:
+            self._max_pending = max_pending
+        if submit_timeout is not None:
+            self.submit_timeout = submit_timeout
+
+    def start(self, session_factory, redis_client) -> None:
+        """Start the worker thread."""
+        if self.running:
+            return
+
+        self._session_factory = session_factory
+        self._redis = redis_client
+        self._buffer = queue.Queue(maxsize=self._max_pending)
+        self._stopping.clear()
+        self._thread = threading.Thread(target=self._run, name='call-distributor-ingest', daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: Optional[float] = None) -> None:
+        """Flush buffered events and stop the worker thread."""
+        if self._thread is None:
+            return
+
+        self._stopping.set()
+        self._thread.join(timeout)
+        self._thread = None
+
+    def submit(self, tenant_uuid: str, event_type: str, event_name: str, data: Dict) -> None:
+        """Buffer an event for the next flush."""
+        try:
+            self._buffer.put((tenant_uuid, event_type, event_name, data), timeout=self.submit_timeout)
+        except queue.Full:
+            raise ServiceUnavailable('event ingestion')
+
+    def submit_many(self, items: List[Tuple[str, str, str, Dict]]) -> int:
+        """Buffer several events, waiting at most ``submit_timeout`` in total.
+
+        Returns how many of the leading events were buffered; the rest did
+        not fit before the deadline.
+        """
+        deadline = time.monotonic() + self.submit_timeout
+        for count, item in enumerate(items):
+            try:
+                self._buffer.put(item, timeout=max(0.0, deadline - time.monotonic()))
+            except queue.Full:
+                return count
+        return len(items)
+
+    def _run(self) -> None:
+        """Collect batches and flush them until stopped and drained."""
+        while not (self._stopping.is_set() and self._buffer.empty()):
+            batch = self._collect()
+            if batch:
+                self._flush(batch)
+
+    def _collect(self) -> List[Tuple[str, str, str, Dict]]:
+        """Wait for a first event, then gather more until the batch is full or due."""
+        try:
+            batch = [self._buffer.get(timeout=self.flush_interval)]
+        except queue.Empty:
+            return []
+
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._buffer.get(timeout=remaining))
+            except queue.Empty:
+                break
+
+        return batch
+
+    def _flush(self, batch: List[Tuple[str, str, str, Dict]]) -> None:
+        """Record a batch, falling back to one event at a time if the batch is not committed.
+
+        Once events are committed a failure in their Redis updates is only
+        logged, since retrying would insert them a second time.
+        """
+        session = self._session_factory()
+        service = EventService(session, self._redis)
+        try:
+            service.record_events(batch)
+        except EventsNotRecorded:
+            session.rollback()
+            logger.exception("Failed to record a batch of %d events, retrying individually", len(batch))
+            for item in batch:
+                try:
+                    service.record_events([item])
+                except EventsNotRecorded:
+                    session.rollback()
+                    logger.exception("Dropping event %s/%s for tenant %s", item[1], item[2], item[0])
+                except Exception:
+                    logger.exception("Recorded event %s/%s for tenant %s without its real-time updates",
+                                     item[1], item[2], item[0])
+        except Exception:
+            logger.exception("Recorded a batch of %d events without their real-time updates", len(batch))
+        finally:
+            session.close()
+
+event_ingestor = EventIngestor()
@@ -0,0 +1,110 @@
+"""Agent reservation leases shared by every call distributor worker."""
+
+from typing import Iterable, List, Optional, Set
+
+DEFAULT_LEASE_TTL = 30  # seconds, used when a queue has no ring timeout
+
+# Delete a lease only if it is still held by the releasing call
+RELEASE_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('del', KEYS[1])
+end
+return 0
+"""
+
+class AgentLeases:
+    """Short-lived agent reservations held in Redis.
+
+    A lease at ``agent:{agent_id}:lease`` holds the id of the call the agent
+    was offered and expires after the ring timeout, so an agent is never
+    offered two calls at once even when several workers route concurrently.
+    Each call also keeps the set of agents it holds at ``call:{call_id}:leases``
+    so all of them can be released when the call is answered or abandoned.
+    """
+
+    def __init__(self, redis_client):
+        self.redis = redis_client
+        self._release = redis_client.register_script(RELEASE_SCRIPT)
+
+    @staticmethod
+    def key(agent_id: int) -> str:
+        """Get the Redis key of an agent's lease."""
+        return f"agent:{agent_id}:lease"
+
+    @staticmethod
+    def call_key(call_id: str) -> str:
+        """Get the Redis key of the set of agents leased to a call."""
+        return f"call:{call_id}:leases"
+
+    def claim(self, agent_ids: Iterable[int], call_id: str, ttl: int) -> List[int]:
+        """Atomically claim agents for a call and return the ones obtained."""
+        agent_ids = list(agent_ids)
+        ttl_ms = int((ttl or DEFAULT_LEASE_TTL) * 1000)
+
+        pipe = self.redis.pipeline(transaction=False)
+        for agent_id in agent_ids:
+            pipe.set(self.key(agent_id), call_id, nx=True, px=ttl_ms)
+        claimed = [agent_id for agent_id, ok in zip(agent_ids, pipe.execute()) if ok]
+
+        if claimed:
+            call_key = self.call_key(call_id)
+            pipe = self.redis.pipeline(transaction=False)
+            pipe.sadd(call_key, *claimed)
+            pipe.pexpire(call_key, ttl_ms)
+            pipe.execute()
+
+        return claimed
+
+    def get_reserved(self, agent_ids: Iterable[int]) -> Set[int]:
+        """Get the agents that currently hold a lease."""
+        agent_ids = list(agent_ids)
+        if not agent_ids:
+            return set()
+
+        leases = self.redis.mget([self.key(agent_id) for agent_id in agent_ids])
+        return {agent_id for agent_id, lease in zip(agent_ids, leases) if lease is not None}
+
+    def release(self, agent_ids: Iterable[int], call_id: str, pipe=None) -> Optional[int]:
+        """Release agents leased to a call; leases held by other calls are kept.
+
+        When ``pipe`` is given the commands are only queued on it and None is
+        returned.
+        """
+        agent_ids = list(agent_ids)
+        if not agent_ids:
+            return 0
+
+        own_pipe = pipe is None
+        if own_pipe:
+            pipe = self.redis.pipeline(transaction=False)
+        for agent_id in agent_ids:
+            self._release(keys=[self.key(agent_id)], args=[call_id], client=pipe)
+        pipe.srem(self.call_key(call_id), *agent_ids)
+
+        if own_pipe:
+            return sum(pipe.execute()[:-1])
+        return None
+
+    def release_call(self, call_id: str) -> int:
+        """Release every agent leased to a call."""
+        return self.release_calls([call_id])
+
+    def release_calls(self, call_ids: Iterable[str]) -> int:
+        """Release every agent leased to several calls in two round trips."""
+        call_ids = list(call_ids)
+        if not call_ids:
+            return 0
+
+        pipe = self.redis.pipeline(transaction=False)
+        for call_id in call_ids:
+            pipe.smembers(self.call_key(call_id))
+        leased = pipe.execute()
+
+        pipe = self.redis.pipeline(transaction=False)
+        scripts = 0
+        for call_id, agent_ids in zip(call_ids, leased):
+            for agent_id in agent_ids:
+                self._release(keys=[self.key(int(agent_id))], args=[call_id], client=pipe)
+                scripts += 1
+        pipe.delete(*[self.call_key(call_id) for call_id in call_ids])
+        return sum(pipe.execute()[:scripts])
@@ -7,8 +7,29 @@ Base = declarative_base()
 from .queue import Queue
 from .agent import Agent
 from .queue_member import QueueMember
-from .queue_log import QueueLog
-from .schedule import Schedule
+from .schedule import Schedule, TimeRange, Holiday
 from .skill import Skill, AgentSkill
+from .caller import CallerPriority
+from .event import QueueMetrics, AgentMetrics, Event
+from .desktop import AgentDesktopSettings, WrapUpCode, CallNote
+from .supervisor import SupervisorSettings, Alert, MonitoringProfile
+from .callback import CallbackRequest, CallbackSchedule
+from .rbac import Role, Permission, TenantConfig
+from .reporting import Report, QueueStats, AgentStats, CallStats, RollupWatermark
+from .integration import Integration, Webhook, WebhookDelivery
+from .reliability import ServiceHealth, RateLimitConfig, BackupConfig, FailoverConfig
+from .media import Announcement, MusicOnHold
+from .security import SecurityPolicy, AuditLog, ComplianceReport, DataRetentionPolicy
 
-__all__ = ['Queue', 'Agent', 'QueueMember', 'QueueLog', 'Schedule', 'Skill', 'AgentSkill']
+__all__ = [
+    'Queue', 'Agent', 'QueueMember', 'Schedule', 'TimeRange', 'Holiday', 'Skill', 'AgentSkill',
+    'CallerPriority', 'QueueMetrics', 'AgentMetrics', 'Event',
+    'AgentDesktopSettings', 'WrapUpCode', 'CallNote',
+    'SupervisorSettings', 'Alert', 'MonitoringProfile',
+    'CallbackRequest', 'CallbackSchedule', 'Role', 'Permission', 'TenantConfig',
+    'Report', 'QueueStats', 'AgentStats', 'CallStats', 'RollupWatermark',
+    'Integration', 'Webhook', 'WebhookDelivery',
+    'ServiceHealth', 'RateLimitConfig', 'BackupConfig', 'FailoverConfig',
+    'Announcement', 'MusicOnHold',
+    'SecurityPolicy', 'AuditLog', 'ComplianceReport', 'DataRetentionPolicy'
+]
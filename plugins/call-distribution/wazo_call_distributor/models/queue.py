@@ -20,6 +20,7 @@ class Queue(Base):
     max_wait = Column(Integer, default=3600)  # Max wait time in queue
     service_level = Column(Integer, default=20)  # Service level threshold in seconds
     weight = Column(Integer, default=0)  # Queue priority weight
+    sticky_agent_ttl = Column(Integer, default=0)  # Caller-agent affinity lifetime in seconds, 0 = disabled
     
     # Capacity settings
     max_callers = Column(Integer, default=0)  # 0 = unlimited
@@ -46,8 +47,8 @@ class Queue(Base):
     
     # Relationships
     members = relationship('QueueMember', back_populates='queue')
-    skills = relationship('Skill', secondary='queue_skills')
-    schedules = relationship('Schedule', secondary='queue_schedules')
+    skills = relationship('Skill', secondary='call_distributor_queue_skills', back_populates='queues')
+    schedules = relationship('Schedule', secondary='call_distributor_queue_schedules', back_populates='queues')
     
     def __repr__(self):
         return f'<Queue(name={self.name}, strategy={self.strategy})>'
@@ -64,6 +65,7 @@ class Queue(Base):
             'max_wait': self.max_wait,
             'service_level': self.service_level,
             'weight': self.weight,
+            'sticky_agent_ttl': self.sticky_agent_ttl,
             'max_callers': self.max_callers,
             'max_members': self.max_members,
             'announce_position': self.announce_position,
@@ -1,6 +1,6 @@
 """Reporting models for analytics and data aggregation."""
 
-from sqlalchemy import Column, Integer, String, Float, DateTime, ForeignKey, JSON, Table
+from sqlalchemy import Column, Integer, String, Float, Boolean, DateTime, ForeignKey, JSON, Table, UniqueConstraint
 from sqlalchemy.orm import relationship
 from datetime import datetime
 from . import Base
@@ -60,6 +60,10 @@ class QueueStats(Base):
     """Queue statistics model for historical data."""
     
     __tablename__ = 'call_distributor_queue_stats'
+    __table_args__ = (
+        # One row per queue and bucket, so aggregation can be re-run
+        UniqueConstraint('queue_id', 'timestamp', 'interval'),
+    )
     
     id = Column(Integer, primary_key=True)
     tenant_uuid = Column(String(36), nullable=False, index=True)
@@ -68,7 +72,7 @@ class QueueStats(Base):
     interval = Column(String(16), nullable=False)  # '1min', '5min', '1hour', '1day'
     
     # Call volume metrics
-    total_calls = Column(Integer, default=0)
+    total_calls = Column(Integer, default=0)  # Answered and abandoned calls
     answered_calls = Column(Integer, default=0)
     abandoned_calls = Column(Integer, default=0)
     transferred_calls = Column(Integer, default=0)
@@ -92,6 +96,7 @@ class QueueStats(Base):
     average_talk_time = Column(Float, default=0.0)
     service_level_ratio = Column(Float, default=0.0)
     abandon_rate = Column(Float, default=0.0)
+    samples = Column(Integer, default=0)  # Metrics snapshots the averages are taken over
     
     # Relationship
     queue = relationship('Queue')
@@ -123,13 +128,18 @@ class QueueStats(Base):
             'average_wait_time': self.average_wait_time,
             'average_talk_time': self.average_talk_time,
             'service_level_ratio': self.service_level_ratio,
-            'abandon_rate': self.abandon_rate
+            'abandon_rate': self.abandon_rate,
+            'samples': self.samples
         }
 
 class AgentStats(Base):
     """Agent statistics model for historical data."""
     
     __tablename__ = 'call_distributor_agent_stats'
+    __table_args__ = (
+        # One row per agent and bucket, so aggregation can be re-run
+        UniqueConstraint('agent_id', 'timestamp', 'interval'),
+    )
     
     id = Column(Integer, primary_key=True)
     tenant_uuid = Column(String(36), nullable=False, index=True)
@@ -138,7 +148,7 @@ class AgentStats(Base):
     interval = Column(String(16), nullable=False)  # '1min', '5min', '1hour', '1day'
     
     # Call metrics
-    total_calls = Column(Integer, default=0)
+    total_calls = Column(Integer, default=0)  # Calls taken
     answered_calls = Column(Integer, default=0)
     missed_calls = Column(Integer, default=0)
     outbound_calls = Column(Integer, default=0)
@@ -160,6 +170,7 @@ class AgentStats(Base):
     average_wrap_up_time = Column(Float, default=0.0)
     occupancy_rate = Column(Float, default=0.0)
     utilization_rate = Column(Float, default=0.0)
+    samples = Column(Integer, default=0)  # Metrics snapshots the averages are taken over
     
     # Relationship
     agent = relationship('Agent')
@@ -191,9 +202,22 @@ class AgentStats(Base):
             'average_talk_time': self.average_talk_time,
             'average_wrap_up_time': self.average_wrap_up_time,
             'occupancy_rate': self.occupancy_rate,
-            'utilization_rate': self.utilization_rate
+            'utilization_rate': self.utilization_rate,
+            'samples': self.samples
         }
 
+class RollupWatermark(Base):
+    """Progress of a statistics rollup level."""
+    
+    __tablename__ = 'call_distributor_rollup_watermarks'
+    
+    stats = Column(String(16), primary_key=True)  # 'queue', 'agent'
+    interval = Column(String(16), primary_key=True)  # '1min', '5min', '1hour', '1day'
+    watermark = Column(DateTime, nullable=False)  # end of the last finalized bucket rolled up
+    
+    def __repr__(self):
+        return f'<RollupWatermark(stats={self.stats}, interval={self.interval}, watermark={self.watermark})>'
+
 class CallStats(Base):
     """Call statistics model for detailed call data."""
     
@@ -20,7 +20,17 @@ from .api.rbac import bp as rbac_bp
 from .api.reporting import bp as reporting_bp
 from .api.integration import bp as integration_bp
 from .api.reliability import bp as reliability_bp
-from .websocket import WebSocketHandler
+from .websocket import WebSocketHandler, DEFAULT_SEND_QUEUE_SIZE
+from .availability import availability_index
+from .skill_matrix import skill_matrix
+from .sticky import sticky_agents
+from .strategies import precomputed_candidates
+from .ingest import event_ingestor
+from .snapshot import metrics_snapshotter, DEFAULT_SNAPSHOT_INTERVAL
+from .rollup import stats_rollup, DEFAULT_ROLLUP_INTERVAL
+from .streams import default_consumer_name, process_node_id, event_publisher
+from .webhooks import WebhookWorker
+from .redis_client import get_redis_client
 from .models import Base
 
 logger = logging.getLogger(__name__)
@@ -31,6 +41,7 @@ class Plugin:
     def __init__(self):
         self.session = None
         self.websocket_handler = None
+        self.webhook_workers = []
     
     def load(self, app_or_deps):
         """Load the plugin."""
@@ -43,6 +54,65 @@ class Plugin:
         session_factory = sessionmaker(bind=engine)
         self.session = scoped_session(session_factory)
         
+        # Configure the routing caches
+        availability_index.configure(
+            refresh_interval=config.get('availability_refresh_interval'),
+            redis_client=get_redis_client(config['redis_url'])
+        )
+        skill_matrix.configure(
+            refresh_interval=config.get('skill_matrix_refresh_interval')
+        )
+        sticky_agents.configure(
+            size=config.get('sticky_cache_size'),
+            negative_ttl=config.get('sticky_negative_ttl')
+        )
+        
+        # Optionally route from candidate lists computed ahead of calls
+        precomputed_candidates.configure(
+            enabled=config.get('precompute_candidates', False)
+        )
+        
+        # Optionally buffer posted events and record them in batches
+        if config.get('event_buffering', False):
+            event_ingestor.configure(
+                batch_size=config.get('event_batch_size'),
+                flush_interval=config.get('event_flush_interval'),
+                max_pending=config.get('event_max_pending'),
+                submit_timeout=config.get('event_submit_timeout')
+            )
+            event_ingestor.start(self.session, get_redis_client(config['redis_url']))
+        
+        # Periodically copy the real-time metrics into the metrics tables; every
+        # process runs the timer and a Redis tick lock picks one per snapshot
+        metrics_snapshotter.configure(
+            interval=config.get('metrics_snapshot_interval'),
+            batch_size=config.get('metrics_snapshot_batch_size')
+        )
+        if config.get('metrics_snapshot_interval', DEFAULT_SNAPSHOT_INTERVAL) > 0:
+            metrics_snapshotter.start(self.session, get_redis_client(config['redis_url']))
+        
+        # Roll the snapshots up into 1min, 5min, 1hour and 1day statistics
+        stats_rollup.configure(
+            interval=config.get('stats_rollup_interval'),
+            delay=config.get('stats_rollup_delay')
+        )
+        if config.get('stats_rollup_interval', DEFAULT_ROLLUP_INTERVAL) > 0:
+            stats_rollup.start(self.session, get_redis_client(config['redis_url']))
+        
+        # Choose how events reach WebSocket nodes and webhook workers
+        event_publisher.configure(
+            transport=config.get('event_transport'),
+            maxlen=config.get('event_stream_maxlen')
+        )
+        
+        # Deliver streamed events to webhooks; workers share one consumer group
+        consumer_name = config.get('stream_consumer_name') or default_consumer_name()
+        for index in range(config.get('webhook_workers', 0)):
+            worker = WebhookWorker(self.session, get_redis_client(config['redis_url']),
+                                   consumer=f"{consumer_name}:{index}")
+            worker.start()
+            self.webhook_workers.append(worker)
+        
         # Register database session middleware
         @app.before_request
         def before_request():
@@ -73,6 +143,12 @@ class Plugin:
         app.register_blueprint(reliability_bp, url_prefix="/api/calld/1.0/reliability")
         
         # Initialize WebSocket handler
-        self.websocket_handler = WebSocketHandler(app.config['call_distributor']['redis_url'])
+        self.websocket_handler = WebSocketHandler(
+            config['redis_url'],
+            node_id=process_node_id(consumer_name),
+            send_queue_size=config.get('websocket_send_queue_size', DEFAULT_SEND_QUEUE_SIZE),
+            slow_consumer_policy=config.get('websocket_slow_consumer_policy', 'drop_oldest'),
+            session_factory=self.session
+        )
         
         logger.info("Call distributor plugin loaded")
@@ -0,0 +1,303 @@
+"""Atomic updates of the real-time queue and agent metrics."""
+
+import json
+import time
+from typing import Dict, List, Optional
+
+from .waiting import WaitingCallers
+
+# Agent events and the state they move the agent to
+AGENT_STATE_EVENTS = {
+    'agent_login': 'available',
+    'agent_logout': 'logged_out',
+    'agent_paused': 'paused',
+    'agent_unpaused': 'available'
+}
+
+# Upper bounds in seconds of the answered-wait histogram buckets; the
+# last bucket counts every longer wait
+WAIT_HISTOGRAM = (5, 10, 15, 20, 30, 45, 60, 90, 120, 180, 300, 600)
+
+BUCKET_SECONDS = 60  # width of a window bucket
+WINDOWS = (5, 15, 60)  # sliding windows served, in buckets
+DEFAULT_WINDOW = 15  # window of the top-level windowed metrics
+
+# Call event carrying the talk time of a finished call
+CALL_ENDED_EVENT = 'call_ended'
+
+# Apply a call event to the queue counters (KEYS[1]), the current window
+# bucket (KEYS[2]) and, when given, the answering agent's counters
+# (KEYS[4]). The wait of an answered or abandoned call is ARGV[4] when the
+# event carries it, otherwise the time since it entered the waiting list
+# (KEYS[3]). calls_waiting never drops below zero so a duplicated answer or
+# abandon cannot leave it negative.
+CALL_SCRIPT = """
+local event = ARGV[1]
+local bucket = KEYS[2]
+local bucket_ttl = tonumber(ARGV[6])
+
+if event == 'call_entered' then
+    redis.call('hincrby', KEYS[1], 'calls_waiting', 1)
+    redis.call('hincrby', bucket, 'offered', 1)
+    redis.call('expire', bucket, bucket_ttl)
+    return 1
+end
+
+if event == '""" + CALL_ENDED_EVENT + """' then
+    local talk = tonumber(ARGV[5])
+    if talk then
+        redis.call('hincrby', bucket, 'talked', 1)
+        redis.call('hincrbyfloat', bucket, 'talk_sum', talk)
+        redis.call('expire', bucket, bucket_ttl)
+    end
+    return 1
+end
+
+local outcome
+if event == 'call_answered' then
+    outcome = 'answered'
+elseif event == 'call_abandoned' then
+    outcome = 'abandoned'
+else
+    return 0
+end
+
+if tonumber(redis.call('hget', KEYS[1], 'calls_waiting') or '0') > 0 then
+    redis.call('hincrby', KEYS[1], 'calls_waiting', -1)
+end
+redis.call('hincrby', KEYS[1], outcome .. '_calls', 1)
+if KEYS[4] then
+    redis.call('hincrby', KEYS[4], 'calls_taken', 1)
+end
+
+redis.call('hincrby', bucket, outcome, 1)
+local wait = tonumber(ARGV[4])
+if not wait then
+    local since = redis.call('zscore', KEYS[3], ARGV[2])
+    if since then
+        wait = math.max(0, tonumber(ARGV[3]) - tonumber(since))
+    end
+end
+if wait then
+    redis.call('hincrbyfloat', bucket, outcome .. '_wait_sum', wait)
+    if outcome == 'answered' then
+        local bin = #ARGV - 6
+        for i = 7, #ARGV do
+            if wait <= tonumber(ARGV[i]) then
+                bin = i - 7
+                break
+            end
+        end
+        redis.call('hincrby', bucket, 'wait_bin:' .. bin, 1)
+    end
+end
+redis.call('expire', bucket, bucket_ttl)
+return 1
+"""
+
+# Move an agent to ARGV[1] and return its previous state. The agent's state
+# in the queue (field ARGV[2] of KEYS[3]) decides which queue counters of
+# KEYS[2] change, so repeated or out-of-order events never count an agent
+# twice. States are stored JSON-encoded like every other metric value.
+AGENT_SCRIPT = """
+local buckets = {available = 'agents_available', on_call = 'agents_on_call', paused = 'agents_paused'}
+local new_state = ARGV[1]
+
+local function decode(value)
+    if not value then
+        return 'logged_out'
+    end
+    return (string.gsub(value, '"', ''))
+end
+
+local previous = decode(redis.call('hget', KEYS[1], 'current_state'))
+if previous ~= new_state then
+    redis.call('hset', KEYS[1], 'current_state', cjson.encode(new_state))
+    redis.call('hset', KEYS[1], 'state_duration', 0)
+end
+
+if KEYS[2] then
+    local queue_previous = decode(redis.call('hget', KEYS[3], ARGV[2]))
+    if queue_previous ~= new_state then
+        if queue_previous == 'logged_out' then
+            redis.call('hincrby', KEYS[2], 'agents_logged', 1)
+        elseif new_state == 'logged_out' then
+            redis.call('hincrby', KEYS[2], 'agents_logged', -1)
+        end
+        if buckets[queue_previous] then
+            redis.call('hincrby', KEYS[2], buckets[queue_previous], -1)
+        end
+        if buckets[new_state] then
+            redis.call('hincrby', KEYS[2], buckets[new_state], 1)
+        end
+
+        if new_state == 'logged_out' then
+            redis.call('hdel', KEYS[3], ARGV[2])
+        else
+            redis.call('hset', KEYS[3], ARGV[2], cjson.encode(new_state))
+        end
+    end
+end
+
+return previous
+"""
+
+class RealtimeMetrics:
+    """Real-time metric hashes updated by server-side state transitions.
+
+    Counters live in ``queue_metrics:{queue_id}`` and
+    ``agent_metrics:{agent_id}``; each queue also keeps the state of its
+    agents in ``queue:{queue_id}:agent_states``. Call outcomes, waits and
+    talk times are also counted in per-minute buckets at
+    ``queue:{queue_id}:window:{minute}`` that expire after the longest
+    window, so the 5, 15 and 60-minute windows are summed at read time from
+    at most 60 small hashes. Every event is applied by one script call, so
+    concurrent workers never interleave inside a transition and each event
+    costs a single command that can be queued on a pipeline.
+    """
+
+    def __init__(self, redis_client):
+        self.redis = redis_client
+        self._call = redis_client.register_script(CALL_SCRIPT)
+        self._agent = redis_client.register_script(AGENT_SCRIPT)
+
+    @staticmethod
+    def queue_key(queue_id: int) -> str:
+        """Get the Redis key of a queue's metrics."""
+        return f"queue_metrics:{queue_id}"
+
+    @staticmethod
+    def agent_key(agent_id: int) -> str:
+        """Get the Redis key of an agent's metrics."""
+        return f"agent_metrics:{agent_id}"
+
+    @staticmethod
+    def agent_states_key(queue_id: int) -> str:
+        """Get the Redis key of the states of a queue's agents."""
+        return f"queue:{queue_id}:agent_states"
+
+    @staticmethod
+    def window_key(queue_id: int, bucket: int) -> str:
+        """Get the Redis key of one of a queue's window buckets."""
+        return f"queue:{queue_id}:window:{bucket}"
+
+    def apply_call_event(self, event_name: str, queue_id: int, call_id: Optional[str] = None,
+                         agent_id: Optional[int] = None, data: Optional[Dict] = None,
+                         pipe=None, now: Optional[float] = None) -> None:
+        """Apply a call event to the queue, window and answering agent counters.
+
+        ``data`` may carry the call's ``wait_time`` and, for call_ended,
+        its ``talk_time``, both in seconds.
+        """
+        data = data or {}
+        now = now or time.time()
+
+        keys = [
+            self.queue_key(queue_id),
+            self.window_key(queue_id, int(now // BUCKET_SECONDS)),
+            WaitingCallers(self.redis, queue_id).since_key
+        ]
+        if agent_id:
+            keys.append(self.agent_key(agent_id))
+
+        args = [
+            event_name,
+            call_id or '',
+            now,
+            _seconds(data.get('wait_time')),
+            _seconds(data.get('talk_time')),
+            (max(WINDOWS) + 1) * BUCKET_SECONDS
+        ]
+        args.extend(WAIT_HISTOGRAM)
+        self._call(keys=keys, args=args, client=pipe if pipe is not None else self.redis)
+
+    def apply_agent_event(self, event_name: str, agent_id: int,
+                          queue_id: Optional[int] = None, pipe=None) -> None:
+        """Apply an agent state change to the agent and queue counters."""
+        new_state = AGENT_STATE_EVENTS.get(event_name)
+        if new_state is None:
+            return
+
+        keys = [self.agent_key(agent_id)]
+        if queue_id:
+            keys.extend([self.queue_key(queue_id), self.agent_states_key(queue_id)])
+        self._agent(keys=keys, args=[new_state, agent_id], client=pipe if pipe is not None else self.redis)
+
+    def get_queue_metrics(self, queue_id: int, service_level: int, now: Optional[float] = None) -> Dict:
+        """Get a queue's counters and windowed metrics in one round trip.
+
+        Returns an empty dict when the queue has no live metrics.
+        """
+        now = now or time.time()
+        pipe = self.redis.pipeline(transaction=False)
+        self.read_queue_metrics(queue_id, pipe, now)
+        return self.parse_queue_metrics(pipe.execute(), service_level, now)
+
+    def read_queue_metrics(self, queue_id: int, pipe, now: float) -> int:
+        """Queue the reads of ``get_queue_metrics`` on a pipeline and return their count.
+
+        Lets callers read many queues in one round trip; pass each queue's
+        slice of the results to ``parse_queue_metrics``.
+        """
+        current = int(now // BUCKET_SECONDS)
+        waiting = WaitingCallers(self.redis, queue_id)
+        pipe.hgetall(self.queue_key(queue_id))
+        pipe.zcard(waiting.since_key)
+        pipe.zrange(waiting.since_key, 0, 0, withscores=True)
+        for bucket in range(current, current - max(WINDOWS), -1):
+            pipe.hgetall(self.window_key(queue_id, bucket))
+        return 3 + max(WINDOWS)
+
+    @staticmethod
+    def parse_queue_metrics(results: List, service_level: int, now: float) -> Dict:
+        """Build a queue's metrics from the results of ``read_queue_metrics``."""
+        counters, enqueued, oldest, *buckets = results
+
+        if not counters:
+            return {}
+
+        metrics = {key.decode(): json.loads(value) for key, value in counters.items()}
+        if enqueued:
+            metrics['calls_waiting'] = enqueued
+        metrics['longest_wait'] = max(0, int(now - oldest[0][1])) if oldest else 0
+
+        windows = {
+            f"{size}m": _window_metrics(buckets[:size], service_level)
+            for size in WINDOWS
+        }
+        metrics.update(windows[f"{DEFAULT_WINDOW}m"])
+        metrics['windows'] = windows
+        return metrics
+
+def _seconds(value) -> str:
+    """Format an optional duration as a script argument."""
+    return '' if value is None else str(float(value))
+
+def _window_metrics(buckets: List[Dict[bytes, bytes]], service_level: int) -> Dict:
+    """Aggregate window buckets into service level, average wait and average talk.
+
+    The service level is the share of answered and abandoned calls answered
+    within ``service_level`` seconds, rounded down to a histogram bound.
+    """
+    totals: Dict[str, float] = {}
+    for bucket in buckets:
+        for key, value in bucket.items():
+            key = key.decode()
+            totals[key] = totals.get(key, 0) + float(value)
+
+    answered = totals.get('answered', 0)
+    abandoned = totals.get('abandoned', 0)
+    bins = [totals.get(f"wait_bin:{index}", 0) for index in range(len(WAIT_HISTOGRAM) + 1)]
+    timed = sum(bins)
+    within = sum(count for bound, count in zip(WAIT_HISTOGRAM, bins) if bound <= service_level)
+    talked = totals.get('talked', 0)
+
+    return {
+        'offered_calls': int(totals.get('offered', 0)),
+        'window_answered': int(answered),
+        'window_abandoned': int(abandoned),
+        'service_level': round(100.0 * within / (answered + abandoned), 2) if answered + abandoned else 0.0,
+        'average_wait': round(totals.get('answered_wait_sum', 0) / timed, 2) if timed else 0.0,
+        'average_talk': round(totals.get('talk_sum', 0) / talked, 2) if talked else 0.0,
+        'wait_histogram': dict(zip([str(bound) for bound in WAIT_HISTOGRAM] + ['+Inf'], map(int, bins)))
+    }
@@ -0,0 +1,31 @@
+"""Shared Redis connections for the call distributor plugin."""
+
+import threading
+from typing import Dict, Optional
+import redis
+from flask import current_app
+
+_pools: Dict[str, redis.ConnectionPool] = {}
+_pools_lock = threading.Lock()
+
+def get_connection_pool(redis_url: str) -> redis.ConnectionPool:
+    """Get the process-wide connection pool for a Redis URL."""
+    pool = _pools.get(redis_url)
+    if pool is None:
+        with _pools_lock:
+            pool = _pools.get(redis_url)
+            if pool is None:
+                pool = redis.ConnectionPool.from_url(redis_url)
+                _pools[redis_url] = pool
+    return pool
+
+def get_redis_client(redis_url: Optional[str] = None) -> redis.Redis:
+    """Get a Redis client backed by the shared connection pool.
+    
+    Defaults to the ``redis_url`` of the current app's call_distributor
+    configuration. Clients are cheap; connections are reused across
+    requests and threads.
+    """
+    if redis_url is None:
+        redis_url = current_app.config['call_distributor']['redis_url']
+    return redis.Redis(connection_pool=get_connection_pool(redis_url))
@@ -0,0 +1,85 @@
+"""Periodic rollups of the metrics snapshots into the statistics tables."""
+
+import logging
+import threading
+import time
+from datetime import timedelta
+from typing import Optional
+
+from .services.reporting import ReportingService, DEFAULT_ROLLUP_DELAY
+from .ticks import TickLock
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_ROLLUP_INTERVAL = 60  # seconds between rollup runs
+
+class StatsRollup:
+    """Rolls finalized metrics up into the 1min, 5min, 1hour and 1day
+    ``QueueStats`` and ``AgentStats`` rows from a worker thread.
+
+    Each run only reads the buckets finalized since the previous one, as
+    tracked by the levels' watermarks, so it costs a few grouped queries
+    whatever the length of the history; see
+    ``ReportingService.rollup_stats``. Every worker process runs the timer,
+    and a ``TickLock`` lets one of them run each rollup.
+    """
+
+    def __init__(self):
+        self.interval = DEFAULT_ROLLUP_INTERVAL
+        self.delay = DEFAULT_ROLLUP_DELAY
+        self._session_factory = None
+        self._redis = None
+        self._thread: Optional[threading.Thread] = None
+        self._stopping = threading.Event()
+
+    @property
+    def running(self) -> bool:
+        """Check whether the worker thread is running."""
+        return self._thread is not None and self._thread.is_alive()
+
+    def configure(self, interval: Optional[float] = None, delay: Optional[float] = None) -> None:
+        """Apply plugin configuration; ``delay`` is in seconds."""
+        if interval is not None:
+            self.interval = interval
+        if delay is not None:
+            self.delay = timedelta(seconds=delay)
+
+    def start(self, session_factory, redis_client) -> None:
+        """Start the worker thread."""
+        if self.running:
+            return
+
+        self._session_factory = session_factory
+        self._redis = redis_client
+        self._stopping.clear()
+        self._thread = threading.Thread(target=self._run, name='call-distributor-rollup', daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: Optional[float] = None) -> None:
+        """Stop the worker thread."""
+        if self._thread is None:
+            return
+
+        self._stopping.set()
+        self._thread.join(timeout)
+        self._thread = None
+
+    def _run(self) -> None:
+        """Roll up new buckets every interval until stopped."""
+        lock = TickLock(self._redis, 'rollup')
+        while not self._stopping.wait(self.interval):
+            started = time.monotonic()
+            session = self._session_factory()
+            try:
+                if not lock.acquire(self.interval):
+                    continue
+                written = ReportingService(session).rollup_stats(delay=self.delay)
+                logger.debug("Rolled up %d statistics rows in %.2fs",
+                             sum(written.values()), time.monotonic() - started)
+            except Exception:
+                session.rollback()
+                logger.exception("Failed to roll up statistics")
+            finally:
+                session.close()
+
+stats_rollup = StatsRollup()
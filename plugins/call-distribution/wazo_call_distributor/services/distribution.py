@@ -1,55 +1,374 @@
 """Distribution service for handling queue strategies."""
 
-from typing import Optional, List, Union
-from ..models import Queue, Agent
-from ..strategies import STRATEGY_MAPPING
-from ..exceptions import QueueNotFound, InvalidQueueStrategy
+import threading
+import time
+from collections import deque
+from types import SimpleNamespace
+from typing import Deque, Dict, Optional, List, Set, Tuple, Union
+from ..models import Queue, CallerPriority
+from ..availability import availability_index, IndexedAgent, IndexedMember
+from ..leases import AgentLeases
+from ..waiting import WaitingCallers
+from ..strategies import STRATEGY_MAPPING, BaseStrategy, RingAllStrategy, precomputed_candidates
+from ..sticky import sticky_agents
+from ..versions import queue_versions
+from ..exceptions import (
+    QueueNotFound, InvalidQueueStrategy, CallDistributorError, CallerBlacklisted, CallerOutranked
+)
+
+QUEUE_CACHE_TTL = 30  # seconds a cached queue configuration is trusted
+
+DISPATCH_BATCH_SIZE = 50  # waiting callers considered per dispatch
+
+class StrategyCache:
+    """Tenant-scoped cache of queue configuration and ready-built strategies.
+    
+    Entries hold a detached snapshot of the queue row, so cached strategies
+    never touch a request's database session. Queue updates on this process
+    invalidate entries directly, and other workers drop them when the
+    queue's version moves; the TTL bounds staleness without Redis.
+    """
+    
+    def __init__(self, ttl: int = QUEUE_CACHE_TTL):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._entries: Dict[str, Dict[int, Tuple[float, BaseStrategy]]] = {}
+    
+    def get(self, tenant_uuid: str, queue_id: int) -> Optional[BaseStrategy]:
+        """Get a cached strategy, if present and fresh."""
+        entry = self._entries.get(tenant_uuid, {}).get(queue_id)
+        if entry is None or time.monotonic() - entry[0] >= self.ttl:
+            return None
+        return entry[1]
+    
+    def put(self, tenant_uuid: str, queue_id: int, strategy: BaseStrategy) -> None:
+        """Cache a strategy for a queue."""
+        with self._lock:
+            self._entries.setdefault(tenant_uuid, {})[queue_id] = (time.monotonic(), strategy)
+    
+    def invalidate(self, tenant_uuid: str, queue_id: Optional[int] = None) -> None:
+        """Drop a queue (or every queue of a tenant) from the cache."""
+        with self._lock:
+            if queue_id is None:
+                self._entries.pop(tenant_uuid, None)
+            else:
+                self._entries.get(tenant_uuid, {}).pop(queue_id, None)
+    
+    def clear(self) -> None:
+        """Drop every cached entry."""
+        with self._lock:
+            self._entries.clear()
+
+strategy_cache = StrategyCache()
 
 class DistributionService:
     """Service for handling queue distribution strategies."""
     
-    def __init__(self, session):
+    def __init__(self, session, redis_client=None):
         self.session = session
+        self.redis = redis_client
     
-    def get_next_agents(self, queue_id: int, tenant_uuid: str, call_id: str) -> Union[Optional[Agent], List[Agent]]:
-        """Get next agent(s) based on queue strategy."""
-        queue = self.session.query(Queue).filter(
-            Queue.id == queue_id,
-            Queue.tenant_uuid == tenant_uuid
-        ).first()
+    def get_next_agents(self, queue_id: int, tenant_uuid: str, call_id: str,
+                        caller_id: Optional[str] = None) -> Union[Optional[IndexedAgent], List[IndexedAgent]]:
+        """Get next agent(s) based on queue strategy, trying the caller's sticky agent first.
+        
+        Raises ``CallerOutranked`` while a caller with a higher priority is
+        waiting in the queue, so agents go to ``dispatch_waiting`` in
+        priority order; a caller that is not waiting counts as priority 0.
+        Returns None when no agent is available.
+        """
+        strategy = self._get_strategy(queue_id, tenant_uuid)
+        if self.redis is not None and WaitingCallers(self.redis, queue_id).outranked(call_id):
+            raise CallerOutranked(call_id)
         
-        if not queue:
-            raise QueueNotFound(queue_id)
+        agents = self._reserve_next_agents(strategy, call_id, caller_id=caller_id)
+        if agents and self.redis is not None:
+            WaitingCallers(self.redis, queue_id).dequeue(call_id)
+        return agents
+    
+    def enqueue_call(self, queue_id: int, tenant_uuid: str, call_id: str,
+                     caller_id: Optional[str] = None, priority: int = 0) -> Dict:
+        """Add a caller to a queue's waiting list, applying its VIP level."""
+        self._get_strategy(queue_id, tenant_uuid)
         
-        strategy_class = STRATEGY_MAPPING.get(queue.strategy)
-        if not strategy_class:
-            raise InvalidQueueStrategy(f"Strategy {queue.strategy} not implemented")
+        if caller_id:
+            caller_priority = self.session.query(CallerPriority).filter(
+                CallerPriority.tenant_uuid == tenant_uuid,
+                CallerPriority.number == caller_id
+            ).first()
+            if caller_priority and caller_priority.priority_type == 'blacklist':
+                raise CallerBlacklisted(caller_id)
+            if caller_priority and caller_priority.priority_type == 'vip':
+                priority += caller_priority.priority_level or 0
         
-        strategy = strategy_class(queue, self.session)
-        return strategy.get_next_agent(call_id)
+        position = WaitingCallers(self.redis, queue_id).enqueue(call_id, priority)
+        return {'call_id': call_id, 'priority': priority, 'position': position}
     
-    def update_agent_stats(self, queue_id: int, agent_id: int, call_duration: int) -> None:
-        """Update agent statistics after call completion."""
-        queue = self.session.query(Queue).get(queue_id)
-        if not queue:
-            raise QueueNotFound(queue_id)
+    def remove_call(self, queue_id: int, tenant_uuid: str, call_id: str) -> bool:
+        """Remove a caller from a queue's waiting list."""
+        self._get_strategy(queue_id, tenant_uuid)
+        return WaitingCallers(self.redis, queue_id).remove(call_id)
+    
+    def dispatch_waiting(self, queue_id: int, tenant_uuid: str) -> List[Dict]:
+        """Assign available agents to a queue's waiting callers in priority order.
+        
+        Stops at the first caller no agent can take. A caller removed by
+        another worker meanwhile gives its agents back.
+        """
+        strategy = self._get_strategy(queue_id, tenant_uuid)
+        waiting = WaitingCallers(self.redis, queue_id)
+        leases = AgentLeases(self.redis)
+        assigned_agents: Set[int] = set()
+        assignments = []
+        
+        for call_id in waiting.peek(DISPATCH_BATCH_SIZE):
+            agents = self._reserve_next_agents(strategy, call_id, assigned_agents)
+            if not agents:
+                break
+            
+            agents = agents if isinstance(agents, list) else [agents]
+            if not waiting.dequeue(call_id):
+                leases.release([agent.id for agent in agents], call_id)
+                continue
+            
+            assigned_agents.update(agent.id for agent in agents)
+            assignments.append({'call_id': call_id, 'queue_id': queue_id, 'agents': agents})
+        
+        return assignments
+    
+    def route_calls(self, tenant_uuid: str, calls: List[Dict]) -> Tuple[List[Dict], List[Dict]]:
+        """Assign agents to a batch of waiting calls in a single pass.
+        
+        Calls are served by effective priority (requested priority plus the
+        caller's VIP level), then queue weight, then arrival order. Agents
+        picked for a call are excluded from the rest of the batch, so every
+        agent is assigned at most once and later calls fall through to the
+        next penalty level. Blacklisted callers are never assigned, and agents
+        leased to calls routed by other workers are skipped.
+        
+        Each queue's available members are ranked once for the whole batch
+        and calls walk that ranking, so availability and member statistics
+        are read once per queue rather than once per call. Strategies that
+        cannot rank ahead of calls still select per call.
+        
+        Returns a list of assignments and a list of unassigned calls.
+        """
+        strategies: Dict[int, BaseStrategy] = {}
+        rankings: Dict[int, Deque[IndexedMember]] = {}
+        unassigned = []
+        
+        for queue_id in {call['queue_id'] for call in calls}:
+            try:
+                strategies[queue_id] = self._get_strategy(queue_id, tenant_uuid)
+            except CallDistributorError as e:
+                unassigned.extend({
+                    'call_id': call['call_id'],
+                    'queue_id': queue_id,
+                    'reason': str(e)
+                } for call in calls if call['queue_id'] == queue_id)
+        
+        caller_ids = {call['caller_id'] for call in calls if call.get('caller_id')}
+        caller_priorities = {}
+        if caller_ids:
+            caller_priorities = {
+                priority.number: priority
+                for priority in self.session.query(CallerPriority).filter(
+                    CallerPriority.tenant_uuid == tenant_uuid,
+                    CallerPriority.number.in_(caller_ids)
+                )
+            }
         
-        strategy_class = STRATEGY_MAPPING.get(queue.strategy)
-        if not strategy_class:
-            raise InvalidQueueStrategy(f"Strategy {queue.strategy} not implemented")
+        pending = []
+        for position, call in enumerate(calls):
+            strategy = strategies.get(call['queue_id'])
+            if strategy is None:
+                continue
+            
+            priority = call.get('priority') or 0
+            caller_priority = caller_priorities.get(call.get('caller_id'))
+            if caller_priority and caller_priority.priority_type == 'blacklist':
+                unassigned.append({
+                    'call_id': call['call_id'],
+                    'queue_id': call['queue_id'],
+                    'reason': f"Caller {call['caller_id']} is blacklisted"
+                })
+                continue
+            if caller_priority and caller_priority.priority_type == 'vip':
+                priority += caller_priority.priority_level or 0
+            
+            pending.append((-priority, -(strategy.queue.weight or 0), position, call))
         
-        strategy = strategy_class(queue, self.session)
+        pending.sort(key=lambda item: item[:3])
+        
+        assigned_agents: Set[int] = set()
+        assignments = []
+        for _, _, _, call in pending:
+            strategy = strategies[call['queue_id']]
+            if strategy.precomputable:
+                if call['queue_id'] not in rankings:
+                    rankings[call['queue_id']] = self._rank_available(strategy)
+                agents = self._reserve_ranked_agent(strategy, rankings[call['queue_id']], call['call_id'],
+                                                    assigned_agents, call.get('caller_id'))
+            else:
+                agents = self._reserve_next_agents(strategy, call['call_id'],
+                                                   assigned_agents, call.get('caller_id'))
+            if not agents:
+                unassigned.append({
+                    'call_id': call['call_id'],
+                    'queue_id': call['queue_id'],
+                    'reason': 'No available agents'
+                })
+                continue
+            
+            agents = agents if isinstance(agents, list) else [agents]
+            assigned_agents.update(agent.id for agent in agents)
+            assignments.append({
+                'call_id': call['call_id'],
+                'queue_id': call['queue_id'],
+                'agents': agents
+            })
+        
+        return assignments, unassigned
+    
+    def update_agent_stats(self, queue_id: int, tenant_uuid: str,
+                           agent_id: int, call_duration: int) -> None:
+        """Update agent statistics after call completion."""
+        strategy = self._get_strategy(queue_id, tenant_uuid)
         strategy.update_member_stats(agent_id, call_duration)
+        precomputed_candidates.refresh(queue_id, agent_id)
     
-    def get_agent_stats(self, queue_id: int, agent_id: int) -> dict:
+    def get_agent_stats(self, queue_id: int, tenant_uuid: str, agent_id: int) -> dict:
         """Get agent statistics for a queue."""
-        queue = self.session.query(Queue).get(queue_id)
-        if not queue:
-            raise QueueNotFound(queue_id)
+        strategy = self._get_strategy(queue_id, tenant_uuid)
+        return strategy.get_member_stats(agent_id)
+    
+    def _reserve_next_agents(self, strategy: BaseStrategy, call_id: str,
+                             exclude: Optional[Set[int]] = None,
+                             caller_id: Optional[str] = None) -> Union[Optional[IndexedAgent], List[IndexedAgent]]:
+        """Select agent(s) with a strategy and lease them to the call.
         
-        strategy_class = STRATEGY_MAPPING.get(queue.strategy)
-        if not strategy_class:
-            raise InvalidQueueStrategy(f"Strategy {queue.strategy} not implemented")
+        The caller's sticky agent is offered alone when it is available.
+        Agents already leased by another call are excluded and selection is
+        retried. After the first lost claim, the leases of every available
+        member are read at once so the retry skips all reserved agents.
+        """
+        if self.redis is None:
+            return self._select_next_agents(strategy, call_id, exclude)
         
-        strategy = strategy_class(queue, self.session)
-        return strategy.get_member_stats(agent_id)
+        leases = AgentLeases(self.redis)
+        
+        if caller_id and strategy.queue.sticky_agent_ttl:
+            agent = self._reserve_sticky_agent(strategy, call_id, caller_id, leases, exclude)
+            if agent:
+                return [agent] if isinstance(strategy, RingAllStrategy) else agent
+        
+        exclude = set(exclude or ())
+        reserved_loaded = False
+        
+        while True:
+            agents = self._select_next_agents(strategy, call_id, exclude)
+            if not agents:
+                return None
+            
+            selected = agents if isinstance(agents, list) else [agents]
+            claimed = set(leases.claim([agent.id for agent in selected], call_id, strategy.queue.timeout))
+            if claimed:
+                if isinstance(agents, list):
+                    return [agent for agent in agents if agent.id in claimed]
+                return agents
+            
+            exclude.update(agent.id for agent in selected)
+            if not reserved_loaded:
+                exclude |= leases.get_reserved(m.agent_id for m in strategy.get_available_members())
+                reserved_loaded = True
+    
+    def _rank_available(self, strategy: BaseStrategy) -> Deque[IndexedMember]:
+        """Rank a queue's available members once, leaving out agents leased to other calls."""
+        members = strategy.rank_candidates(strategy.get_available_members())
+        if self.redis is not None and members:
+            reserved = AgentLeases(self.redis).get_reserved(m.agent_id for m in members)
+            members = [m for m in members if m.agent_id not in reserved]
+        return deque(members)
+    
+    def _reserve_ranked_agent(self, strategy: BaseStrategy, ranking: Deque[IndexedMember], call_id: str,
+                              exclude: Set[int], caller_id: Optional[str] = None) -> Optional[IndexedAgent]:
+        """Lease the caller's sticky agent, or else the best ranked agent still free, to a call.
+        
+        Ranked agents are consumed as they are offered or found taken, so
+        successive calls continue where the previous one stopped.
+        """
+        if self.redis is None:
+            leases = None
+        else:
+            leases = AgentLeases(self.redis)
+            if caller_id and strategy.queue.sticky_agent_ttl:
+                agent = self._reserve_sticky_agent(strategy, call_id, caller_id, leases, exclude)
+                if agent:
+                    return agent
+        
+        while ranking:
+            member = ranking.popleft()
+            if member.agent_id in exclude:
+                continue
+            if leases is not None and not leases.claim([member.agent_id], call_id, strategy.queue.timeout):
+                continue
+            
+            strategy.log_distribution(call_id, member.agent_id)
+            return member.agent
+        return None
+    
+    def _reserve_sticky_agent(self, strategy: BaseStrategy, call_id: str, caller_id: str,
+                              leases: AgentLeases, exclude: Optional[Set[int]] = None) -> Optional[IndexedAgent]:
+        """Lease the caller's sticky agent to the call if it is available."""
+        agent_id = sticky_agents.get(self.redis, strategy.queue.id, caller_id)
+        if not agent_id or (exclude and agent_id in exclude):
+            return None
+        if not availability_index.is_available(strategy.queue.id, agent_id):
+            return None
+        if not leases.claim([agent_id], call_id, strategy.queue.timeout):
+            return None
+        
+        strategy.log_distribution(call_id, agent_id)
+        return availability_index.get_member(strategy.queue.id, agent_id).agent
+    
+    def _select_next_agents(self, strategy: BaseStrategy, call_id: str,
+                            exclude: Optional[Set[int]] = None) -> Union[Optional[IndexedAgent], List[IndexedAgent]]:
+        """Select agent(s) from precomputed candidates when enabled, otherwise on the call path."""
+        if precomputed_candidates.supports(strategy):
+            return precomputed_candidates.next_agent(strategy, call_id, exclude)
+        return strategy.get_next_agent(call_id, exclude)
+    
+    def _get_strategy(self, queue_id: int, tenant_uuid: str) -> BaseStrategy:
+        """Get the strategy for a queue, building and caching it on first use.
+        
+        When another worker changed the queue since this process last looked,
+        everything cached for it is dropped first.
+        """
+        if self.redis is not None and queue_versions.changed(self.redis, queue_id):
+            strategy_cache.invalidate(tenant_uuid, queue_id)
+            availability_index.invalidate(queue_id)
+            precomputed_candidates.invalidate(queue_id)
+        
+        strategy = strategy_cache.get(tenant_uuid, queue_id)
+        
+        if strategy is None:
+            queue = self.session.query(Queue).filter(
+                Queue.id == queue_id,
+                Queue.tenant_uuid == tenant_uuid
+            ).first()
+            
+            if not queue:
+                raise QueueNotFound(queue_id)
+            
+            strategy_class = STRATEGY_MAPPING.get(queue.strategy)
+            if not strategy_class:
+                raise InvalidQueueStrategy(f"Strategy {queue.strategy} not implemented")
+            
+            # Cached strategies outlive the request, so they get a detached
+            # snapshot of the queue and no session
+            strategy = strategy_class(SimpleNamespace(**queue.to_dict), None, self.redis)
+            strategy_cache.put(tenant_uuid, queue_id, strategy)
+        
+        # Load or refresh the availability index while a session is at hand
+        availability_index.ensure_loaded(queue_id, self.session)
+        return strategy
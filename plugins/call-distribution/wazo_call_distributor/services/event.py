@@ -1,13 +1,41 @@
 """Event service for handling metrics and monitoring."""
 
-from typing import List, Dict, Optional
+from typing import List, Dict, Optional, Tuple
 from datetime import datetime, timedelta
 import json
 import redis
 from sqlalchemy.orm import Session
 from sqlalchemy import func
-from ..models import Event, QueueMetrics, AgentMetrics, Queue, Agent
-from ..exceptions import QueueNotFound, AgentNotFound
+from ..models import Event, QueueMetrics, AgentMetrics, QueueStats, Queue, Agent, QueueMember, RollupWatermark
+from ..availability import availability_index
+from ..leases import AgentLeases
+from ..realtime import RealtimeMetrics
+from .reporting import snapshot_increments
+from ..streams import event_publisher
+from ..waiting import WaitingCallers
+from ..sticky import sticky_agents
+from ..versions import queue_versions
+from ..exceptions import QueueNotFound, AgentNotFound, EventsNotRecorded
+
+# Agent events and the availability change they imply
+AGENT_AVAILABILITY_EVENTS = {
+    'agent_login': {'logged_in': True},
+    'agent_logout': {'logged_in': False, 'paused': False},
+    'agent_paused': {'paused': True},
+    'agent_unpaused': {'paused': False}
+}
+
+# Queue events that change queue membership
+QUEUE_MEMBER_EVENTS = ('member_added', 'member_removed', 'member_updated')
+
+# Call events that end the ringing phase and release every agent lease of the call
+LEASE_RELEASE_EVENTS = ('call_answered', 'call_abandoned', 'call_timeout')
+
+# Call events after which the caller is no longer waiting in the queue
+CALL_LEFT_QUEUE_EVENTS = ('call_answered', 'call_abandoned')
+
+# Rolled-up statistics interval read by each queue summary interval
+SUMMARY_STATS_INTERVALS = {'1h': '1min', '6h': '5min', '24h': '5min'}
 
 class EventService:
     """Service for handling events and metrics."""
@@ -15,33 +43,78 @@ class EventService:
     def __init__(self, session: Session, redis_client: redis.Redis):
         self.session = session
         self.redis = redis_client
+        self.metrics = RealtimeMetrics(redis_client)
     
     def record_event(self, tenant_uuid: str, event_type: str,
                     event_name: str, data: Dict) -> Event:
         """Record a new event."""
-        event = Event(
-            tenant_uuid=tenant_uuid,
-            event_type=event_type,
-            event_name=event_name,
-            queue_id=data.get('queue_id'),
-            agent_id=data.get('agent_id'),
-            call_id=data.get('call_id'),
-            data=data
-        )
+        return self.record_events([(tenant_uuid, event_type, event_name, data)])[0]
+    
+    def record_events(self, items: List[Tuple[str, str, str, Dict]]) -> List[Event]:
+        """Record events given as (tenant_uuid, event_type, event_name, data).
+        
+        All events are inserted in one transaction, and their metric updates
+        and publications are sent through one Redis pipeline. Raises
+        ``EventsNotRecorded`` if nothing was committed; any other error means
+        the events are stored but their Redis updates were not applied.
+        """
+        try:
+            events = [
+                Event(
+                    tenant_uuid=tenant_uuid,
+                    event_type=event_type,
+                    event_name=event_name,
+                    queue_id=data.get('queue_id'),
+                    agent_id=data.get('agent_id'),
+                    call_id=data.get('call_id'),
+                    data=data
+                )
+                for tenant_uuid, event_type, event_name, data in items
+            ]
+            
+            self.session.add_all(events)
+            
+            # Events are never modified once written, so keep them loaded rather
+            # than reloading every row on the first attribute access
+            expire_on_commit = self.session.expire_on_commit
+            self.session.expire_on_commit = False
+            try:
+                self.session.commit()
+            finally:
+                self.session.expire_on_commit = expire_on_commit
+        except Exception as e:
+            raise EventsNotRecorded(len(items)) from e
+        
+        # Update real-time metrics and publish events to Redis for WebSocket subscribers
+        pipe = self.redis.pipeline(transaction=False)
+        for event in events:
+            if event.event_type == 'call':
+                self._update_call_metrics(event, pipe)
+            elif event.event_type == 'agent':
+                self._update_agent_metrics(event, pipe)
+            self._publish_event(event, pipe)
+            
+            # Drop answered or abandoned calls from the waiting list
+            self._update_waiting(event, pipe)
+            
+            # Share agent login and pause changes with every worker's availability index
+            self._store_agent_state(event, pipe)
+        
+        # Free agents reserved for the calls
+        self._release_leases(events, pipe)
         
-        self.session.add(event)
-        self.session.commit()
+        # Have every worker reload the queues whose members changed
+        self._bump_queue_versions(events, pipe)
+        pipe.execute()
         
-        # Update real-time metrics
-        if event_type == 'call':
-            self._update_call_metrics(event)
-        elif event_type == 'agent':
-            self._update_agent_metrics(event)
+        for event in events:
+            # Keep the routing availability index in sync
+            self._update_availability(event)
         
-        # Publish event to Redis for WebSocket subscribers
-        self._publish_event(event)
+        # Remember who answered so the caller's next call goes to the same agent
+        self._update_sticky_agents(events)
         
-        return event
+        return events
     
     def get_queue_metrics(self, queue_id: int, tenant_uuid: str,
                          start_time: Optional[datetime] = None,
@@ -76,12 +149,17 @@ class EventService:
         return query.order_by(AgentMetrics.timestamp.desc()).all()
     
     def get_realtime_queue_metrics(self, queue_id: int, tenant_uuid: str) -> Dict:
-        """Get real-time metrics for a queue."""
-        metrics = self.redis.hgetall(f"queue_metrics:{queue_id}")
+        """Get real-time metrics for a queue, including its sliding windows."""
+        service_level = self.session.query(Queue.service_level).filter(
+            Queue.id == queue_id,
+            Queue.tenant_uuid == tenant_uuid
+        ).scalar()
+        
+        metrics = self.metrics.get_queue_metrics(queue_id, service_level or 0)
         if not metrics:
             return self._initialize_queue_metrics(queue_id, tenant_uuid)
         
-        return {k.decode(): json.loads(v.decode()) for k, v in metrics.items()}
+        return metrics
     
     def get_realtime_agent_metrics(self, agent_id: int, tenant_uuid: str) -> Dict:
         """Get real-time metrics for an agent."""
@@ -91,55 +169,95 @@ class EventService:
         
         return {k.decode(): json.loads(v.decode()) for k, v in metrics.items()}
     
-    def _update_call_metrics(self, event: Event) -> None:
-        """Update metrics based on call events."""
-        if not event.queue_id:
-            return
-        
-        metrics_key = f"queue_metrics:{event.queue_id}"
-        
-        if event.event_name == 'call_entered':
-            self.redis.hincrby(metrics_key, 'calls_waiting', 1)
-        elif event.event_name == 'call_answered':
-            self.redis.hincrby(metrics_key, 'calls_waiting', -1)
-            self.redis.hincrby(metrics_key, 'answered_calls', 1)
-            
-            # Update agent metrics
-            if event.agent_id:
-                agent_key = f"agent_metrics:{event.agent_id}"
-                self.redis.hincrby(agent_key, 'calls_taken', 1)
-        elif event.event_name == 'call_abandoned':
-            self.redis.hincrby(metrics_key, 'calls_waiting', -1)
-            self.redis.hincrby(metrics_key, 'abandoned_calls', 1)
+    def _update_call_metrics(self, event: Event, pipe) -> None:
+        """Queue the metric transition of a call event on a pipeline."""
+        if event.queue_id:
+            self.metrics.apply_call_event(event.event_name, event.queue_id, event.call_id,
+                                          event.agent_id, event.data, pipe)
+    
+    def _update_agent_metrics(self, event: Event, pipe) -> None:
+        """Queue the metric transition of an agent event on a pipeline."""
+        if event.agent_id:
+            self.metrics.apply_agent_event(event.event_name, event.agent_id, event.queue_id, pipe)
+    
+    def _store_agent_state(self, event: Event, pipe) -> None:
+        """Queue the write of an agent availability change on a pipeline."""
+        if event.event_type == 'agent' and event.agent_id:
+            changes = AGENT_AVAILABILITY_EVENTS.get(event.event_name)
+            if changes:
+                availability_index.store_agent_state(event.agent_id, pipe, **changes)
     
-    def _update_agent_metrics(self, event: Event) -> None:
-        """Update metrics based on agent events."""
-        if not event.agent_id:
+    def _bump_queue_versions(self, events: List[Event], pipe) -> None:
+        """Queue version bumps for the queues whose membership or agent availability changed."""
+        queue_ids = {
+            event.queue_id for event in events
+            if event.event_type == 'queue' and event.queue_id and event.event_name in QUEUE_MEMBER_EVENTS
+        }
+        agent_ids = {
+            event.agent_id for event in events
+            if event.event_type == 'agent' and event.agent_id and event.event_name in AGENT_AVAILABILITY_EVENTS
+        }
+        if agent_ids:
+            members = self.session.query(QueueMember.queue_id).filter(
+                QueueMember.agent_id.in_(agent_ids)
+            ).distinct()
+            queue_ids.update(queue_id for queue_id, in members)
+        
+        if queue_ids:
+            queue_versions.bump(self.redis, queue_ids, pipe)
+    
+    def _update_availability(self, event: Event) -> None:
+        """Apply agent state and queue membership changes to the availability index."""
+        if event.event_type == 'agent' and event.agent_id:
+            changes = AGENT_AVAILABILITY_EVENTS.get(event.event_name)
+            if changes:
+                availability_index.set_agent_state(event.agent_id, **changes)
+        elif event.event_type == 'queue' and event.queue_id:
+            if event.event_name in QUEUE_MEMBER_EVENTS:
+                availability_index.invalidate(event.queue_id)
+    
+    def _release_leases(self, events: List[Event], pipe) -> None:
+        """Release agent leases once calls are answered, rejected, abandoned or timed out."""
+        leases = AgentLeases(self.redis)
+        finished_calls = []
+        
+        for event in events:
+            if event.event_type != 'call' or not event.call_id:
+                continue
+            if event.event_name == 'call_rejected' and event.agent_id:
+                leases.release([event.agent_id], event.call_id, pipe)
+            elif event.event_name in LEASE_RELEASE_EVENTS:
+                finished_calls.append(event.call_id)
+        
+        leases.release_calls(finished_calls)
+    
+    def _update_waiting(self, event: Event, pipe) -> None:
+        """Remove answered or abandoned callers from the queue's waiting list."""
+        if event.event_type == 'call' and event.queue_id and event.call_id:
+            if event.event_name in CALL_LEFT_QUEUE_EVENTS:
+                WaitingCallers(self.redis, event.queue_id).remove(event.call_id, pipe)
+    
+    def _update_sticky_agents(self, events: List[Event]) -> None:
+        """Make answering agents sticky for their callers when the queue enables it."""
+        answered = [
+            event for event in events
+            if event.event_name == 'call_answered' and event.queue_id and event.agent_id
+            and (event.data or {}).get('caller_id')
+        ]
+        if not answered:
             return
         
-        metrics_key = f"agent_metrics:{event.agent_id}"
+        ttls = {
+            (queue_id, tenant_uuid): ttl
+            for queue_id, tenant_uuid, ttl in self.session.query(
+                Queue.id, Queue.tenant_uuid, Queue.sticky_agent_ttl
+            ).filter(Queue.id.in_({event.queue_id for event in answered}))
+        }
         
-        if event.event_name == 'agent_login':
-            self.redis.hset(metrics_key, 'current_state', 'available')
-            self.redis.hset(metrics_key, 'state_duration', 0)
-            
-            if event.queue_id:
-                queue_key = f"queue_metrics:{event.queue_id}"
-                self.redis.hincrby(queue_key, 'agents_logged', 1)
-                self.redis.hincrby(queue_key, 'agents_available', 1)
-        
-        elif event.event_name == 'agent_logout':
-            if event.queue_id:
-                queue_key = f"queue_metrics:{event.queue_id}"
-                self.redis.hincrby(queue_key, 'agents_logged', -1)
-                
-                prev_state = self.redis.hget(metrics_key, 'current_state')
-                if prev_state == b'available':
-                    self.redis.hincrby(queue_key, 'agents_available', -1)
-                elif prev_state == b'on_call':
-                    self.redis.hincrby(queue_key, 'agents_on_call', -1)
-                elif prev_state == b'paused':
-                    self.redis.hincrby(queue_key, 'agents_paused', -1)
+        for event in answered:
+            ttl = ttls.get((event.queue_id, event.tenant_uuid))
+            if ttl:
+                sticky_agents.set(self.redis, event.queue_id, event.data['caller_id'], event.agent_id, ttl)
     
     def _initialize_queue_metrics(self, queue_id: int, tenant_uuid: str) -> Dict:
         """Initialize metrics for a queue."""
@@ -199,20 +317,10 @@ class EventService:
         
         return metrics
     
-    def _publish_event(self, event: Event) -> None:
-        """Publish event to Redis channels."""
-        event_data = event.to_dict
-        
-        # Publish to tenant channel
-        self.redis.publish(f"events:tenant:{event.tenant_uuid}", json.dumps(event_data))
-        
-        # Publish to queue channel if applicable
-        if event.queue_id:
-            self.redis.publish(f"events:queue:{event.queue_id}", json.dumps(event_data))
-        
-        # Publish to agent channel if applicable
-        if event.agent_id:
-            self.redis.publish(f"events:agent:{event.agent_id}", json.dumps(event_data))
+    def _publish_event(self, event: Event, pipe) -> None:
+        """Queue an event for WebSocket nodes and webhook workers on a pipeline."""
+        event_publisher.publish(self.redis, json.dumps(event.to_dict), event.tenant_uuid,
+                                event.queue_id, event.agent_id, pipe)
     
     def get_queue_stats_summary(self, queue_id: int, tenant_uuid: str,
                               interval: str = '1h') -> Dict:
@@ -228,27 +336,61 @@ class EventService:
         else:
             raise ValueError("Invalid interval. Must be '1h', '6h', or '24h'")
         
-        metrics = self.session.query(
-            func.avg(QueueMetrics.service_level).label('avg_service_level'),
-            func.avg(QueueMetrics.average_wait).label('avg_wait_time'),
-            func.avg(QueueMetrics.average_talk).label('avg_talk_time'),
-            func.sum(QueueMetrics.answered_calls).label('total_answered'),
-            func.sum(QueueMetrics.abandoned_calls).label('total_abandoned')
+        # Read the rolled-up statistics up to the rollup watermark and only
+        # the snapshots after it, which is every snapshot when rollups are
+        # disabled; averages are weighted by the snapshots each row covers
+        stats_interval = SUMMARY_STATS_INTERVALS[interval]
+        watermark = self.session.query(RollupWatermark.watermark).filter(
+            RollupWatermark.stats == 'queue',
+            RollupWatermark.interval == stats_interval
+        ).scalar()
+        rolled_up_end = min(max(watermark or start_time, start_time), end_time)
+        
+        rolled_up = self.session.query(
+            func.sum(QueueStats.samples).label('snapshots'),
+            func.sum(QueueStats.service_level_ratio * QueueStats.samples).label('service_level'),
+            func.sum(QueueStats.average_wait_time * QueueStats.samples).label('wait_time'),
+            func.sum(QueueStats.average_talk_time * QueueStats.samples).label('talk_time'),
+            func.sum(QueueStats.answered_calls).label('answered'),
+            func.sum(QueueStats.abandoned_calls).label('abandoned')
         ).filter(
+            QueueStats.queue_id == queue_id,
+            QueueStats.tenant_uuid == tenant_uuid,
+            QueueStats.interval == stats_interval,
+            QueueStats.timestamp >= start_time,
+            QueueStats.timestamp < rolled_up_end
+        ).first()
+        
+        snapshots = snapshot_increments(
+            QueueMetrics, 'queue_id', rolled_up_end,
             QueueMetrics.queue_id == queue_id,
             QueueMetrics.tenant_uuid == tenant_uuid,
-            QueueMetrics.timestamp.between(start_time, end_time)
+            QueueMetrics.timestamp <= end_time
+        )
+        recent = self.session.query(
+            func.count().label('snapshots'),
+            func.sum(snapshots.c.service_level).label('service_level'),
+            func.sum(snapshots.c.average_wait).label('wait_time'),
+            func.sum(snapshots.c.average_talk).label('talk_time'),
+            func.sum(snapshots.c.answered_calls).label('answered'),
+            func.sum(snapshots.c.abandoned_calls).label('abandoned')
         ).first()
         
+        totals = {
+            field: (getattr(rolled_up, field) or 0) + (getattr(recent, field) or 0)
+            for field in ('snapshots', 'service_level', 'wait_time', 'talk_time', 'answered', 'abandoned')
+        }
+        count = totals['snapshots']
+        
         return {
             'interval': interval,
             'start_time': start_time.isoformat(),
             'end_time': end_time.isoformat(),
-            'avg_service_level': float(metrics.avg_service_level or 0),
-            'avg_wait_time': float(metrics.avg_wait_time or 0),
-            'avg_talk_time': float(metrics.avg_talk_time or 0),
-            'total_answered': int(metrics.total_answered or 0),
-            'total_abandoned': int(metrics.total_abandoned or 0)
+            'avg_service_level': float(totals['service_level'] / count) if count else 0.0,
+            'avg_wait_time': float(totals['wait_time'] / count) if count else 0.0,
+            'avg_talk_time': float(totals['talk_time'] / count) if count else 0.0,
+            'total_answered': int(totals['answered']),
+            'total_abandoned': int(totals['abandoned'])
         }
     
     def get_agent_stats_summary(self, agent_id: int, tenant_uuid: str,
@@ -265,16 +407,19 @@ class EventService:
         else:
             raise ValueError("Invalid interval. Must be '1h', '6h', or '24h'")
         
-        metrics = self.session.query(
-            func.sum(AgentMetrics.calls_taken).label('total_calls'),
-            func.avg(AgentMetrics.average_talk_time).label('avg_talk_time'),
-            func.avg(AgentMetrics.average_wrap_time).label('avg_wrap_time'),
-            func.avg(AgentMetrics.occupancy_rate).label('avg_occupancy'),
-            func.avg(AgentMetrics.adherence_rate).label('avg_adherence')
-        ).filter(
+        # calls_taken is cumulative, so add up its increments
+        snapshots = snapshot_increments(
+            AgentMetrics, 'agent_id', start_time,
             AgentMetrics.agent_id == agent_id,
             AgentMetrics.tenant_uuid == tenant_uuid,
-            AgentMetrics.timestamp.between(start_time, end_time)
+            AgentMetrics.timestamp <= end_time
+        )
+        metrics = self.session.query(
+            func.sum(snapshots.c.calls_taken).label('total_calls'),
+            func.avg(snapshots.c.average_talk_time).label('avg_talk_time'),
+            func.avg(snapshots.c.average_wrap_time).label('avg_wrap_time'),
+            func.avg(snapshots.c.occupancy_rate).label('avg_occupancy'),
+            func.avg(snapshots.c.adherence_rate).label('avg_adherence')
         ).first()
         
         return {
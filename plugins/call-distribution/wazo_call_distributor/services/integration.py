@@ -9,6 +9,8 @@ from datetime import datetime, timedelta
 from sqlalchemy.orm import Session
 from ..models import Integration, Webhook, WebhookDelivery
 
+WEBHOOK_TIMEOUT = 5  # seconds an endpoint has to answer before the delivery fails
+
 class IntegrationService:
     """Service for managing third-party integrations."""
     
@@ -114,6 +116,21 @@ class IntegrationService:
             WebhookDelivery.webhook_id == webhook.id
         ).order_by(WebhookDelivery.timestamp.desc()).all()
     
+    def dispatch_event(self, tenant_uuid: str, event: Dict) -> List[WebhookDelivery]:
+        """Trigger every enabled webhook of a tenant subscribed to an event."""
+        webhooks = self.session.query(Webhook).filter(
+            Webhook.tenant_uuid == tenant_uuid,
+            Webhook.enabled == True
+        ).all()
+        
+        deliveries = []
+        for webhook in webhooks:
+            if event['event_name'] in (webhook.event_types or []):
+                delivery = self.trigger_webhook(webhook.id, tenant_uuid, event['event_name'], event)
+                if delivery:
+                    deliveries.append(delivery)
+        return deliveries
+    
     def trigger_webhook(self, webhook_id: int, tenant_uuid: str,
                        event_type: str, event_data: Dict) -> WebhookDelivery:
         """Trigger a webhook for an event."""
@@ -163,7 +180,7 @@ class IntegrationService:
                 json=payload,
                 headers=headers,
                 verify=webhook.ssl_verify,
-                timeout=30
+                timeout=WEBHOOK_TIMEOUT
             )
             
             delivery.status_code = response.status_code
@@ -220,6 +237,9 @@ class IntegrationService:
             attempt=delivery.attempt + 1
         )
         self.session.add(new_delivery)
+        
+        # The new attempt carries the retry schedule from here on
+        delivery.next_retry = None
         self.session.commit()
         
         # Send webhook
@@ -236,7 +256,7 @@ class IntegrationService:
                 json=new_delivery.payload,
                 headers=headers,
                 verify=webhook.ssl_verify,
-                timeout=30
+                timeout=WEBHOOK_TIMEOUT
             )
             
             new_delivery.status_code = response.status_code
@@ -3,13 +3,15 @@
 from typing import List, Dict, Optional
 from sqlalchemy.orm import Session
 from ..models import Announcement, MusicOnHold, Queue
+from ..waiting import WaitingCallers
 from ..exceptions import QueueNotFound
 
 class MediaService:
     """Service for managing media features."""
     
-    def __init__(self, session: Session):
+    def __init__(self, session: Session, redis_client=None):
         self.session = session
+        self.redis = redis_client
     
     def get_announcement(self, announcement_id: int, tenant_uuid: str) -> Announcement:
         """Get an announcement by ID."""
@@ -117,8 +119,9 @@ class MediaService:
     
     def get_queue_position(self, queue_id: int, call_id: str) -> Optional[int]:
         """Get position in queue for a call."""
-        # TODO: Implement queue position tracking using Redis
-        return None
+        if self.redis is None:
+            return None
+        return WaitingCallers(self.redis, queue_id).position(call_id)
     
     def estimate_wait_time(self, queue_id: int, position: int) -> Optional[int]:
         """Estimate wait time for a position in queue."""
@@ -2,14 +2,18 @@
 
 from typing import List, Dict, Optional, Tuple
 from sqlalchemy.orm import Session
-from ..models import Queue, Agent, AgentSkill, CallerPriority, QueueMember
-from ..exceptions import QueueNotFound
+from ..models import Queue, Agent, CallerPriority
+from ..availability import availability_index
+from ..skill_matrix import skill_matrix
+from ..sticky import sticky_agents
+from ..exceptions import QueueNotFound, AgentNotFound, InvalidConfiguration
 
 class PolicyService:
     """Service for handling call distribution policies."""
     
-    def __init__(self, session: Session):
+    def __init__(self, session: Session, redis_client=None):
         self.session = session
+        self.redis = redis_client
     
     def get_caller_priority(self, tenant_uuid: str, number: str) -> Optional[CallerPriority]:
         """Get caller priority settings."""
@@ -27,7 +31,7 @@ class PolicyService:
     
     def get_agents_by_skills(self, queue_id: int, tenant_uuid: str,
                            required_skills: List[Dict[str, int]]) -> List[Agent]:
-        """Get agents matching required skills."""
+        """Get available agents matching required skills, most proficient first."""
         queue = self.session.query(Queue).filter(
             Queue.id == queue_id,
             Queue.tenant_uuid == tenant_uuid
@@ -36,50 +40,70 @@ class PolicyService:
         if not queue:
             raise QueueNotFound(queue_id)
         
-        # Get all available agents in the queue
-        available_members = self.session.query(QueueMember).filter(
-            QueueMember.queue_id == queue.id,
-            QueueMember.is_available == True,
-            QueueMember.paused == False
-        ).all()
+        # Available members come from the routing index, in penalty order
+        available_members = availability_index.get_available(queue.id, self.session)
         
         if not available_members:
             return []
         
-        # Filter agents by required skills
-        qualified_agents = []
-        for member in available_members:
-            agent = member.agent
-            agent_skills = {
-                skill.skill_id: skill.level
-                for skill in agent.skills
-            }
-            
-            # Check if agent has all required skills at sufficient levels
-            meets_requirements = True
-            for skill_req in required_skills:
-                skill_id = skill_req['skill_id']
-                min_level = skill_req.get('min_level', 0)
-                
-                if skill_id not in agent_skills or agent_skills[skill_id] < min_level:
-                    meets_requirements = False
-                    break
-            
-            if meets_requirements:
-                qualified_agents.append(agent)
-        
-        return qualified_agents
+        # Match all requirements at once against the skill matrix
+        agent_ids = skill_matrix.match(
+            [member.agent_id for member in available_members],
+            [(skill_req['skill_id'], skill_req.get('min_level', 0)) for skill_req in required_skills],
+            self.session
+        )
+        
+        if not agent_ids:
+            return []
+        
+        agents = {
+            agent.id: agent
+            for agent in self.session.query(Agent).filter(Agent.id.in_(agent_ids))
+        }
+        return [agents[agent_id] for agent_id in agent_ids if agent_id in agents]
     
     def get_sticky_agent(self, queue_id: int, tenant_uuid: str, caller_id: str) -> Optional[Agent]:
         """Get the sticky agent for a caller if one exists."""
-        # TODO: Implement sticky agent logic using Redis to store caller-agent mappings
-        return None
+        queue = self._get_queue(queue_id, tenant_uuid)
+        
+        agent_id = sticky_agents.get(self.redis, queue.id, caller_id)
+        if not agent_id:
+            return None
+        
+        return self.session.query(Agent).filter(
+            Agent.id == agent_id,
+            Agent.tenant_uuid == tenant_uuid
+        ).first()
     
     def set_sticky_agent(self, queue_id: int, tenant_uuid: str,
                         caller_id: str, agent_id: int) -> None:
-        """Set the sticky agent for a caller."""
-        # TODO: Implement sticky agent assignment in Redis
-        pass
+        """Set the sticky agent for a caller for the queue's affinity TTL."""
+        queue = self._get_queue(queue_id, tenant_uuid)
+        
+        if not queue.sticky_agent_ttl:
+            raise InvalidConfiguration(f"Sticky agents are disabled for queue {queue_id}")
+        
+        agent = self.session.query(Agent).filter(
+            Agent.id == agent_id,
+            Agent.tenant_uuid == tenant_uuid
+        ).first()
+        
+        if not agent:
+            raise AgentNotFound(agent_id)
+        
+        sticky_agents.set(self.redis, queue.id, caller_id, agent.id, queue.sticky_agent_ttl)
+    
+    def _get_queue(self, queue_id: int, tenant_uuid: str) -> Queue:
+        """Get a queue of the tenant."""
+        queue = self.session.query(Queue).filter(
+            Queue.id == queue_id,
+            Queue.tenant_uuid == tenant_uuid
+        ).first()
+        
+        if not queue:
+            raise QueueNotFound(queue_id)
+        
+        return queue
     
     def get_overflow_target(self, queue_id: int, tenant_uuid: str,
                           wait_time: int) -> Optional[Tuple[str, str]]:
@@ -3,13 +3,20 @@
 from typing import List, Optional, Dict
 from sqlalchemy.orm import Session
 from ..models import Queue
+from ..availability import availability_index
+from ..strategies import precomputed_candidates
+from ..realtime import RealtimeMetrics
+from ..waiting import WaitingCallers
+from ..versions import queue_versions
+from .distribution import strategy_cache
 from ..exceptions import QueueNotFound, InvalidQueueStrategy
 
 class QueueService:
     """Service for managing call queues."""
     
-    def __init__(self, session: Session):
+    def __init__(self, session: Session, redis_client=None):
         self.session = session
+        self.redis = redis_client
     
     def get(self, queue_id: int, tenant_uuid: str) -> Queue:
         """Get a queue by ID and tenant."""
@@ -50,6 +57,8 @@ class QueueService:
             setattr(queue, key, value)
         
         self.session.commit()
+        strategy_cache.invalidate(tenant_uuid, queue_id)
+        self._broadcast_change(queue_id)
         return queue
     
     def delete(self, queue_id: int, tenant_uuid: str) -> None:
@@ -57,6 +66,15 @@ class QueueService:
         queue = self.get(queue_id, tenant_uuid)
         self.session.delete(queue)
         self.session.commit()
+        strategy_cache.invalidate(tenant_uuid, queue_id)
+        availability_index.invalidate(queue_id)
+        precomputed_candidates.invalidate(queue_id)
+        self._broadcast_change(queue_id)
+    
+    def _broadcast_change(self, queue_id: int) -> None:
+        """Bump a queue's version so every worker drops what it cached for the queue."""
+        if self.redis is not None:
+            queue_versions.bump(self.redis, [queue_id])
     
     def _validate_strategy(self, strategy: str) -> None:
         """Validate queue strategy."""
@@ -65,18 +83,28 @@ class QueueService:
             raise InvalidQueueStrategy(f"Invalid strategy: {strategy}. Must be one of: {', '.join(valid_strategies)}")
     
     def get_queue_stats(self, queue_id: int, tenant_uuid: str) -> Dict:
-        """Get real-time statistics for a queue."""
+        """Get real-time statistics for a queue.
+        
+        The service level covers the default window of ``RealtimeMetrics``;
+        abandoned calls are counted since the queue's metrics were created.
+        """
         queue = self.get(queue_id, tenant_uuid)
-        # TODO: Implement real-time stats collection
+        
+        waiting = {'calls_waiting': 0, 'longest_wait': 0}
+        metrics = {}
+        if self.redis is not None:
+            waiting = WaitingCallers(self.redis, queue.id).summary()
+            metrics = RealtimeMetrics(self.redis).get_queue_metrics(queue.id, queue.service_level or 0)
+        
         return {
             'queue_id': queue.id,
             'name': queue.name,
-            'calls_waiting': 0,
-            'longest_wait': 0,
-            'agents_logged': 0,
-            'agents_available': 0,
-            'service_level': 0,
-            'abandoned_calls': 0
+            'calls_waiting': waiting['calls_waiting'],
+            'longest_wait': waiting['longest_wait'],
+            'agents_logged': metrics.get('agents_logged', 0),
+            'agents_available': len(availability_index.get_available(queue.id, self.session)),
+            'service_level': metrics.get('service_level', 0),
+            'abandoned_calls': metrics.get('abandoned_calls', 0)
         }
     
     def update_overflow_settings(self, queue_id: int, tenant_uuid: str,
@@ -93,4 +121,6 @@ class QueueService:
         
         queue.overflow_timeout = overflow_timeout
         self.session.commit()
+        strategy_cache.invalidate(tenant_uuid, queue_id)
+        self._broadcast_change(queue_id)
         return queue
@@ -3,14 +3,68 @@
 from typing import List, Dict, Optional, Tuple
 from datetime import datetime, timedelta
 import json
-from sqlalchemy import func, and_, or_
-from sqlalchemy.orm import Session
+from sqlalchemy import DateTime, func, and_, or_, case, literal_column, select, type_coerce
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.orm import Session, aliased
 from ..models import (
     Report, QueueStats, AgentStats, CallStats,
-    Queue, Agent, QueueMetrics, AgentMetrics
+    Queue, Agent, QueueMetrics, AgentMetrics, RollupWatermark
 )
 from ..exceptions import QueueNotFound, AgentNotFound
 
+# Aggregation intervals: window aggregated per run and date_trunc unit
+AGGREGATION_INTERVALS = {
+    '1hour': (timedelta(hours=1), 'hour'),
+    '1day': (timedelta(days=1), 'day')
+}
+UPSERT_BATCH_SIZE = 1000  # rows per INSERT ... ON CONFLICT statement
+
+# Rollup levels, finest first, and their bucket length
+ROLLUP_INTERVALS = (
+    ('1min', timedelta(minutes=1)),
+    ('5min', timedelta(minutes=5)),
+    ('1hour', timedelta(hours=1)),
+    ('1day', timedelta(days=1))
+)
+DEFAULT_ROLLUP_DELAY = timedelta(seconds=30)  # time given to a minute's snapshots to land
+MAX_ROLLUP_SPAN = timedelta(days=1)  # time a level rolls up per run, so a backfill spreads over runs
+
+# Rolled-up statistics: stats model, entity column and metrics model
+ROLLUP_STATS = {
+    'queue': (QueueStats, 'queue_id', QueueMetrics),
+    'agent': (AgentStats, 'agent_id', AgentMetrics)
+}
+
+# How each aggregated column combines when buckets roll up
+ROLLUP_COLUMNS = {
+    'queue': {
+        'total_calls': 'sum',
+        'answered_calls': 'sum',
+        'abandoned_calls': 'sum',
+        'samples': 'sum',
+        'average_wait_time': 'avg',
+        'average_talk_time': 'avg',
+        'max_wait_time': 'max',
+        'service_level_ratio': 'avg'
+    },
+    'agent': {
+        'total_calls': 'sum',
+        'answered_calls': 'sum',
+        'samples': 'sum',
+        'average_talk_time': 'avg',
+        'average_wrap_up_time': 'avg',
+        'occupancy_rate': 'avg'
+    }
+}
+
+# Cumulative counters of the metrics snapshots, aggregated as increments
+SNAPSHOT_COUNTERS = {
+    QueueMetrics: ('answered_calls', 'abandoned_calls'),
+    AgentMetrics: ('calls_taken',)
+}
+
+EPOCH = datetime(1970, 1, 1)
+
 class ReportingService:
     """Service for managing reports and analytics."""
     
@@ -219,110 +273,271 @@ class ReportingService:
         return result
     
     def aggregate_queue_stats(self, tenant_uuid: str,
-                            interval: str = '1hour') -> None:
-        """Aggregate queue metrics into statistics."""
-        now = datetime.utcnow()
-        
-        if interval == '1hour':
-            start_time = now - timedelta(hours=1)
-            truncate = func.date_trunc('hour', QueueMetrics.timestamp)
-        elif interval == '1day':
-            start_time = now - timedelta(days=1)
-            truncate = func.date_trunc('day', QueueMetrics.timestamp)
-        else:
-            raise ValueError(f"Unsupported interval: {interval}")
+                            interval: str = '1hour') -> int:
+        """Aggregate queue metrics into statistics and return the rows written.
+        
+        Every queue of the tenant is aggregated by one grouped query and the
+        rows are upserted on (queue, bucket, interval), so re-running a
+        window updates its rows instead of duplicating them.
+        """
+        start_time, unit = self._aggregation_window(interval)
+        rows = self._aggregate_queue_metrics(
+            interval,
+            func.date_trunc(unit, QueueMetrics.timestamp, type_=DateTime),
+            start_time,
+            QueueMetrics.tenant_uuid == tenant_uuid
+        )
+        self._upsert_stats(QueueStats, rows, ('queue_id', 'timestamp', 'interval'))
+        self.session.commit()
+        return len(rows)
+    
+    def aggregate_agent_stats(self, tenant_uuid: str,
+                            interval: str = '1hour') -> int:
+        """Aggregate agent metrics into statistics and return the rows written.
+        
+        Like ``aggregate_queue_stats``, with one grouped query for every
+        agent of the tenant and an upsert on (agent, bucket, interval).
+        """
+        start_time, unit = self._aggregation_window(interval)
+        rows = self._aggregate_agent_metrics(
+            interval,
+            func.date_trunc(unit, AgentMetrics.timestamp, type_=DateTime),
+            start_time,
+            AgentMetrics.tenant_uuid == tenant_uuid
+        )
+        self._upsert_stats(AgentStats, rows, ('agent_id', 'timestamp', 'interval'))
+        self.session.commit()
+        return len(rows)
+    
+    def rollup_stats(self, now: Optional[datetime] = None,
+                     delay: timedelta = DEFAULT_ROLLUP_DELAY) -> Dict[str, int]:
+        """Roll up the buckets finalized since the last run and return the rows written per level.
+        
+        1min statistics are aggregated from the metrics snapshots and each
+        coarser level only from the finalized buckets of the level below.
+        Every level keeps the end of the last bucket it rolled up as its
+        watermark, so a run reads only new buckets and never rolls up a
+        bucket before the level below has finished it. Snapshots are given
+        ``delay`` to land before their minute is finalized. A level rolls
+        up at most ``MAX_ROLLUP_SPAN`` per run, and at least one bucket, so
+        the first runs over a long history backfill every level a day at a
+        time: 1440 buckets of 1min, 288 of 5min, 24 of 1hour and 1 of 1day.
+        """
+        now = now or datetime.utcnow()
+        written = {}
+        
+        for stats in ROLLUP_STATS:
+            source_interval, source_end = None, now - delay
+            for interval, length in ROLLUP_INTERVALS:
+                written[f"{stats}:{interval}"], source_end = self._rollup_level(
+                    stats, interval, length, source_interval, source_end
+                )
+                source_interval = interval
         
-        # Get all queues
-        queues = self.session.query(Queue).filter(
-            Queue.tenant_uuid == tenant_uuid
-        ).all()
+        return written
+    
+    def _rollup_level(self, stats: str, interval: str, length: timedelta,
+                      source_interval: Optional[str],
+                      source_end: Optional[datetime]) -> Tuple[int, Optional[datetime]]:
+        """Roll up the buckets of a level that its source has finalized.
+        
+        ``source_end`` is where the finalized source data ends: the snapshot
+        cutoff for 1min, otherwise the watermark of the level below. Returns
+        the rows written and the level's watermark. Rows and watermark are
+        committed together, so a failed run starts again from the same point.
+        At most ``MAX_ROLLUP_SPAN`` is rolled up, or one bucket if longer.
+        """
+        model, entity, metrics = ROLLUP_STATS[stats]
+        watermark = self.session.query(RollupWatermark).filter(
+            RollupWatermark.stats == stats,
+            RollupWatermark.interval == interval
+        ).first()
         
-        for queue in queues:
-            # Aggregate metrics
-            metrics = self.session.query(
-                func.count().label('total_calls'),
-                func.sum(QueueMetrics.answered_calls).label('answered_calls'),
-                func.sum(QueueMetrics.abandoned_calls).label('abandoned_calls'),
-                func.avg(QueueMetrics.average_wait).label('average_wait_time'),
-                func.avg(QueueMetrics.average_talk).label('average_talk_time'),
-                func.max(QueueMetrics.longest_wait).label('max_wait_time'),
-                func.avg(QueueMetrics.service_level).label('service_level_ratio')
-            ).filter(
-                QueueMetrics.queue_id == queue.id,
-                QueueMetrics.tenant_uuid == tenant_uuid,
-                QueueMetrics.timestamp >= start_time
-            ).group_by(
-                truncate
-            ).all()
-            
-            # Create stats records
-            for metric in metrics:
-                stats = QueueStats(
-                    tenant_uuid=tenant_uuid,
-                    queue_id=queue.id,
-                    interval=interval,
-                    total_calls=metric.total_calls,
-                    answered_calls=metric.answered_calls,
-                    abandoned_calls=metric.abandoned_calls,
-                    average_wait_time=metric.average_wait_time,
-                    average_talk_time=metric.average_talk_time,
-                    max_wait_time=metric.max_wait_time,
-                    service_level_ratio=metric.service_level_ratio
-                )
-                self.session.add(stats)
+        start = watermark.watermark if watermark else self._first_bucket(stats, source_interval, length)
+        end = _floor(source_end, length) if source_end else None
+        if start is None or end is None or start >= end:
+            return 0, watermark.watermark if watermark else None
+        end = min(end, start + max(MAX_ROLLUP_SPAN // length, 1) * length)
         
+        if source_interval is None:
+            aggregate = self._aggregate_queue_metrics if stats == 'queue' else self._aggregate_agent_metrics
+            rows = aggregate(interval, _bucket(metrics.timestamp, interval), start, metrics.timestamp < end)
+        else:
+            rows = self._combine_stats(stats, source_interval, interval, start, end)
+        self._upsert_stats(model, rows, (entity, 'timestamp', 'interval'))
+        
+        if watermark is None:
+            watermark = RollupWatermark(stats=stats, interval=interval)
+            self.session.add(watermark)
+        watermark.watermark = end
         self.session.commit()
+        return len(rows), end
     
-    def aggregate_agent_stats(self, tenant_uuid: str,
-                            interval: str = '1hour') -> None:
-        """Aggregate agent metrics into statistics."""
-        now = datetime.utcnow()
-        
-        if interval == '1hour':
-            start_time = now - timedelta(hours=1)
-            truncate = func.date_trunc('hour', AgentMetrics.timestamp)
-        elif interval == '1day':
-            start_time = now - timedelta(days=1)
-            truncate = func.date_trunc('day', AgentMetrics.timestamp)
+    def _first_bucket(self, stats: str, source_interval: Optional[str],
+                      length: timedelta) -> Optional[datetime]:
+        """Get the start of a level's first bucket from the oldest data of its source."""
+        model, _, metrics = ROLLUP_STATS[stats]
+        if source_interval is None:
+            oldest = self.session.query(func.min(metrics.timestamp)).scalar()
         else:
-            raise ValueError(f"Unsupported interval: {interval}")
+            oldest = self.session.query(func.min(model.timestamp)).filter(
+                model.interval == source_interval
+            ).scalar()
+        return _floor(oldest, length) if oldest else None
+    
+    def _combine_stats(self, stats: str, source_interval: str, interval: str,
+                       start: datetime, end: datetime) -> List[Dict]:
+        """Aggregate a level's rows into the coarser buckets of ``interval``.
+        
+        Counts add up, maxima keep the largest and averages are weighted by
+        the snapshots each row covers (its samples), so every level holds
+        what aggregating the snapshots directly would give.
+        """
+        model, entity, _ = ROLLUP_STATS[stats]
+        bucket = _bucket(model.timestamp, interval)
+        
+        columns = []
+        for column, combine in ROLLUP_COLUMNS[stats].items():
+            value = getattr(model, column)
+            if combine == 'sum':
+                columns.append(func.sum(value).label(column))
+            elif combine == 'max':
+                columns.append(func.max(value).label(column))
+            else:
+                columns.append((func.sum(value * model.samples)
+                                / func.nullif(func.sum(model.samples), 0)).label(column))
+        
+        combined = self.session.query(
+            model.tenant_uuid,
+            getattr(model, entity),
+            bucket.label('bucket'),
+            *columns
+        ).filter(
+            model.interval == source_interval,
+            model.timestamp >= start,
+            model.timestamp < end
+        ).group_by(
+            model.tenant_uuid,
+            getattr(model, entity),
+            bucket
+        ).all()
         
-        # Get all agents
-        agents = self.session.query(Agent).filter(
-            Agent.tenant_uuid == tenant_uuid
+        rows = []
+        for row in combined:
+            row = row._asdict()
+            row['timestamp'] = row.pop('bucket')
+            row['interval'] = interval
+            rows.append(row)
+        return rows
+    
+    def _aggregate_queue_metrics(self, interval: str, bucket, start: datetime, *criteria) -> List[Dict]:
+        """Aggregate the queue metrics from ``start`` matching ``criteria`` into one stats row per queue and bucket.
+        
+        Answered and abandoned calls are the increments of the counters
+        over the bucket; see ``snapshot_increments``. Total calls are both
+        together and samples the snapshots aggregated.
+        """
+        snapshots = snapshot_increments(QueueMetrics, 'queue_id', start, *criteria, bucket=bucket)
+        metrics = self.session.query(
+            snapshots.c.tenant_uuid,
+            snapshots.c.queue_id,
+            snapshots.c.bucket,
+            func.count().label('samples'),
+            func.sum(snapshots.c.answered_calls).label('answered_calls'),
+            func.sum(snapshots.c.abandoned_calls).label('abandoned_calls'),
+            func.avg(snapshots.c.average_wait).label('average_wait_time'),
+            func.avg(snapshots.c.average_talk).label('average_talk_time'),
+            func.max(snapshots.c.longest_wait).label('max_wait_time'),
+            func.avg(snapshots.c.service_level).label('service_level_ratio')
+        ).group_by(
+            snapshots.c.tenant_uuid,
+            snapshots.c.queue_id,
+            snapshots.c.bucket
         ).all()
         
-        for agent in agents:
-            # Aggregate metrics
-            metrics = self.session.query(
-                func.count().label('total_calls'),
-                func.sum(AgentMetrics.calls_taken).label('answered_calls'),
-                func.avg(AgentMetrics.average_talk_time).label('average_talk_time'),
-                func.avg(AgentMetrics.average_wrap_time).label('average_wrap_up_time'),
-                func.avg(AgentMetrics.occupancy_rate).label('occupancy_rate')
-            ).filter(
-                AgentMetrics.agent_id == agent.id,
-                AgentMetrics.tenant_uuid == tenant_uuid,
-                AgentMetrics.timestamp >= start_time
-            ).group_by(
-                truncate
-            ).all()
-            
-            # Create stats records
-            for metric in metrics:
-                stats = AgentStats(
-                    tenant_uuid=tenant_uuid,
-                    agent_id=agent.id,
-                    interval=interval,
-                    total_calls=metric.total_calls,
-                    answered_calls=metric.answered_calls,
-                    average_talk_time=metric.average_talk_time,
-                    average_wrap_up_time=metric.average_wrap_up_time,
-                    occupancy_rate=metric.occupancy_rate
-                )
-                self.session.add(stats)
+        return [
+            {
+                'tenant_uuid': metric.tenant_uuid,
+                'queue_id': metric.queue_id,
+                'timestamp': metric.bucket,
+                'interval': interval,
+                'total_calls': (metric.answered_calls or 0) + (metric.abandoned_calls or 0),
+                'answered_calls': metric.answered_calls,
+                'abandoned_calls': metric.abandoned_calls,
+                'samples': metric.samples,
+                'average_wait_time': metric.average_wait_time,
+                'average_talk_time': metric.average_talk_time,
+                'max_wait_time': metric.max_wait_time,
+                'service_level_ratio': metric.service_level_ratio
+            }
+            for metric in metrics
+        ]
+    
+    def _aggregate_agent_metrics(self, interval: str, bucket, start: datetime, *criteria) -> List[Dict]:
+        """Aggregate the agent metrics from ``start`` matching ``criteria`` into one stats row per agent and bucket.
+        
+        Answered calls, and total calls with them, are the increments of
+        ``calls_taken`` over the bucket; samples are the snapshots aggregated.
+        """
+        snapshots = snapshot_increments(AgentMetrics, 'agent_id', start, *criteria, bucket=bucket)
+        metrics = self.session.query(
+            snapshots.c.tenant_uuid,
+            snapshots.c.agent_id,
+            snapshots.c.bucket,
+            func.count().label('samples'),
+            func.sum(snapshots.c.calls_taken).label('answered_calls'),
+            func.avg(snapshots.c.average_talk_time).label('average_talk_time'),
+            func.avg(snapshots.c.average_wrap_time).label('average_wrap_up_time'),
+            func.avg(snapshots.c.occupancy_rate).label('occupancy_rate')
+        ).group_by(
+            snapshots.c.tenant_uuid,
+            snapshots.c.agent_id,
+            snapshots.c.bucket
+        ).all()
         
-        self.session.commit()
+        return [
+            {
+                'tenant_uuid': metric.tenant_uuid,
+                'agent_id': metric.agent_id,
+                'timestamp': metric.bucket,
+                'interval': interval,
+                'total_calls': metric.answered_calls,
+                'answered_calls': metric.answered_calls,
+                'samples': metric.samples,
+                'average_talk_time': metric.average_talk_time,
+                'average_wrap_up_time': metric.average_wrap_up_time,
+                'occupancy_rate': metric.occupancy_rate
+            }
+            for metric in metrics
+        ]
+    
+    @staticmethod
+    def _aggregation_window(interval: str) -> Tuple[datetime, str]:
+        """Get the start of the window aggregated for an interval and its date_trunc unit.
+        
+        The window starts on a bucket boundary so its oldest bucket is
+        aggregated whole and never overwrites a complete row with part of it.
+        """
+        if interval not in AGGREGATION_INTERVALS:
+            raise ValueError(f"Unsupported interval: {interval}")
+        
+        length, unit = AGGREGATION_INTERVALS[interval]
+        start_time = datetime.utcnow() - length
+        if unit == 'hour':
+            start_time = start_time.replace(minute=0, second=0, microsecond=0)
+        else:
+            start_time = start_time.replace(hour=0, minute=0, second=0, microsecond=0)
+        return start_time, unit
+    
+    def _upsert_stats(self, model, rows: List[Dict], keys: Tuple[str, ...]) -> None:
+        """Insert statistics rows, updating the ones whose keys already exist."""
+        for offset in range(0, len(rows), UPSERT_BATCH_SIZE):
+            statement = insert(model).values(rows[offset:offset + UPSERT_BATCH_SIZE])
+            statement = statement.on_conflict_do_update(
+                index_elements=list(keys),
+                set_={column: statement.excluded[column] for column in rows[0] if column not in keys}
+            )
+            self.session.execute(statement)
     
     def record_call_stats(self, tenant_uuid: str, call_data: Dict) -> CallStats:
         """Record statistics for a completed call."""
@@ -330,3 +545,48 @@ class ReportingService:
         self.session.add(stats)
         self.session.commit()
         return stats
+
+def snapshot_increments(metrics, entity: str, start: datetime, *criteria, bucket=None):
+    """Subquery of the metrics snapshots from ``start`` matching ``criteria``
+    with their cumulative counters turned into increments.
+    
+    Each counter in ``SNAPSHOT_COUNTERS`` becomes what it grew by since the
+    entity's previous snapshot, however long before ``start`` it was taken,
+    so summing a counter over any range of snapshots counts each call once.
+    A counter that went down was reset and counts from zero; an entity's
+    first snapshot counts nothing. ``bucket``, an expression over the
+    snapshot timestamp, adds a ``bucket`` column.
+    """
+    counters = SNAPSHOT_COUNTERS[metrics]
+    entity_column = getattr(metrics, entity)
+    earlier = aliased(metrics)
+    columns = [column for column in metrics.__table__.columns if column.name not in counters]
+    for counter in counters:
+        value = getattr(metrics, counter)
+        # The entity's last snapshot before the window, only looked up
+        # for its first snapshot in the window
+        before = select(getattr(earlier, counter)).where(
+            getattr(earlier, entity) == entity_column,
+            earlier.timestamp < start
+        ).order_by(earlier.timestamp.desc()).limit(1).scalar_subquery()
+        previous = func.lag(value).over(partition_by=entity_column, order_by=metrics.timestamp)
+        increment = value - func.coalesce(previous, before, value)
+        columns.append(case((increment < 0, value), else_=increment).label(counter))
+    if bucket is not None:
+        columns.append(bucket.label('bucket'))
+    
+    return select(*columns).where(metrics.timestamp >= start, *criteria).subquery()
+
+def _floor(timestamp: datetime, length: timedelta) -> datetime:
+    """Get the start of the bucket of ``length`` holding a timestamp."""
+    return timestamp - (timestamp - EPOCH) % length
+
+def _bucket(column, interval: str):
+    """SQL expression of the start of the ``interval`` bucket holding a timestamp column."""
+    if interval == '5min':
+        # date_trunc has no 5-minute unit: add whole 5-minute steps to the hour
+        steps = func.floor(func.date_part('minute', column) / 5)
+        return type_coerce(func.date_trunc('hour', column) + steps * literal_column("interval '5 minutes'"),
+                           DateTime)
+    unit = {'1min': 'minute', '1hour': 'hour', '1day': 'day'}[interval]
+    return func.date_trunc(unit, column, type_=DateTime)
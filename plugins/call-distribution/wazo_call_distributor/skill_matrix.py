@@ -0,0 +1,177 @@
+"""Agent skill matrix for skills-based routing."""
+
+import itertools
+import threading
+import time
+from typing import Dict, List, Optional, Sequence, Tuple
+import numpy as np
+from sqlalchemy import event
+from sqlalchemy.orm import Session, object_session
+from .models import AgentSkill
+
+DEFAULT_REFRESH_INTERVAL = 300  # seconds before the matrix is reloaded from the database
+
+NO_SKILL = -1  # level stored for skills an agent does not have
+
+class SkillMatrix:
+    """Process-local agent x skill proficiency matrix.
+
+    Levels are kept in a dense int16 array with one row per agent and one
+    column per skill, so matching a set of requirements against thousands
+    of agents is a handful of vectorized comparisons.
+
+    The matrix is loaded lazily with a single query and kept up to date from
+    ``AgentSkill`` flushes in this process. Changes rolled back after a flush
+    drop the matrix, and ``refresh_interval`` bounds staleness for changes
+    made by other workers.
+    """
+
+    def __init__(self, refresh_interval: int = DEFAULT_REFRESH_INTERVAL):
+        self.refresh_interval = refresh_interval
+        self._lock = threading.Lock()
+        self._rows: Dict[int, int] = {}
+        self._columns: Dict[int, int] = {}
+        self._levels = np.full((0, 0), NO_SKILL, dtype=np.int16)
+        self._loaded_at: Optional[float] = None
+
+    def configure(self, refresh_interval: Optional[int] = None) -> None:
+        """Apply plugin configuration."""
+        if refresh_interval is not None:
+            self.refresh_interval = refresh_interval
+
+    def match(self, agent_ids: Sequence[int], requirements: List[Tuple[int, int]],
+              session=None) -> List[int]:
+        """Get the agents meeting every minimum skill level, best first.
+
+        Agents are ranked by the sum of their levels on the required skills;
+        ties keep the order of ``agent_ids``. With no requirements every
+        agent matches.
+        """
+        if not requirements:
+            return list(agent_ids)
+
+        self._ensure_loaded(session)
+
+        with self._lock:
+            columns = [self._columns.get(skill_id) for skill_id, _ in requirements]
+            if not agent_ids or None in columns:
+                return []
+
+            rows = np.fromiter(map(self._rows.get, agent_ids, itertools.repeat(-1)),
+                               dtype=np.intp, count=len(agent_ids))
+            known = np.flatnonzero(rows >= 0)
+            levels = self._levels[rows[known]][:, columns]
+
+        min_levels = np.array([max(min_level, 0) for _, min_level in requirements], dtype=np.int16)
+        qualified = (levels >= min_levels).all(axis=1)
+        scores = levels[qualified].sum(axis=1, dtype=np.int32)
+        ranking = np.argsort(-scores, kind='stable')
+
+        return [agent_ids[i] for i in known[qualified][ranking].tolist()]
+
+    def set_level(self, agent_id: int, skill_id: int, level: int) -> None:
+        """Set an agent's level for a skill."""
+        with self._lock:
+            if self._loaded_at is None:
+                return
+            row, column = self._row(agent_id), self._column(skill_id)
+            self._levels[row, column] = level
+
+    def remove(self, agent_id: int, skill_id: int) -> None:
+        """Remove a skill from an agent."""
+        with self._lock:
+            row = self._rows.get(agent_id)
+            column = self._columns.get(skill_id)
+            if row is not None and column is not None:
+                self._levels[row, column] = NO_SKILL
+
+    def invalidate(self) -> None:
+        """Drop the matrix so it is reloaded on next use."""
+        with self._lock:
+            self._loaded_at = None
+
+    def _ensure_loaded(self, session) -> None:
+        """Load the matrix if missing or stale and a session is available."""
+        loaded_at = self._loaded_at
+        if loaded_at is not None and time.monotonic() - loaded_at < self.refresh_interval:
+            return
+        if session is None:
+            if loaded_at is not None:
+                return
+            raise ValueError("Skill matrix is not loaded and no session was provided")
+        self._load(session)
+
+    def _load(self, session) -> None:
+        """Load every agent skill from the database."""
+        skills = session.query(AgentSkill.agent_id, AgentSkill.skill_id, AgentSkill.level).all()
+
+        agent_ids = np.array([s.agent_id for s in skills], dtype=np.int64)
+        skill_ids = np.array([s.skill_id for s in skills], dtype=np.int64)
+        unique_agents, rows = np.unique(agent_ids, return_inverse=True)
+        unique_skills, columns = np.unique(skill_ids, return_inverse=True)
+
+        levels = np.full((len(unique_agents), len(unique_skills)), NO_SKILL, dtype=np.int16)
+        levels[rows, columns] = [s.level or 0 for s in skills]
+
+        with self._lock:
+            self._rows = {int(agent_id): row for row, agent_id in enumerate(unique_agents)}
+            self._columns = {int(skill_id): column for column, skill_id in enumerate(unique_skills)}
+            self._levels = levels
+            self._loaded_at = time.monotonic()
+
+    def _row(self, agent_id: int) -> int:
+        """Get the row of an agent, adding one if needed; lock must be held."""
+        row = self._rows.get(agent_id)
+        if row is None:
+            row = self._rows[agent_id] = len(self._rows)
+            if row >= self._levels.shape[0]:
+                self._grow(rows=max(row * 2, 16))
+        return row
+
+    def _column(self, skill_id: int) -> int:
+        """Get the column of a skill, adding one if needed; lock must be held."""
+        column = self._columns.get(skill_id)
+        if column is None:
+            column = self._columns[skill_id] = len(self._columns)
+            if column >= self._levels.shape[1]:
+                self._grow(columns=max(column * 2, 8))
+        return column
+
+    def _grow(self, rows: Optional[int] = None, columns: Optional[int] = None) -> None:
+        """Reallocate the level array with more capacity; lock must be held."""
+        current_rows, current_columns = self._levels.shape
+        levels = np.full((rows or current_rows, columns or current_columns), NO_SKILL, dtype=np.int16)
+        levels[:current_rows, :current_columns] = self._levels
+        self._levels = levels
+
+skill_matrix = SkillMatrix()
+
+@event.listens_for(AgentSkill, 'after_insert')
+@event.listens_for(AgentSkill, 'after_update')
+def _on_agent_skill_saved(mapper, connection, target):
+    """Apply a flushed agent skill to the matrix."""
+    skill_matrix.set_level(target.agent_id, target.skill_id, target.level or 0)
+    _mark_dirty(target)
+
+@event.listens_for(AgentSkill, 'after_delete')
+def _on_agent_skill_deleted(mapper, connection, target):
+    """Remove a flushed agent skill deletion from the matrix."""
+    skill_matrix.remove(target.agent_id, target.skill_id)
+    _mark_dirty(target)
+
+def _mark_dirty(target) -> None:
+    """Remember that the target's session changed the matrix before commit."""
+    session = object_session(target)
+    if session is not None:
+        session.info['skill_matrix_dirty'] = True
+
+@event.listens_for(Session, 'after_commit')
+def _on_commit(session):
+    """Forget flushed changes once they are committed."""
+    session.info.pop('skill_matrix_dirty', None)
+
+@event.listens_for(Session, 'after_rollback')
+def _on_rollback(session):
+    """Drop the matrix if changes applied on flush were rolled back."""
+    if session.info.pop('skill_matrix_dirty', None):
+        skill_matrix.invalidate()
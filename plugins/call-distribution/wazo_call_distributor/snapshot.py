@@ -0,0 +1,204 @@
+"""Periodic snapshots of the real-time metrics into the metrics tables."""
+
+import json
+import logging
+import threading
+import time
+from datetime import datetime
+from itertools import islice
+from typing import Dict, Iterator, List, Optional
+
+from .models import QueueMetrics, AgentMetrics, Queue, Agent
+from .realtime import RealtimeMetrics
+from .ticks import TickLock
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SNAPSHOT_INTERVAL = 60  # seconds between snapshots
+DEFAULT_SNAPSHOT_BATCH_SIZE = 1000  # hashes read per pipeline
+
+class MetricsSnapshotter:
+    """Copies the live metrics of every queue and agent with a
+    ``queue_metrics:*`` or ``agent_metrics:*`` hash to ``QueueMetrics`` and
+    ``AgentMetrics`` rows from a worker thread.
+
+    Keys are found with SCAN and read ``batch_size`` at a time through one
+    pipeline; the owning tenants of each batch come from one query. All
+    rows of a tick share its timestamp and are inserted in bulk and
+    committed once, so a tick over tens of thousands of entities costs a
+    few round trips per thousand of them. Every worker process runs the
+    timer, and a ``TickLock`` lets one of them take each snapshot.
+    """
+
+    def __init__(self):
+        self.interval = DEFAULT_SNAPSHOT_INTERVAL
+        self.batch_size = DEFAULT_SNAPSHOT_BATCH_SIZE
+        self._session_factory = None
+        self._redis = None
+        self._thread: Optional[threading.Thread] = None
+        self._stopping = threading.Event()
+
+    @property
+    def running(self) -> bool:
+        """Check whether the worker thread is running."""
+        return self._thread is not None and self._thread.is_alive()
+
+    def configure(self, interval: Optional[float] = None, batch_size: Optional[int] = None) -> None:
+        """Apply plugin configuration."""
+        if interval is not None:
+            self.interval = interval
+        if batch_size is not None:
+            self.batch_size = batch_size
+
+    def start(self, session_factory, redis_client) -> None:
+        """Start the worker thread."""
+        if self.running:
+            return
+
+        self._session_factory = session_factory
+        self._redis = redis_client
+        self._stopping.clear()
+        self._thread = threading.Thread(target=self._run, name='call-distributor-snapshot', daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: Optional[float] = None) -> None:
+        """Stop the worker thread."""
+        if self._thread is None:
+            return
+
+        self._stopping.set()
+        self._thread.join(timeout)
+        self._thread = None
+
+    def snapshot(self, session, redis_client, timestamp: Optional[datetime] = None) -> Dict[str, int]:
+        """Write one row per live queue and agent and return the row counts."""
+        timestamp = timestamp or datetime.utcnow()
+        counts = {
+            'queues': self._snapshot_queues(session, redis_client, timestamp),
+            'agents': self._snapshot_agents(session, redis_client, timestamp)
+        }
+        session.commit()
+        return counts
+
+    def _run(self) -> None:
+        """Take a snapshot every interval until stopped."""
+        lock = TickLock(self._redis, 'snapshot')
+        while not self._stopping.wait(self.interval):
+            started = time.monotonic()
+            session = self._session_factory()
+            try:
+                if not lock.acquire(self.interval):
+                    continue
+                counts = self.snapshot(session, self._redis)
+                logger.debug("Snapshot of %d queues and %d agents took %.2fs",
+                             counts['queues'], counts['agents'], time.monotonic() - started)
+            except Exception:
+                session.rollback()
+                logger.exception("Failed to snapshot real-time metrics")
+            finally:
+                session.close()
+
+    def _snapshot_queues(self, session, redis_client, timestamp: datetime) -> int:
+        """Insert a QueueMetrics row for every live queue.
+
+        Rows hold what ``RealtimeMetrics.get_queue_metrics`` serves, so the
+        service level and averages come from the default sliding window
+        rather than the raw counters hash.
+        """
+        columns = _metric_columns(QueueMetrics)
+        realtime = RealtimeMetrics(redis_client)
+        now = time.time()
+        inserted = 0
+
+        for queue_ids in self._scan_ids(redis_client, RealtimeMetrics.queue_key('*')):
+            pipe = redis_client.pipeline(transaction=False)
+            reads = 0
+            for queue_id in queue_ids:
+                reads = realtime.read_queue_metrics(queue_id, pipe, now)
+            results = pipe.execute()
+
+            queues = {
+                queue_id: (tenant_uuid, service_level)
+                for queue_id, tenant_uuid, service_level in session.query(
+                    Queue.id, Queue.tenant_uuid, Queue.service_level
+                ).filter(Queue.id.in_(queue_ids))
+            }
+            rows = []
+            for index, queue_id in enumerate(queue_ids):
+                if queue_id not in queues:
+                    continue
+                tenant_uuid, service_level = queues[queue_id]
+                metrics = realtime.parse_queue_metrics(results[index * reads:(index + 1) * reads],
+                                                       service_level or 0, now)
+                if not metrics:
+                    continue
+                row = {key: value for key, value in metrics.items() if key in columns}
+                row.update(tenant_uuid=tenant_uuid, queue_id=queue_id, timestamp=timestamp)
+                rows.append(row)
+
+            session.bulk_insert_mappings(QueueMetrics, rows)
+            inserted += len(rows)
+
+        return inserted
+
+    def _snapshot_agents(self, session, redis_client, timestamp: datetime) -> int:
+        """Insert an AgentMetrics row for every live agent."""
+        columns = _metric_columns(AgentMetrics)
+        inserted = 0
+
+        for agent_ids in self._scan_ids(redis_client, RealtimeMetrics.agent_key('*')):
+            pipe = redis_client.pipeline(transaction=False)
+            for agent_id in agent_ids:
+                pipe.hgetall(RealtimeMetrics.agent_key(agent_id))
+            results = pipe.execute()
+
+            tenants = dict(session.query(Agent.id, Agent.tenant_uuid).filter(Agent.id.in_(agent_ids)))
+            rows = []
+            for agent_id, metrics in zip(agent_ids, results):
+                if agent_id not in tenants:
+                    continue
+                row = _decode(metrics, columns)
+                row.update(tenant_uuid=tenants[agent_id], agent_id=agent_id, timestamp=timestamp)
+                rows.append(row)
+
+            session.bulk_insert_mappings(AgentMetrics, rows)
+            inserted += len(rows)
+
+        return inserted
+
+    def _scan_ids(self, redis_client, pattern: str) -> Iterator[List[int]]:
+        """Yield the entity ids of keys matching a pattern, ``batch_size`` at a time."""
+        prefix_length = len(pattern) - 1
+        ids = (key.decode()[prefix_length:] for key in redis_client.scan_iter(match=pattern, count=self.batch_size))
+        ids = (int(entity_id) for entity_id in ids if entity_id.isdigit())
+
+        # SCAN may return a key more than once; a tick writes one row per entity
+        seen = set()
+        while True:
+            chunk = list(islice(ids, self.batch_size))
+            if not chunk:
+                return
+            batch = [entity_id for entity_id in dict.fromkeys(chunk) if entity_id not in seen]
+            seen.update(batch)
+            if batch:
+                yield batch
+
+def _metric_columns(model) -> set:
+    """Get the metric columns of a metrics model."""
+    return set(model.__table__.columns.keys()) - {'id', 'tenant_uuid', 'queue_id', 'agent_id', 'timestamp'}
+
+def _decode(metrics: Dict[bytes, bytes], columns: set) -> Dict:
+    """Decode the JSON values of a metrics hash, keeping model columns only."""
+    row = {}
+    for key, value in metrics.items():
+        key = key.decode()
+        if key not in columns:
+            continue
+        try:
+            row[key] = json.loads(value)
+        except ValueError:
+            # States written before they were JSON-encoded
+            row[key] = value.decode()
+    return row
+
+metrics_snapshotter = MetricsSnapshotter()
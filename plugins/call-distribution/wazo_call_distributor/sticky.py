@@ -0,0 +1,124 @@
+"""Caller-to-agent affinity for sticky routing."""
+
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+DEFAULT_CACHE_SIZE = 10000  # callers kept in the local cache
+DEFAULT_LOCAL_TTL = 30  # seconds a cached affinity is trusted
+DEFAULT_NEGATIVE_TTL = 10  # seconds a caller or queue without affinity is remembered
+
+# Set a queue's affinity flag to expire in ARGV[1] seconds unless it already
+# outlives that; EXPIRE GT would do the same but needs Redis 7
+FLAG_SCRIPT = """
+local ttl = redis.call('ttl', KEYS[1])
+if ttl == -2 or (ttl >= 0 and ttl < tonumber(ARGV[1])) then
+    redis.call('set', KEYS[1], 1, 'ex', ARGV[1])
+end
+return ttl
+"""
+
+class StickyAgents:
+    """Sticky agents stored in Redis behind an in-process LRU cache.
+
+    Affinities live at ``queue:{queue_id}:sticky:{caller_id}`` with the
+    queue's TTL, and ``queue:{queue_id}:has_sticky`` lives as long as the
+    queue's longest affinity. Lookups are cached locally, for callers
+    without a sticky agent too. A queue whose flag is missing is remembered
+    as having no affinities, so every lookup in it, including first-time
+    callers, is a dictionary lookup. In a queue with affinities, a caller
+    not seen in the last ``negative_ttl`` seconds costs one Redis round
+    trip. An affinity set by another worker is seen after at most
+    ``negative_ttl`` seconds.
+    """
+
+    def __init__(self, size: int = DEFAULT_CACHE_SIZE, local_ttl: int = DEFAULT_LOCAL_TTL,
+                 negative_ttl: int = DEFAULT_NEGATIVE_TTL):
+        self.size = size
+        self.local_ttl = local_ttl
+        self.negative_ttl = negative_ttl
+        self._lock = threading.Lock()
+        self._cache: 'OrderedDict[Tuple[int, str], Tuple[float, Optional[int]]]' = OrderedDict()
+        self._queues: Dict[int, Tuple[float, bool]] = {}
+        self._flag = None
+
+    def configure(self, size: Optional[int] = None, local_ttl: Optional[int] = None,
+                  negative_ttl: Optional[int] = None) -> None:
+        """Apply plugin configuration."""
+        if size is not None:
+            self.size = size
+        if local_ttl is not None:
+            self.local_ttl = local_ttl
+        if negative_ttl is not None:
+            self.negative_ttl = negative_ttl
+
+    @staticmethod
+    def key(queue_id: int, caller_id: str) -> str:
+        """Get the Redis key of a caller's affinity."""
+        return f"queue:{queue_id}:sticky:{caller_id}"
+
+    @staticmethod
+    def flag_key(queue_id: int) -> str:
+        """Get the Redis key flagging a queue that has affinities."""
+        return f"queue:{queue_id}:has_sticky"
+
+    def get(self, redis_client, queue_id: int, caller_id: str) -> Optional[int]:
+        """Get the sticky agent id of a caller, if any."""
+        cache_key = (queue_id, caller_id)
+        now = time.monotonic()
+
+        entry = self._cache.get(cache_key)
+        if entry is not None and entry[0] > now:
+            with self._lock:
+                if cache_key in self._cache:
+                    self._cache.move_to_end(cache_key)
+            return entry[1]
+
+        flag = self._queues.get(queue_id)
+        if flag is not None and flag[0] > now and not flag[1]:
+            return None
+
+        if flag is None or flag[0] <= now:
+            pipe = redis_client.pipeline(transaction=False)
+            pipe.exists(self.flag_key(queue_id))
+            pipe.get(self.key(queue_id, caller_id))
+            active, agent_id = pipe.execute()
+            self._queues[queue_id] = (now + (self.local_ttl if active else self.negative_ttl), bool(active))
+        else:
+            agent_id = redis_client.get(self.key(queue_id, caller_id))
+
+        agent_id = int(agent_id) if agent_id is not None else None
+        self._store(cache_key, agent_id, now + (self.local_ttl if agent_id else self.negative_ttl))
+        return agent_id
+
+    def set(self, redis_client, queue_id: int, caller_id: str, agent_id: int, ttl: int) -> None:
+        """Make an agent sticky for a caller for ``ttl`` seconds."""
+        if self._flag is None:
+            self._flag = redis_client.register_script(FLAG_SCRIPT)
+
+        pipe = redis_client.pipeline(transaction=False)
+        pipe.set(self.key(queue_id, caller_id), agent_id, ex=ttl)
+        # Keep the flag until the queue's longest-lived affinity expires
+        self._flag(keys=[self.flag_key(queue_id)], args=[ttl], client=pipe)
+        pipe.execute()
+
+        now = time.monotonic()
+        self._queues[queue_id] = (now + self.local_ttl, True)
+        self._store((queue_id, caller_id), agent_id, now + min(ttl, self.local_ttl))
+
+    def clear(self) -> None:
+        """Drop every locally cached affinity."""
+        with self._lock:
+            self._cache.clear()
+            self._queues.clear()
+
+    def _store(self, cache_key: Tuple[int, str], agent_id: Optional[int], expires_at: float) -> None:
+        """Cache a lookup result, evicting the least recently used entries."""
+        with self._lock:
+            self._cache[cache_key] = (expires_at, agent_id)
+            self._cache.move_to_end(cache_key)
+            while len(self._cache) > self.size:
+                self._cache.popitem(last=False)
+
+sticky_agents = StickyAgents()
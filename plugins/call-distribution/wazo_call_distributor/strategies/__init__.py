@@ -7,6 +7,7 @@ from .fewestcalls import FewestCallsStrategy
 from .random import RandomStrategy
 from .rrmemory import RoundRobinMemoryStrategy
 from .linear import LinearStrategy
+from .precomputed import PrecomputedCandidates, precomputed_candidates
 
 __all__ = [
     'BaseStrategy',
@@ -15,7 +16,9 @@ __all__ = [
     'FewestCallsStrategy',
     'RandomStrategy',
     'RoundRobinMemoryStrategy',
-    'LinearStrategy'
+    'LinearStrategy',
+    'PrecomputedCandidates',
+    'precomputed_candidates'
 ]
 
 STRATEGY_MAPPING = {
@@ -1,44 +1,73 @@
 """Base strategy for queue distribution."""
 
+import bisect
 from abc import ABC, abstractmethod
-from typing import List, Optional
-from ..models import Queue, Agent, QueueMember
+from typing import Dict, Iterable, List, Optional, Set
+from ..models import Queue
+from ..availability import availability_index, IndexedAgent, IndexedMember
+from .stats import MemberStatsStore
 
 class BaseStrategy(ABC):
     """Base class for queue distribution strategies."""
     
-    def __init__(self, queue: Queue, session):
+    # Whether next-agent decisions can be computed ahead of calls
+    precomputable = True
+    
+    def __init__(self, queue: Queue, session, redis_client=None):
         """Initialize strategy."""
         self.queue = queue
         self.session = session
+        self.redis = redis_client
+        self.stats = MemberStatsStore(redis_client, queue.id)
     
     @abstractmethod
-    def get_next_agent(self, call_id: str) -> Optional[Agent]:
-        """Get the next agent to ring based on the strategy."""
+    def get_next_agent(self, call_id: str, exclude: Optional[Set[int]] = None) -> Optional[IndexedAgent]:
+        """Get the next agent to ring based on the strategy, skipping excluded agent ids."""
         pass
     
-    def get_available_members(self) -> List[QueueMember]:
-        """Get list of available queue members."""
-        return self.session.query(QueueMember).filter(
-            QueueMember.queue_id == self.queue.id,
-            QueueMember.is_available == True,
-            QueueMember.paused == False
-        ).all()
+    def get_available_members(self) -> List[IndexedMember]:
+        """Get list of available queue members, ordered by penalty then join order."""
+        return availability_index.get_available(self.queue.id, self.session)
+    
+    def get_candidate_members(self, exclude: Optional[Set[int]] = None) -> List[IndexedMember]:
+        """Get available members of the lowest penalty level, in join order."""
+        return availability_index.get_candidates(self.queue.id, self.session, exclude)
+    
+    def rank_candidates(self, members: List[IndexedMember]) -> List[IndexedMember]:
+        """Order available members the way successive calls would pick them."""
+        keys = self.rank_keys(members)
+        return sorted(members, key=lambda m: keys[m.agent_id])
+    
+    def rank_keys(self, members: List[IndexedMember]) -> Dict[int, tuple]:
+        """Get the sort key of each member by agent id; lower keys are picked first."""
+        return {m.agent_id: (m.penalty, m.id) for m in members}
+    
+    def rank_position(self, keys: List[tuple], key: tuple) -> int:
+        """Get where a member ranked ``key`` goes among members already ranked ``keys``."""
+        return bisect.bisect_right(keys, key)
     
-    def get_member_stats(self, member_id: int) -> dict:
+    def get_member_stats(self, agent_id: int) -> dict:
         """Get member statistics."""
-        # TODO: Implement stats collection from Redis
-        return {
-            'last_call_time': None,
-            'calls_taken': 0,
-            'total_talk_time': 0,
-            'average_talk_time': 0
-        }
-    
-    def update_member_stats(self, member_id: int, call_duration: int) -> None:
-        """Update member statistics after a call."""
-        # TODO: Implement stats update in Redis
-        pass
+        return self.stats.get(agent_id)
+    
+    def get_members_stats(self, agent_ids: Iterable[int]) -> Dict[int, dict]:
+        """Get statistics for several members in one round trip."""
+        return self.stats.get_many(agent_ids)
+    
+    def update_member_stats(self, agent_id: int, call_duration: int) -> None:
+        """Update member statistics and ranking after a call."""
+        member = availability_index.get_member(self.queue.id, agent_id, self.session)
+        self.stats.record_call(agent_id, call_duration,
+                               penalty=member.penalty if member else None)
+    
+    def select_ranked_member(self, candidates: List[IndexedMember], order: str) -> Optional[IndexedMember]:
+        """Select the best candidate from a per-penalty ranking set."""
+        # Only copy the member list when the queue was reloaded since it was ranked
+        generation = availability_index.get_generation(self.queue.id)
+        if generation is None or not self.stats.is_ranked(generation):
+            members = availability_index.get_members(self.queue.id, self.session)
+            self.stats.ensure_ranked(members, availability_index.get_generation(self.queue.id))
+        return self.stats.select(candidates, order)
     
     def log_distribution(self, call_id: str, member_id: int) -> None:
         """Log distribution decision for analytics."""
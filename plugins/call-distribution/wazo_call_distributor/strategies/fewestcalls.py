@@ -1,33 +1,27 @@
 """Fewest calls strategy implementation."""
 
-from typing import Optional
+from typing import Dict, List, Optional, Set
 from .base import BaseStrategy
-from ..models import Agent
+from .stats import RANK_CALLS_TAKEN
+from ..availability import IndexedAgent, IndexedMember
 
 class FewestCallsStrategy(BaseStrategy):
     """Ring agent who has taken the fewest calls."""
     
-    def get_next_agent(self, call_id: str) -> Optional[Agent]:
+    def get_next_agent(self, call_id: str, exclude: Optional[Set[int]] = None) -> Optional[IndexedAgent]:
         """Get the agent with the lowest number of calls taken."""
-        members = self.get_available_members()
+        members = self.get_candidate_members(exclude)
         
         if not members:
             return None
         
-        # Sort by penalty level first
-        members.sort(key=lambda x: x.penalty)
-        lowest_penalty = members[0].penalty
-        
-        # Filter members with lowest penalty
-        members = [m for m in members if m.penalty == lowest_penalty]
-        
-        # Get calls taken for each member
-        member_stats = [(m, self.get_member_stats(m.id)['calls_taken']) for m in members]
-        
-        # Sort by number of calls taken
-        member_stats.sort(key=lambda x: x[1])
-        
-        selected_member = member_stats[0][0]
-        self.log_distribution(call_id, selected_member.agent.id)
+        # Head of the calls-taken ranking set
+        selected_member = self.select_ranked_member(members, RANK_CALLS_TAKEN)
+        self.log_distribution(call_id, selected_member.agent_id)
         
         return selected_member.agent
+    
+    def rank_keys(self, members: List[IndexedMember]) -> Dict[int, tuple]:
+        """Rank members by penalty, then fewest calls taken first."""
+        stats = self.get_members_stats(m.agent_id for m in members)
+        return {m.agent_id: (m.penalty, stats[m.agent_id]['calls_taken']) for m in members}
@@ -1,33 +1,27 @@
 """Least recent strategy implementation."""
 
-from typing import Optional
+from typing import Dict, List, Optional, Set
 from .base import BaseStrategy
-from ..models import Agent
+from .stats import RANK_LAST_CALL
+from ..availability import IndexedAgent, IndexedMember
 
 class LeastRecentStrategy(BaseStrategy):
     """Ring agent who was least recently called."""
     
-    def get_next_agent(self, call_id: str) -> Optional[Agent]:
+    def get_next_agent(self, call_id: str, exclude: Optional[Set[int]] = None) -> Optional[IndexedAgent]:
         """Get the agent who hasn't taken a call for the longest time."""
-        members = self.get_available_members()
+        members = self.get_candidate_members(exclude)
         
         if not members:
             return None
         
-        # Sort by penalty level first
-        members.sort(key=lambda x: x.penalty)
-        lowest_penalty = members[0].penalty
-        
-        # Filter members with lowest penalty
-        members = [m for m in members if m.penalty == lowest_penalty]
-        
-        # Get last call time for each member
-        member_stats = [(m, self.get_member_stats(m.id)['last_call_time']) for m in members]
-        
-        # Sort by last call time (None = never called, should be first)
-        member_stats.sort(key=lambda x: (x[1] is not None, x[1] or 0))
-        
-        selected_member = member_stats[0][0]
-        self.log_distribution(call_id, selected_member.agent.id)
+        # Head of the last-call ranking set (never called ranks first)
+        selected_member = self.select_ranked_member(members, RANK_LAST_CALL)
+        self.log_distribution(call_id, selected_member.agent_id)
         
         return selected_member.agent
+    
+    def rank_keys(self, members: List[IndexedMember]) -> Dict[int, tuple]:
+        """Rank members by penalty, then oldest last call first."""
+        stats = self.get_members_stats(m.agent_id for m in members)
+        return {m.agent_id: (m.penalty, stats[m.agent_id]['last_call_time'] or 0) for m in members}
@@ -1,30 +1,21 @@
 """Linear strategy implementation."""
 
-from typing import Optional
+from typing import Optional, Set
 from .base import BaseStrategy
-from ..models import Agent
+from ..availability import IndexedAgent
 
 class LinearStrategy(BaseStrategy):
     """Ring agents in the order they were added to the queue."""
     
-    def get_next_agent(self, call_id: str) -> Optional[Agent]:
+    def get_next_agent(self, call_id: str, exclude: Optional[Set[int]] = None) -> Optional[IndexedAgent]:
         """Get the next agent in linear order."""
-        members = self.get_available_members()
+        members = self.get_candidate_members(exclude)
         
         if not members:
             return None
         
-        # Sort by penalty level first
-        members.sort(key=lambda x: x.penalty)
-        lowest_penalty = members[0].penalty
-        
-        # Filter members with lowest penalty
-        members = [m for m in members if m.penalty == lowest_penalty]
-        
-        # Sort by join time (members are ordered by id which corresponds to join order)
-        members.sort(key=lambda x: x.id)
-        
+        # Candidates are already in join order (member id)
         selected_member = members[0]
-        self.log_distribution(call_id, selected_member.agent.id)
+        self.log_distribution(call_id, selected_member.agent_id)
         
         return selected_member.agent
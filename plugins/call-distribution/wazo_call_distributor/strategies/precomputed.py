@@ -0,0 +1,134 @@
+"""Next-agent candidates computed ahead of incoming calls."""
+
+import threading
+from collections import deque
+from typing import Deque, Dict, Optional, Set
+from .base import BaseStrategy
+from ..availability import availability_index, IndexedAgent, IndexedMember
+
+class PrecomputedCandidates:
+    """Per-queue candidate lists ordered by each queue's strategy.
+
+    Lists are built with ``BaseStrategy.rank_keys`` on first use, so routing
+    a call only pops the head of a deque. When an agent's availability or
+    statistics change, only that agent is removed and, if still available,
+    reinserted at its ranked position; a reloaded queue is rebuilt on next
+    use. Popped agents are not offered again until they change, the list
+    is rebuilt or it runs out.
+
+    Strategies whose decisions cannot be made ahead of calls
+    (``precomputable = False``) are always computed on the call path.
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self._lock = threading.Lock()
+        self._candidates: Dict[int, Deque[IndexedMember]] = {}
+        self._keys: Dict[int, Dict[int, tuple]] = {}
+        self._strategies: Dict[int, BaseStrategy] = {}
+
+    def configure(self, enabled: Optional[bool] = None) -> None:
+        """Apply plugin configuration."""
+        if enabled is not None:
+            self.enabled = enabled
+        if not self.enabled:
+            self.clear()
+
+    def supports(self, strategy: BaseStrategy) -> bool:
+        """Check whether a strategy's decisions can be served from this cache."""
+        return self.enabled and strategy.precomputable
+
+    def next_agent(self, strategy: BaseStrategy, call_id: str,
+                   exclude: Optional[Set[int]] = None) -> Optional[IndexedAgent]:
+        """Pop the next candidate of a queue, skipping excluded agents."""
+        candidates = self._candidates.get(strategy.queue.id)
+        rebuilt = False
+        # A different strategy instance means the queue configuration changed
+        if candidates is None or self._strategies.get(strategy.queue.id) is not strategy:
+            candidates = self.rebuild(strategy)
+            rebuilt = True
+
+        while True:
+            with self._lock:
+                try:
+                    member = candidates.popleft()
+                except IndexError:
+                    member = None
+                else:
+                    self._keys[strategy.queue.id].pop(member.agent_id, None)
+
+            if member is None:
+                if rebuilt:
+                    return None
+                candidates = self.rebuild(strategy)
+                rebuilt = True
+                continue
+
+            if exclude and member.agent_id in exclude:
+                continue
+
+            strategy.log_distribution(call_id, member.agent_id)
+            return member.agent
+
+    def rebuild(self, strategy: BaseStrategy) -> Deque[IndexedMember]:
+        """Recompute a queue's candidate list with its strategy."""
+        members = strategy.get_available_members()
+        keys = strategy.rank_keys(members)
+        candidates = deque(sorted(members, key=lambda m: keys[m.agent_id]))
+        with self._lock:
+            self._candidates[strategy.queue.id] = candidates
+            self._keys[strategy.queue.id] = keys
+            self._strategies[strategy.queue.id] = strategy
+        return candidates
+
+    def refresh(self, queue_id: int, agent_id: Optional[int] = None) -> None:
+        """Reposition an agent after its availability or statistics changed.
+
+        Without an agent the whole queue changed, so its list is dropped
+        and rebuilt on next use.
+        """
+        if agent_id is None:
+            self.invalidate(queue_id)
+            return
+
+        strategy = self._strategies.get(queue_id)
+        candidates = self._candidates.get(queue_id)
+        if strategy is None or candidates is None:
+            return
+
+        member = availability_index.get_member(queue_id, agent_id)
+        key = None
+        if member is not None and availability_index.is_available(queue_id, agent_id):
+            key = strategy.rank_keys([member])[agent_id]
+
+        with self._lock:
+            # The list was rebuilt or dropped while the key was computed
+            if self._candidates.get(queue_id) is not candidates:
+                return
+            keys = self._keys[queue_id]
+            if keys.pop(agent_id, None) is not None:
+                for position, queued in enumerate(candidates):
+                    if queued.agent_id == agent_id:
+                        del candidates[position]
+                        break
+            if key is not None:
+                position = strategy.rank_position([keys[queued.agent_id] for queued in candidates], key)
+                candidates.insert(position, member)
+                keys[agent_id] = key
+
+    def invalidate(self, queue_id: int) -> None:
+        """Drop a queue's candidates so they are rebuilt on next use."""
+        with self._lock:
+            self._candidates.pop(queue_id, None)
+            self._keys.pop(queue_id, None)
+            self._strategies.pop(queue_id, None)
+
+    def clear(self) -> None:
+        """Drop every candidate list."""
+        with self._lock:
+            self._candidates.clear()
+            self._keys.clear()
+            self._strategies.clear()
+
+precomputed_candidates = PrecomputedCandidates()
+availability_index.add_listener(precomputed_candidates.refresh)
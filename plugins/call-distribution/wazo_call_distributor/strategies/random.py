@@ -1,29 +1,36 @@
 """Random strategy implementation."""
 
+import bisect
 import random
-from typing import Optional
+from typing import Dict, List, Optional, Set
 from .base import BaseStrategy
-from ..models import Agent
+from ..availability import IndexedAgent, IndexedMember
 
 class RandomStrategy(BaseStrategy):
     """Ring a random available agent."""
     
-    def get_next_agent(self, call_id: str) -> Optional[Agent]:
+    def get_next_agent(self, call_id: str, exclude: Optional[Set[int]] = None) -> Optional[IndexedAgent]:
         """Get a random available agent."""
-        members = self.get_available_members()
+        members = self.get_candidate_members(exclude)
         
         if not members:
             return None
         
-        # Sort by penalty level first
-        members.sort(key=lambda x: x.penalty)
-        lowest_penalty = members[0].penalty
-        
-        # Filter members with lowest penalty
-        members = [m for m in members if m.penalty == lowest_penalty]
-        
         # Select random member
         selected_member = random.choice(members)
-        self.log_distribution(call_id, selected_member.agent.id)
+        self.log_distribution(call_id, selected_member.agent_id)
         
         return selected_member.agent
+    
+    def rank_keys(self, members: List[IndexedMember]) -> Dict[int, tuple]:
+        """Shuffle members within each penalty level."""
+        return {m.agent_id: (m.penalty, random.random()) for m in members}
+    
+    def rank_position(self, keys: List[tuple], key: tuple) -> int:
+        """Insert at a random position within the member's penalty level.
+        
+        Members left in a shuffled list are biased towards high draws, so a
+        fresh draw would jump ahead of most of them.
+        """
+        return random.randint(bisect.bisect_left(keys, (key[0],)),
+                              bisect.bisect_left(keys, (key[0] + 1,)))
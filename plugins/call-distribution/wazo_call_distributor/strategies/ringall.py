@@ -1,32 +1,24 @@
 """Ring all strategy implementation."""
 
-from typing import Optional, List
+from typing import Optional, List, Set
 from .base import BaseStrategy
-from ..models import Agent, QueueMember
+from ..availability import IndexedAgent
 
 class RingAllStrategy(BaseStrategy):
     """Ring all available agents simultaneously."""
     
-    def get_next_agent(self, call_id: str) -> Optional[List[Agent]]:
+    # Every call rings the whole group, so there is no order to precompute
+    precomputable = False
+    
+    def get_next_agent(self, call_id: str, exclude: Optional[Set[int]] = None) -> Optional[List[IndexedAgent]]:
         """Get all available agents to ring simultaneously."""
-        members = self.get_available_members()
+        # Candidates are the available members of the lowest penalty level
+        members = self.get_candidate_members(exclude)
         
         if not members:
             return None
         
-        # Sort by penalty level (lower penalty = higher priority)
-        members.sort(key=lambda x: x.penalty)
-        
-        # Group members by penalty level
-        penalty_groups = {}
-        for member in members:
-            if member.penalty not in penalty_groups:
-                penalty_groups[member.penalty] = []
-            penalty_groups[member.penalty].append(member.agent)
-        
-        # Get the group with lowest penalty
-        lowest_penalty = min(penalty_groups.keys())
-        agents = penalty_groups[lowest_penalty]
+        agents = [member.agent for member in members]
         
         # Log distribution decision
         for agent in agents:
@@ -1,41 +1,34 @@
 """Round Robin with Memory strategy implementation."""
 
-from typing import Optional
-import redis
+from typing import Optional, Set
 from .base import BaseStrategy
-from ..models import Agent
+from ..availability import IndexedAgent
+from ..redis_client import get_redis_client
 
 class RoundRobinMemoryStrategy(BaseStrategy):
     """Ring agents in round-robin order, remembering last position."""
     
-    def __init__(self, queue, session):
-        """Initialize strategy with Redis connection."""
-        super().__init__(queue, session)
-        self.redis = redis.from_url(session.app.config['call_distributor']['redis_url'])
+    # The cursor is shared between workers in Redis, so positions cannot be
+    # handed out ahead of calls
+    precomputable = False
     
-    def get_next_agent(self, call_id: str) -> Optional[Agent]:
+    def __init__(self, queue, session, redis_client=None):
+        """Initialize strategy with a pooled Redis connection."""
+        super().__init__(queue, session, redis_client or get_redis_client())
+    
+    def get_next_agent(self, call_id: str, exclude: Optional[Set[int]] = None) -> Optional[IndexedAgent]:
         """Get the next agent in round-robin order."""
-        members = self.get_available_members()
+        members = self.get_candidate_members(exclude)
         
         if not members:
             return None
         
-        # Sort by penalty level first
-        members.sort(key=lambda x: x.penalty)
-        lowest_penalty = members[0].penalty
-        
-        # Filter members with lowest penalty
-        members = [m for m in members if m.penalty == lowest_penalty]
-        
-        # Get last position from Redis
-        redis_key = f"queue:{self.queue.id}:rr_position"
-        last_position = int(self.redis.get(redis_key) or -1)
-        
-        # Find next position
-        next_position = (last_position + 1) % len(members)
-        self.redis.set(redis_key, next_position)
+        # Advance the shared cursor atomically; candidates are in join order,
+        # so concurrent workers never hand out the same position twice
+        redis_key = f"queue:{self.queue.id}:rr_cursor"
+        next_position = (self.redis.incr(redis_key) - 1) % len(members)
         
         selected_member = members[next_position]
-        self.log_distribution(call_id, selected_member.agent.id)
+        self.log_distribution(call_id, selected_member.agent_id)
         
         return selected_member.agent
@@ -0,0 +1,178 @@
+"""Per-queue member statistics stored in Redis."""
+
+import threading
+import time
+from typing import Dict, Iterable, List, Optional
+
+STATS_FIELDS = ('last_call_time', 'calls_taken', 'total_talk_time')
+
+# Ranking orders kept as per-penalty sorted sets
+RANK_LAST_CALL = 'by_last_call'
+RANK_CALLS_TAKEN = 'by_calls_taken'
+
+SELECT_PAGE_SIZE = 16  # head entries read before falling back to candidate scores
+
+# Queue generations whose members have been added to the ranking sets
+_ranked_generations: Dict[int, int] = {}
+_ranked_lock = threading.Lock()
+
+class MemberStatsStore:
+    """Redis-backed call statistics for the members of a queue.
+
+    Each member has a hash at ``queue:{queue_id}:member_stats:{agent_id}``
+    holding its last call time (epoch seconds), calls taken and total talk
+    time (seconds).
+
+    Members are also ranked in one sorted set per penalty level and order,
+    ``queue:{queue_id}:penalty:{penalty}:{order}``, scored by last call time
+    or by calls taken, so selection reads the head of an index instead of
+    sorting every member. ``queue:{queue_id}:ranked_penalties`` records the
+    level each member is ranked under, so entries left in another level by
+    a penalty change or a removed member are dropped.
+    """
+
+    def __init__(self, redis_client, queue_id: int):
+        self.redis = redis_client
+        self.queue_id = queue_id
+
+    def key(self, agent_id: int) -> str:
+        """Get the Redis key holding a member's statistics."""
+        return f"queue:{self.queue_id}:member_stats:{agent_id}"
+
+    def rank_key(self, penalty: int, order: str) -> str:
+        """Get the Redis key of the ranking set for a penalty level."""
+        return f"queue:{self.queue_id}:penalty:{penalty}:{order}"
+
+    def penalties_key(self) -> str:
+        """Get the Redis key of the penalty level each member is ranked under."""
+        return f"queue:{self.queue_id}:ranked_penalties"
+
+    def get(self, agent_id: int) -> dict:
+        """Get statistics for a single member."""
+        return self.get_many([agent_id])[agent_id]
+
+    def get_many(self, agent_ids: Iterable[int]) -> Dict[int, dict]:
+        """Get statistics for several members in one round trip."""
+        agent_ids = list(agent_ids)
+        if self.redis is None or not agent_ids:
+            return {agent_id: self._parse(None) for agent_id in agent_ids}
+
+        pipe = self.redis.pipeline(transaction=False)
+        for agent_id in agent_ids:
+            pipe.hmget(self.key(agent_id), STATS_FIELDS)
+        rows = pipe.execute()
+
+        return {agent_id: self._parse(row) for agent_id, row in zip(agent_ids, rows)}
+
+    def record_call(self, agent_id: int, call_duration: int,
+                    penalty: Optional[int] = None,
+                    timestamp: Optional[float] = None) -> None:
+        """Record a completed call for a member in a single MULTI/EXEC.
+
+        When the member's penalty is known its ranking entries are updated
+        in the same transaction.
+        """
+        if self.redis is None:
+            return
+
+        if timestamp is None:
+            timestamp = time.time()
+
+        key = self.key(agent_id)
+        pipe = self.redis.pipeline()
+        pipe.hset(key, 'last_call_time', timestamp)
+        pipe.hincrby(key, 'calls_taken', 1)
+        pipe.hincrby(key, 'total_talk_time', call_duration)
+        if penalty is not None:
+            pipe.zadd(self.rank_key(penalty, RANK_LAST_CALL), {agent_id: timestamp})
+            pipe.zincrby(self.rank_key(penalty, RANK_CALLS_TAKEN), 1, agent_id)
+            pipe.hset(self.penalties_key(), agent_id, penalty)
+        pipe.execute()
+
+    def is_ranked(self, generation: int) -> bool:
+        """Check whether the members of a queue generation were added to the ranking sets."""
+        return _ranked_generations.get(self.queue_id) == generation
+
+    def ensure_ranked(self, members: List, generation: Optional[int]) -> None:
+        """Add queue members to the ranking sets once per availability index load.
+
+        Existing entries are left untouched (ZADD NX) so scores maintained by
+        ``record_call`` are never overwritten with older values. Entries in
+        a level the member is no longer ranked under are removed.
+        """
+        if self.redis is None or not members:
+            return
+        if generation is not None and self.is_ranked(generation):
+            return
+
+        stats = self.get_many(m.agent_id for m in members)
+        penalties = {m.agent_id: m.penalty for m in members}
+        ranked = self.redis.hgetall(self.penalties_key())
+
+        pipe = self.redis.pipeline(transaction=False)
+        for raw_agent_id, raw_penalty in ranked.items():
+            agent_id, penalty = int(raw_agent_id), int(raw_penalty)
+            if penalties.get(agent_id) == penalty:
+                continue
+            for order in (RANK_LAST_CALL, RANK_CALLS_TAKEN):
+                pipe.zrem(self.rank_key(penalty, order), agent_id)
+            if agent_id not in penalties:
+                pipe.hdel(self.penalties_key(), agent_id)
+        pipe.hset(self.penalties_key(), mapping=penalties)
+        for member in members:
+            member_stats = stats[member.agent_id]
+            pipe.zadd(self.rank_key(member.penalty, RANK_LAST_CALL),
+                      {member.agent_id: member_stats['last_call_time'] or 0}, nx=True)
+            pipe.zadd(self.rank_key(member.penalty, RANK_CALLS_TAKEN),
+                      {member.agent_id: member_stats['calls_taken']}, nx=True)
+        pipe.execute()
+
+        if generation is not None:
+            with _ranked_lock:
+                _ranked_generations[self.queue_id] = generation
+
+    def select(self, candidates: List, order: str):
+        """Get the best ranked candidate of a single penalty level.
+
+        Reads the head of the ranking set and returns the first entry that
+        is a candidate, so unavailable members are skipped without sorting.
+        If the head holds no candidate, the candidates' own scores are read
+        in one pipeline instead of paging through the set. Candidates
+        missing from the set rank first, like members with no stats.
+        """
+        if not candidates:
+            return None
+        if self.redis is None:
+            return candidates[0]
+
+        by_agent = {m.agent_id: m for m in candidates}
+        key = self.rank_key(candidates[0].penalty, order)
+
+        for raw_agent_id in self.redis.zrange(key, 0, SELECT_PAGE_SIZE - 1):
+            member = by_agent.get(int(raw_agent_id))
+            if member is not None:
+                return member
+
+        pipe = self.redis.pipeline(transaction=False)
+        for member in candidates:
+            pipe.zscore(key, member.agent_id)
+        scores = pipe.execute()
+
+        return min(
+            zip(candidates, scores),
+            key=lambda item: item[1] if item[1] is not None else float('-inf')
+        )[0]
+
+    @staticmethod
+    def _parse(row) -> dict:
+        """Convert raw HMGET values into a statistics dictionary."""
+        last_call_time, calls_taken, total_talk_time = row or (None, None, None)
+        calls_taken = int(calls_taken or 0)
+        total_talk_time = int(total_talk_time or 0)
+
+        return {
+            'last_call_time': float(last_call_time) if last_call_time is not None else None,
+            'calls_taken': calls_taken,
+            'total_talk_time': total_talk_time,
+            'average_talk_time': total_talk_time / calls_taken if calls_taken else 0
+        }
@@ -0,0 +1,175 @@
+"""Durable event fan-out over Redis Streams."""
+
+import os
+import re
+import socket
+from typing import List, Optional, Tuple
+
+import redis
+
+DEFAULT_STREAM_MAXLEN = 10000  # approximate number of events kept per stream
+EVENTS_STREAM = 'events:stream'  # every event, read through consumer groups
+WEBHOOK_GROUP = 'webhooks'
+WEBSOCKET_GROUP_PREFIX = 'websocket:'
+EVENT_FIELD = 'event'
+PUBSUB_CHANNEL_PREFIX = 'events:tenant:'  # live-only transport, one channel per tenant
+TRANSPORTS = ('streams', 'pubsub')
+STREAM_ID_PATTERN = re.compile(r'^\d+(-\d+)?$')  # an entry ID, or just its millisecond part
+
+# Add an event to the global stream, then to its tenant, queue and agent
+# streams under the same ID so a client can resume any of them from the ID
+# of the last event it saw
+APPEND_SCRIPT = """
+local id = redis.call('xadd', KEYS[1], 'MAXLEN', '~', ARGV[2], '*', 'event', ARGV[1])
+for i = 2, #KEYS do
+    redis.call('xadd', KEYS[i], 'MAXLEN', '~', ARGV[2], id, 'event', ARGV[1])
+end
+return id
+"""
+
+def check_stream_id(entry_id: str) -> str:
+    """Check that a client-supplied event ID is a stream entry ID, raising ``ValueError`` otherwise."""
+    if not isinstance(entry_id, str) or not STREAM_ID_PATTERN.match(entry_id):
+        raise ValueError(f"Invalid event ID {entry_id!r}")
+    return entry_id
+
+def parse_xreadgroup(response, **options):
+    """Parse an XREADGROUP reply into ``[[stream, [(id, fields), ...]]]``,
+    keeping trimmed entries as ``(id, None)``.
+
+    Rereading pending entries returns ``[id, nil]`` for the ones MAXLEN
+    has trimmed since, which redis-py's own parser fails on. Streams come
+    as a list over RESP2 and as a map over RESP3.
+    """
+    if not response:
+        return []
+    streams = response.items() if isinstance(response, dict) else response
+    return [
+        [stream, [(entry[0], dict(zip(entry[1][::2], entry[1][1::2])) if entry[1] is not None else None)
+                  for entry in entries]]
+        for stream, entries in streams
+    ]
+
+def register_stream_parser(redis_client) -> None:
+    """Make a Redis client, sync or asyncio, parse XREADGROUP replies with ``parse_xreadgroup``."""
+    redis_client.set_response_callback('XREADGROUP', parse_xreadgroup)
+
+def stream_key(scope: str, entity_id) -> str:
+    """Get the Redis key of a tenant, queue or agent stream."""
+    return f"{EVENTS_STREAM}:{scope}:{entity_id}"
+
+def websocket_group(node_id: str) -> str:
+    """Get the consumer group of a WebSocket node."""
+    return f"{WEBSOCKET_GROUP_PREFIX}{node_id}"
+
+def default_consumer_name() -> str:
+    """Get a consumer name that is stable across restarts on this host."""
+    return socket.gethostname()
+
+def process_node_id(name: Optional[str] = None) -> str:
+    """Get a WebSocket node id unique to this process, prefixed by ``name`` or the host name.
+
+    Every node needs its own consumer group; processes sharing one would
+    split the stream between them.
+    """
+    return f"{name or default_consumer_name()}:{os.getpid()}"
+
+class EventStreams:
+    """Capped Redis streams carrying serialized events.
+
+    Every event goes to ``events:stream``, which WebSocket nodes (one
+    consumer group each) and webhook workers (one shared group) read, and
+    to ``events:stream:{tenant|queue|agent}:{id}`` for replay. Streams are
+    trimmed to about ``maxlen`` entries, so a consumer that is away longer
+    than that misses the oldest events.
+    """
+
+    def __init__(self, redis_client, maxlen: int = DEFAULT_STREAM_MAXLEN):
+        self.redis = redis_client
+        self.maxlen = maxlen
+        self._append = redis_client.register_script(APPEND_SCRIPT)
+        register_stream_parser(redis_client)
+
+    def append(self, payload: str, tenant_uuid: str, queue_id: Optional[int] = None,
+               agent_id: Optional[int] = None, pipe=None):
+        """Add a serialized event to its streams; queued only when ``pipe`` is given."""
+        keys = [EVENTS_STREAM, stream_key('tenant', tenant_uuid)]
+        if queue_id:
+            keys.append(stream_key('queue', queue_id))
+        if agent_id:
+            keys.append(stream_key('agent', agent_id))
+        return self._append(keys=keys, args=[payload, self.maxlen],
+                            client=pipe if pipe is not None else self.redis)
+
+    def replay(self, scope: str, entity_id, last_id: str, count: int = 1000) -> List[Tuple[str, str]]:
+        """Get up to ``count`` (id, payload) pairs that follow ``last_id`` in a stream."""
+        entries = self.redis.xrange(stream_key(scope, entity_id), f"({last_id}", '+', count=count)
+        return [(entry_id.decode(), fields[EVENT_FIELD.encode()].decode()) for entry_id, fields in entries]
+
+    def ensure_group(self, group: str, start_id: str = '$') -> None:
+        """Create a consumer group on the global stream unless it exists."""
+        try:
+            self.redis.xgroup_create(EVENTS_STREAM, group, id=start_id, mkstream=True)
+        except redis.ResponseError as e:
+            if 'BUSYGROUP' not in str(e):
+                raise
+
+    def read_group(self, group: str, consumer: str, last_id: str = '>', count: int = 100,
+                   block: Optional[int] = None) -> List[Tuple[str, str]]:
+        """Read (id, payload) pairs for a consumer; ``last_id='0'`` rereads its unacknowledged ones.
+
+        Pending entries trimmed from the stream come with a ``None`` payload
+        and still need acknowledging.
+        """
+        response = self.redis.xreadgroup(group, consumer, {EVENTS_STREAM: last_id}, count=count, block=block)
+        if not response:
+            return []
+        return [(entry_id.decode(), _payload(fields)) for entry_id, fields in response[0][1]]
+
+    def ack(self, group: str, entry_ids: List[str]) -> None:
+        """Acknowledge processed entries."""
+        if entry_ids:
+            self.redis.xack(EVENTS_STREAM, group, *entry_ids)
+
+def _payload(fields: Optional[dict]) -> Optional[str]:
+    """Get the serialized event of a stream entry, or None if it was trimmed or has none."""
+    if not fields or EVENT_FIELD.encode() not in fields:
+        return None
+    return fields[EVENT_FIELD.encode()].decode()
+
+class EventPublisher:
+    """Process-wide choice of how recorded events reach WebSocket nodes.
+
+    ``streams`` (the default) appends to the capped streams above, so
+    nodes and webhook workers resume after a restart. ``pubsub`` sends one
+    PUBLISH per event on its tenant channel instead; nodes then receive it
+    through a single pattern subscription, with lower overhead but no
+    replay. Webhook workers read ``events:stream`` with either transport,
+    so ``pubsub`` still appends every event there, but not to the tenant,
+    queue and agent streams.
+    """
+
+    def __init__(self):
+        self.transport = 'streams'
+        self.maxlen = DEFAULT_STREAM_MAXLEN
+
+    def configure(self, transport: Optional[str] = None, maxlen: Optional[int] = None) -> None:
+        """Apply plugin configuration."""
+        if transport is not None:
+            if transport not in TRANSPORTS:
+                raise ValueError(f"Unknown event transport {transport!r}")
+            self.transport = transport
+        if maxlen is not None:
+            self.maxlen = maxlen
+
+    def publish(self, redis_client, payload: str, tenant_uuid: str, queue_id: Optional[int] = None,
+                agent_id: Optional[int] = None, pipe=None) -> None:
+        """Send a serialized event; queued only when ``pipe`` is given."""
+        if self.transport == 'pubsub':
+            client = pipe if pipe is not None else redis_client
+            client.publish(f"{PUBSUB_CHANNEL_PREFIX}{tenant_uuid}", payload)
+            client.xadd(EVENTS_STREAM, {EVENT_FIELD: payload}, maxlen=self.maxlen, approximate=True)
+        else:
+            EventStreams(redis_client, self.maxlen).append(payload, tenant_uuid, queue_id, agent_id, pipe)
+
+event_publisher = EventPublisher()
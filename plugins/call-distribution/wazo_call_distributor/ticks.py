@@ -0,0 +1,27 @@
+"""Cluster-wide locks that let one worker process run each periodic tick."""
+
+import os
+import socket
+
+class TickLock:
+    """A lock at ``call_distributor:{name}:tick`` held for one interval.
+
+    Every process runs the periodic job's timer, but only the one that sets
+    the key runs the tick. The key is never released, it expires after the
+    interval, so ticks run by different processes are at least an interval
+    apart.
+    """
+
+    def __init__(self, redis_client, name: str):
+        self.redis = redis_client
+        self.name = name
+        self.owner = f"{socket.gethostname()}:{os.getpid()}"
+
+    @property
+    def key(self) -> str:
+        """Get the Redis key of the lock."""
+        return f"call_distributor:{self.name}:tick"
+
+    def acquire(self, interval: float) -> bool:
+        """Take the lock for ``interval`` seconds; False if another process holds it."""
+        return bool(self.redis.set(self.key, self.owner, nx=True, px=max(1, int(interval * 1000))))
@@ -0,0 +1,40 @@
+"""Queue versions shared by every worker to broadcast cache invalidations."""
+
+from typing import Dict, Iterable, Optional
+
+QUEUE_VERSIONS_KEY = 'call_distributor:queue_versions'  # hash of queue id to version
+
+class QueueVersions:
+    """Per-queue version counters stored in one Redis hash.
+
+    A worker that changes a queue, its membership or the availability of
+    one of its agents bumps the queue's version. Routing reads the version
+    before serving a queue from the process-local caches and drops what it
+    cached for the queue when the version moved, so every worker sees the
+    change on its next decision rather than when its caches expire.
+    """
+
+    def __init__(self):
+        self._seen: Dict[int, Optional[bytes]] = {}
+
+    def bump(self, redis_client, queue_ids: Iterable[int], pipe=None) -> None:
+        """Advance the versions of queues, on ``pipe`` when given."""
+        client = pipe if pipe is not None else redis_client.pipeline(transaction=False)
+        for queue_id in queue_ids:
+            client.hincrby(QUEUE_VERSIONS_KEY, queue_id, 1)
+        if pipe is None:
+            client.execute()
+
+    def changed(self, redis_client, queue_id: int) -> bool:
+        """Check whether a queue's version moved since this process last looked."""
+        version = redis_client.hget(QUEUE_VERSIONS_KEY, queue_id)
+        if self._seen.get(queue_id) == version:
+            return False
+        self._seen[queue_id] = version
+        return True
+
+    def clear(self) -> None:
+        """Forget every version seen."""
+        self._seen.clear()
+
+queue_versions = QueueVersions()
@@ -0,0 +1,110 @@
+"""Waiting callers of a queue, ordered by priority then arrival."""
+
+import math
+import time
+from typing import Dict, List, Optional
+
+# Seconds of waiting one priority level is worth; larger than any epoch
+# timestamp, so a higher priority always sorts ahead of an earlier arrival
+PRIORITY_WEIGHT = 10 ** 10
+
+class WaitingCallers:
+    """Redis sorted sets holding the callers waiting in a queue.
+
+    ``queue:{queue_id}:waiting`` is scored by ``-priority * PRIORITY_WEIGHT
+    + enqueue time`` so its head is the next caller to serve, and
+    ``queue:{queue_id}:waiting_since`` is scored by enqueue time alone to
+    find the longest wait. Enqueue, position lookup, priority checks and
+    removal are all O(log n).
+
+    A routed caller leaves the priority set but keeps its enqueue time
+    until it is answered or abandoned, so its wait can still be measured
+    and it still counts as waiting while agents ring.
+    """
+
+    def __init__(self, redis_client, queue_id: int):
+        self.redis = redis_client
+        self.queue_id = queue_id
+
+    @property
+    def key(self) -> str:
+        """Get the Redis key of the priority-ordered set."""
+        return f"queue:{self.queue_id}:waiting"
+
+    @property
+    def since_key(self) -> str:
+        """Get the Redis key of the arrival-ordered set."""
+        return f"queue:{self.queue_id}:waiting_since"
+
+    def enqueue(self, call_id: str, priority: int = 0,
+                timestamp: Optional[float] = None) -> int:
+        """Add a caller and return its 1-based position."""
+        if timestamp is None:
+            timestamp = time.time()
+
+        pipe = self.redis.pipeline()
+        pipe.zadd(self.key, {call_id: -priority * PRIORITY_WEIGHT + timestamp})
+        pipe.zadd(self.since_key, {call_id: timestamp}, nx=True)
+        pipe.zrank(self.key, call_id)
+        return pipe.execute()[-1] + 1
+
+    def position(self, call_id: str) -> Optional[int]:
+        """Get a caller's 1-based position, or None if it is not waiting."""
+        rank = self.redis.zrank(self.key, call_id)
+        return rank + 1 if rank is not None else None
+
+    def outranked(self, call_id: str) -> bool:
+        """Check whether a caller with a higher priority than ``call_id`` is waiting.
+
+        A caller that is not waiting counts as priority 0.
+        """
+        pipe = self.redis.pipeline(transaction=False)
+        pipe.zscore(self.key, call_id)
+        pipe.zrange(self.key, 0, 0, withscores=True)
+        score, head = pipe.execute()
+        if not head:
+            return False
+
+        priority = _priority(score) if score is not None else 0
+        return _priority(head[0][1]) > priority
+
+    def peek(self, count: int) -> List[str]:
+        """Get the next callers to serve without removing them."""
+        return [call_id.decode() for call_id in self.redis.zrange(self.key, 0, count - 1)]
+
+    def dequeue(self, call_id: str) -> bool:
+        """Take a routed caller out of the serving order; False if it was not waiting."""
+        return bool(self.redis.zrem(self.key, call_id))
+
+    def remove(self, call_id: str, pipe=None) -> Optional[bool]:
+        """Remove a caller that was answered or abandoned; False if it was not waiting.
+
+        When ``pipe`` is given the commands are only queued on it and None is
+        returned.
+        """
+        if pipe is not None:
+            pipe.zrem(self.key, call_id)
+            pipe.zrem(self.since_key, call_id)
+            return None
+
+        pipe = self.redis.pipeline()
+        pipe.zrem(self.key, call_id)
+        pipe.zrem(self.since_key, call_id)
+        return bool(pipe.execute()[0])
+
+    def summary(self, now: Optional[float] = None) -> Dict:
+        """Get the number of waiting callers and the longest wait in seconds."""
+        pipe = self.redis.pipeline(transaction=False)
+        pipe.zcard(self.since_key)
+        pipe.zrange(self.since_key, 0, 0, withscores=True)
+        calls_waiting, oldest = pipe.execute()
+
+        longest_wait = 0
+        if oldest:
+            longest_wait = max(0, int((now or time.time()) - oldest[0][1]))
+
+        return {'calls_waiting': calls_waiting, 'longest_wait': longest_wait}
+
+def _priority(score: float) -> int:
+    """Get the priority a waiting set score was enqueued with."""
+    return -math.floor(score / PRIORITY_WEIGHT)
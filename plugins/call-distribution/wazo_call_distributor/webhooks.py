@@ -0,0 +1,116 @@
+"""Webhook delivery of streamed events."""
+
+import json
+import logging
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+
+from .services.integration import IntegrationService
+from .streams import EventStreams, WEBHOOK_GROUP, default_consumer_name
+from .ticks import TickLock
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_RETRY_INTERVAL = 30  # seconds between passes over failed deliveries
+
+class WebhookWorker:
+    """Delivers streamed events to matching webhooks from a worker thread.
+
+    All workers share the ``webhooks`` consumer group, so each event is
+    delivered by exactly one of them. A restarted worker first delivers the
+    events it had read but not acknowledged. Failed deliveries are
+    scheduled on their ``WebhookDelivery`` records; every
+    ``retry_interval`` seconds one worker across the cluster resends the
+    ones that are due.
+    """
+
+    def __init__(self, session_factory, redis_client, consumer: Optional[str] = None,
+                 batch_size: int = 100, block: int = 5000,
+                 retry_interval: float = DEFAULT_RETRY_INTERVAL):
+        self.session_factory = session_factory
+        self.streams = EventStreams(redis_client)
+        self.consumer = consumer or default_consumer_name()
+        self.batch_size = batch_size
+        self.block = block
+        self.retry_interval = retry_interval
+        self._retry_lock = TickLock(redis_client, 'webhook_retries')
+        self._thread: Optional[threading.Thread] = None
+        self._stopping = threading.Event()
+
+    def start(self) -> None:
+        """Start the worker thread."""
+        self.streams.ensure_group(WEBHOOK_GROUP)
+        self._stopping.clear()
+        self._thread = threading.Thread(target=self._run, name='call-distributor-webhooks', daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: Optional[float] = None) -> None:
+        """Stop the worker thread after its current batch."""
+        if self._thread is None:
+            return
+
+        self._stopping.set()
+        self._thread.join(timeout)
+        self._thread = None
+
+    def _run(self) -> None:
+        """Deliver pending events, then new ones until stopped."""
+        last_id = '0'
+        next_retries = time.monotonic() + self.retry_interval
+        while not self._stopping.is_set():
+            if time.monotonic() >= next_retries:
+                self._retry_failed()
+                next_retries = time.monotonic() + self.retry_interval
+
+            try:
+                entries = self.streams.read_group(
+                    WEBHOOK_GROUP, self.consumer, last_id, self.batch_size,
+                    None if last_id == '0' else self.block
+                )
+                if not entries:
+                    last_id = '>'
+                    continue
+
+                self._deliver(entries)
+            except Exception:
+                logger.exception("Failed to deliver streamed events")
+                self._stopping.wait(1)
+
+    def _deliver(self, entries: List[Tuple[str, Optional[str]]]) -> None:
+        """Trigger the webhooks of a batch of events and acknowledge them.
+
+        Entries trimmed from the stream before delivery are only acknowledged.
+        """
+        session = self.session_factory()
+        try:
+            service = IntegrationService(session)
+            for entry_id, payload in entries:
+                if payload is None:
+                    logger.warning("Event %s was trimmed from the stream before delivery", entry_id)
+                    continue
+                try:
+                    event: Dict = json.loads(payload)
+                    service.dispatch_event(event['tenant_uuid'], event)
+                except Exception:
+                    session.rollback()
+                    logger.exception("Failed to deliver event %s to webhooks", entry_id)
+        finally:
+            session.close()
+
+        self.streams.ack(WEBHOOK_GROUP, [entry_id for entry_id, _ in entries])
+
+    def _retry_failed(self) -> None:
+        """Resend the failed deliveries that are due, unless another worker just did."""
+        session = self.session_factory()
+        try:
+            if self._retry_lock.acquire(self.retry_interval):
+                retried = IntegrationService(session).process_pending_retries()
+                if retried:
+                    logger.info("Retried %d webhook deliveries", retried)
+        except Exception:
+            session.rollback()
+            logger.exception("Failed to retry webhook deliveries")
+        finally:
+            session.close()
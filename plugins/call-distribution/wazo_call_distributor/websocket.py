@@ -2,196 +2,661 @@
 
 import json
 import asyncio
+import itertools
+import logging
+import time
 import websockets
+from collections import OrderedDict
 import redis.asyncio as aioredis
-from typing import Dict, Set, Optional
+from redis.exceptions import ConnectionError as RedisConnectionError, ResponseError
+from typing import Callable, Dict, Hashable, Iterable, List, Set, Optional, Tuple
 from datetime import datetime
 
+from .models import Queue, Agent
+from .realtime import RealtimeMetrics
+from .streams import (
+    EVENTS_STREAM, EVENT_FIELD, PUBSUB_CHANNEL_PREFIX, check_stream_id,
+    event_publisher, register_stream_parser, stream_key, websocket_group, process_node_id
+)
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SEND_QUEUE_SIZE = 256  # messages buffered per client
+SLOW_CONSUMER_POLICIES = ('drop_oldest', 'coalesce', 'disconnect')
+SLOW_CONSUMER_CLOSE_CODE = 1013  # try again later
+MIN_METRICS_INTERVAL = 0.25  # seconds, shortest interval a metrics subscriber may ask for
+
+class ClientSender:
+    """Bounded outbound queue of one connection, drained by its own writer task.
+    
+    ``push`` never waits on the socket. When ``max_pending`` messages are
+    already waiting the policy decides: ``drop_oldest`` discards the oldest
+    one, ``coalesce`` first replaces a waiting message about the same
+    subject and otherwise drops the oldest, and ``disconnect`` closes the
+    connection so the client can reconnect and resume.
+    """
+    
+    def __init__(self, websocket: websockets.WebSocketServerProtocol, max_pending: int,
+                 policy: str, on_close: Callable[[websockets.WebSocketServerProtocol], None]):
+        self.websocket = websocket
+        self.max_pending = max_pending
+        self.policy = policy
+        self.dropped = 0
+        self.closed = False
+        self._on_close = on_close
+        self._pending: 'OrderedDict[Hashable, str]' = OrderedDict()
+        self._ready = asyncio.Event()
+        self._sequence = itertools.count()
+        self._writer = asyncio.ensure_future(self._write())
+    
+    def push(self, message: str, key: Optional[Hashable] = None) -> bool:
+        """Queue a message; False if it was not queued because the client is gone."""
+        if self.closed:
+            return False
+        
+        if self.policy == 'coalesce' and key is not None and key in self._pending:
+            self._pending[key] = message
+            self.dropped += 1
+            return True
+        
+        if len(self._pending) >= self.max_pending:
+            if self.policy == 'disconnect':
+                self.dropped += len(self._pending) + 1
+                self.close(SLOW_CONSUMER_CLOSE_CODE)
+                return False
+            self._pending.popitem(last=False)
+            self.dropped += 1
+        
+        if self.policy != 'coalesce' or key is None:
+            key = next(self._sequence)
+        self._pending[key] = message
+        self._ready.set()
+        return True
+    
+    def close(self, code: Optional[int] = None, notify: bool = True) -> None:
+        """Stop the writer and, when a close code is given, close the socket.
+        
+        ``notify`` reports the closed connection to the handler.
+        """
+        if self.closed:
+            return
+        
+        self.closed = True
+        self._pending.clear()
+        self._writer.cancel()
+        if code is not None:
+            asyncio.ensure_future(self.websocket.close(code=code, reason='Client too slow'))
+        if notify:
+            self._on_close(self.websocket)
+    
+    async def _write(self):
+        """Send queued messages in order until the connection closes."""
+        try:
+            while True:
+                await self._ready.wait()
+                while self._pending:
+                    _, message = self._pending.popitem(last=False)
+                    await self.websocket.send(message)
+                self._ready.clear()
+        except websockets.ConnectionClosed:
+            self.close()
+
+class MetricsSubscription:
+    """Periodic metric deltas for the queues and agents one connection watches.
+    
+    Every ``interval`` seconds the metrics of every queue, as served by
+    ``RealtimeMetrics.get_queue_metrics``, and the hashes of the agents
+    that events marked dirty are read in one pipeline, and a single message
+    carrying just the fields that changed since the last one is queued. A
+    busy queue costs the client one small message per interval however
+    many events it produces, and sliding windows and waits are kept current
+    on quiet queues. The first message is a full snapshot.
+    """
+    
+    def __init__(self, sender: ClientSender, redis_client, queue_ids: Iterable[int],
+                 agent_ids: Iterable[int], interval: float,
+                 service_levels: Optional[Dict[int, int]] = None):
+        self.sender = sender
+        self.redis = redis_client
+        self.metrics = RealtimeMetrics(redis_client)
+        self.interval = max(interval, MIN_METRICS_INTERVAL)
+        self.service_levels = service_levels or {}
+        self.subjects: List[Tuple[str, int]] = (
+            [('queue', queue_id) for queue_id in queue_ids] + [('agent', agent_id) for agent_id in agent_ids]
+        )
+        self.dirty: Set[Tuple[str, int]] = set(self.subjects)
+        self._sent: Dict[Tuple[str, int], Dict] = {}
+        self._task = asyncio.ensure_future(self._run())
+    
+    def close(self) -> None:
+        """Stop sending updates."""
+        self._task.cancel()
+    
+    async def _run(self):
+        """Flush the subjects every interval."""
+        while True:
+            try:
+                await self.flush()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Failed to send metric updates")
+            await asyncio.sleep(self.interval)
+    
+    async def flush(self):
+        """Queue one message with the changed metric fields of the queues and dirty agents.
+        
+        Dirty agents stay dirty if the metrics cannot be read.
+        """
+        dirty, self.dirty = self.dirty, set()
+        subjects = [subject for subject in self.subjects if subject[0] == 'queue' or subject in dirty]
+        if not subjects:
+            return
+        
+        now = time.time()
+        pipe = self.redis.pipeline(transaction=False)
+        reads = []
+        for scope, subject_id in subjects:
+            if scope == 'queue':
+                reads.append(self.metrics.read_queue_metrics(subject_id, pipe, now))
+            else:
+                pipe.hgetall(RealtimeMetrics.agent_key(subject_id))
+                reads.append(1)
+        try:
+            results = await pipe.execute()
+        except BaseException:
+            self.dirty |= dirty
+            raise
+        
+        delta = {'queues': {}, 'agents': {}}
+        offset = 0
+        for subject, count in zip(subjects, reads):
+            subject_results = results[offset:offset + count]
+            offset += count
+            if subject[0] == 'queue':
+                current = RealtimeMetrics.parse_queue_metrics(
+                    subject_results, self.service_levels.get(subject[1], 0), now
+                )
+            else:
+                current = {key.decode(): _decode_metric(value) for key, value in subject_results[0].items()}
+            previous = self._sent.get(subject, {})
+            changed = {key: value for key, value in current.items() if previous.get(key) != value}
+            if changed:
+                delta[f"{subject[0]}s"][subject[1]] = changed
+                self._sent[subject] = current
+        
+        if delta['queues'] or delta['agents']:
+            self.sender.push(json.dumps({
+                'type': 'metrics',
+                'timestamp': datetime.utcnow().isoformat(),
+                **delta
+            }))
+
+def _decode_metric(value: bytes):
+    """Decode a metric value, keeping values that are not JSON as strings."""
+    try:
+        return json.loads(value)
+    except ValueError:
+        return value.decode()
+
 class WebSocketHandler:
-    """Handler for WebSocket connections."""
+    """Handler for WebSocket connections.
     
-    def __init__(self, redis_url: str):
-        """Initialize the WebSocket handler."""
+    Each node reads events over one Redis connection, whatever the number
+    of clients, and fans them out through its in-memory channel index; see
+    ``run``. With the streams transport each node, that is each process,
+    has its own consumer group on the event stream, and a client
+    reconnecting with the ID of the last event it saw, for example after
+    its node restarted, is sent the events it missed.
+    """
+    
+    def __init__(self, redis_url: str, node_id: Optional[str] = None,
+                 batch_size: int = 100, block: int = 5000,
+                 send_queue_size: int = DEFAULT_SEND_QUEUE_SIZE,
+                 slow_consumer_policy: str = 'drop_oldest', session_factory=None):
+        """Initialize the WebSocket handler.
+        
+        ``session_factory`` is needed by ``serve`` to check that the queues
+        and agents a client subscribes to belong to its tenant.
+        """
+        if slow_consumer_policy not in SLOW_CONSUMER_POLICIES:
+            raise ValueError(f"Unknown slow consumer policy {slow_consumer_policy!r}")
+        
         self.redis_url = redis_url
-        self.connections: Dict[str, Set[websockets.WebSocketServerProtocol]] = {
+        self.node_id = node_id or process_node_id()
+        self.batch_size = batch_size
+        self.block = block
+        self.send_queue_size = send_queue_size
+        self.slow_consumer_policy = slow_consumer_policy
+        self.session_factory = session_factory
+        self.senders: Dict[websockets.WebSocketServerProtocol, ClientSender] = {}
+        self.dropped_messages = 0  # dropped for clients that are gone
+        self.metric_subscriptions: Dict[websockets.WebSocketServerProtocol, List[MetricsSubscription]] = {}
+        self.metric_watchers: Dict[Tuple[str, int], Set[MetricsSubscription]] = {}
+        # Reverse index of the channels each connection joined
+        self.subscriptions: Dict[websockets.WebSocketServerProtocol, Set[Tuple[str, object]]] = {}
+        # Live events held back from connections that are being replayed to
+        self._held: Dict[websockets.WebSocketServerProtocol, List[Tuple[Optional[str], str, Optional[Hashable]]]] = {}
+        self._redis = None
+        self.connections: Dict[str, Dict[object, Set[websockets.WebSocketServerProtocol]]] = {
             'tenant': {},
             'queue': {},
             'agent': {}
         }
     
+    def _get_redis(self):
+        """Get the node's Redis client."""
+        if self._redis is None:
+            self._redis = aioredis.from_url(self.redis_url)
+        return self._redis
+    
     async def handle_connection(self, websocket: websockets.WebSocketServerProtocol,
-                              tenant_uuid: str):
+                              tenant_uuid: str, last_event_id: Optional[str] = None):
         """Handle a new WebSocket connection."""
+        await self._subscribe(websocket, 'tenant', tenant_uuid, last_event_id)
+    
+    async def subscribe_queue(self, websocket: websockets.WebSocketServerProtocol,
+                            queue_id: int, last_event_id: Optional[str] = None):
+        """Subscribe to queue events."""
+        await self._subscribe(websocket, 'queue', queue_id, last_event_id)
+    
+    async def subscribe_agent(self, websocket: websockets.WebSocketServerProtocol,
+                            agent_id: int, last_event_id: Optional[str] = None):
+        """Subscribe to agent events."""
+        await self._subscribe(websocket, 'agent', agent_id, last_event_id)
+    
+    async def _subscribe(self, websocket: websockets.WebSocketServerProtocol,
+                         channel_type: str, key, last_event_id: Optional[str]):
+        """Deliver a channel's events to a connection until it closes."""
         try:
-            # Add connection to tenant channel
-            if tenant_uuid not in self.connections['tenant']:
-                self.connections['tenant'][tenant_uuid] = set()
-            self.connections['tenant'][tenant_uuid].add(websocket)
-            
-            # Start Redis subscription
-            redis = await aioredis.from_url(self.redis_url)
-            pubsub = redis.pubsub()
-            
-            # Subscribe to tenant channel
-            await pubsub.subscribe(f"events:tenant:{tenant_uuid}")
-            
-            # Handle subscription messages
+            sender = self._get_sender(websocket)
             try:
-                while True:
-                    try:
-                        message = await pubsub.get_message(ignore_subscribe_messages=True)
-                        if message:
-                            await websocket.send(message['data'].decode())
-                        await asyncio.sleep(0.1)  # Prevent busy loop
-                    except websockets.ConnectionClosed:
-                        break
-            finally:
-                await pubsub.unsubscribe()
-                await redis.close()
-                
-                # Remove connection from all channels
-                self._remove_connection(websocket)
-        
-        except Exception as e:
-            print(f"WebSocket error: {e}")
+                if last_event_id:
+                    await self._subscribe_with_replay(websocket, [(channel_type, key)], last_event_id)
+                else:
+                    self._add_subscription(websocket, channel_type, key)
+            except ValueError as e:
+                # Follow the channel without replay rather than dropping the connection
+                sender.push(json.dumps({'type': 'error', 'message': str(e)}))
+                self._add_subscription(websocket, channel_type, key)
+            await websocket.wait_closed()
+        except websockets.ConnectionClosed:
+            pass
+        except Exception:
+            logger.exception("WebSocket error")
+        finally:
             self._remove_connection(websocket)
     
-    async def subscribe_queue(self, websocket: websockets.WebSocketServerProtocol,
-                            queue_id: int):
-        """Subscribe to queue events."""
-        if queue_id not in self.connections['queue']:
-            self.connections['queue'][queue_id] = set()
-        self.connections['queue'][queue_id].add(websocket)
-        
-        redis = await aioredis.from_url(self.redis_url)
-        pubsub = redis.pubsub()
+    async def subscribe_metrics(self, websocket: websockets.WebSocketServerProtocol,
+                                queue_ids: Iterable[int] = (), agent_ids: Iterable[int] = (),
+                                interval: float = 1.0, service_levels: Optional[Dict[int, int]] = None):
+        """Send the connection merged metric deltas of queues and agents every ``interval`` seconds.
         
-        await pubsub.subscribe(f"events:queue:{queue_id}")
+        Wallboards pass their ``SupervisorSettings.refresh_interval``, and
+        ``service_levels`` maps queue ids to their ``Queue.service_level``.
+        """
+        try:
+            self._add_metric_subscription(websocket, queue_ids, agent_ids, interval, service_levels)
+            await websocket.wait_closed()
+        except websockets.ConnectionClosed:
+            pass
+        except Exception:
+            logger.exception("WebSocket error")
+        finally:
+            self._remove_connection(websocket)
+    
+    async def serve(self, websocket: websockets.WebSocketServerProtocol, tenant_uuid: str):
+        """Handle a connection whose subscriptions are driven by client messages.
         
+        One socket can follow any number of queues and agents. Clients send
+        JSON messages such as ``{"action": "subscribe", "queues": [1, 2],
+        "agents": [7], "last_event_id": "..."}``, ``{"action": "unsubscribe",
+        "queues": [2]}``, ``{"action": "subscribe_metrics", "queues": [1],
+        "interval": 5}`` and ``{"action": "unsubscribe_metrics"}``;
+        ``"tenant": true`` stands for every event of the tenant. Each message
+        is answered with an ``ack`` listing the current subscriptions, or an
+        ``error``, for example when a queue or agent belongs to another
+        tenant.
+        """
+        sender = self._get_sender(websocket)
         try:
-            while True:
+            async for raw_message in websocket:
                 try:
-                    message = await pubsub.get_message(ignore_subscribe_messages=True)
-                    if message:
-                        await websocket.send(message['data'].decode())
-                    await asyncio.sleep(0.1)
-                except websockets.ConnectionClosed:
-                    break
+                    reply = await self._handle_message(websocket, tenant_uuid, json.loads(raw_message))
+                except (ValueError, TypeError, AttributeError) as e:
+                    reply = {'type': 'error', 'message': str(e)}
+                sender.push(json.dumps(reply))
+        except websockets.ConnectionClosed:
+            pass
+        except Exception:
+            logger.exception("WebSocket error")
         finally:
-            await pubsub.unsubscribe()
-            await redis.close()
-            
-            if queue_id in self.connections['queue']:
-                self.connections['queue'][queue_id].discard(websocket)
-                if not self.connections['queue'][queue_id]:
-                    del self.connections['queue'][queue_id]
+            self._remove_connection(websocket)
     
-    async def subscribe_agent(self, websocket: websockets.WebSocketServerProtocol,
-                            agent_id: int):
-        """Subscribe to agent events."""
-        if agent_id not in self.connections['agent']:
-            self.connections['agent'][agent_id] = set()
-        self.connections['agent'][agent_id].add(websocket)
+    async def _handle_message(self, websocket: websockets.WebSocketServerProtocol,
+                              tenant_uuid: str, message: Dict) -> Dict:
+        """Apply a subscription message and build its reply."""
+        action = message.get('action')
+        queue_ids = [int(queue_id) for queue_id in message.get('queues', ())]
+        agent_ids = [int(agent_id) for agent_id in message.get('agents', ())]
+        channels = [('queue', queue_id) for queue_id in queue_ids] + [('agent', agent_id) for agent_id in agent_ids]
+        if message.get('tenant'):
+            channels.append(('tenant', tenant_uuid))
         
-        redis = await aioredis.from_url(self.redis_url)
-        pubsub = redis.pubsub()
+        service_levels = {}
+        if action in ('subscribe', 'subscribe_metrics'):
+            service_levels = await self._check_subjects(tenant_uuid, queue_ids, agent_ids)
         
-        await pubsub.subscribe(f"events:agent:{agent_id}")
+        if action == 'subscribe':
+            last_event_id = message.get('last_event_id')
+            if last_event_id:
+                await self._subscribe_with_replay(websocket, channels, last_event_id)
+            else:
+                for channel_type, key in channels:
+                    self._add_subscription(websocket, channel_type, key)
+        elif action == 'unsubscribe':
+            for channel_type, key in channels:
+                self._remove_subscription(websocket, channel_type, key)
+        elif action == 'subscribe_metrics':
+            # A new metrics subscription replaces the previous one
+            self._close_metric_subscriptions(websocket)
+            self._add_metric_subscription(websocket, queue_ids, agent_ids, float(message.get('interval', 1.0)),
+                                          service_levels)
+        elif action == 'unsubscribe_metrics':
+            self._close_metric_subscriptions(websocket)
+        else:
+            raise ValueError(f"Unknown action {action!r}")
         
+        return {
+            'type': 'ack',
+            'action': action,
+            'subscriptions': sorted(
+                [channel_type, key] for channel_type, key in self.subscriptions.get(websocket, ())
+                if channel_type != 'tenant'
+            ),
+            'tenant': ('tenant', tenant_uuid) in self.subscriptions.get(websocket, ())
+        }
+    
+    async def _check_subjects(self, tenant_uuid: str, queue_ids: List[int],
+                              agent_ids: List[int]) -> Dict[int, int]:
+        """Check that queues and agents belong to a tenant, raising ``ValueError`` otherwise.
+        
+        Returns the service level threshold of each queue.
+        """
+        if not queue_ids and not agent_ids:
+            return {}
+        return await asyncio.get_running_loop().run_in_executor(
+            None, self._lookup_subjects, tenant_uuid, queue_ids, agent_ids
+        )
+    
+    def _lookup_subjects(self, tenant_uuid: str, queue_ids: List[int], agent_ids: List[int]) -> Dict[int, int]:
+        """Look the subjects up with one query per table and reject foreign ones; runs in a worker thread."""
+        session = self.session_factory()
         try:
-            while True:
-                try:
-                    message = await pubsub.get_message(ignore_subscribe_messages=True)
-                    if message:
-                        await websocket.send(message['data'].decode())
-                    await asyncio.sleep(0.1)
-                except websockets.ConnectionClosed:
-                    break
+            known_queues = {}
+            if queue_ids:
+                known_queues = dict(session.query(Queue.id, Queue.service_level).filter(
+                    Queue.tenant_uuid == tenant_uuid,
+                    Queue.id.in_(queue_ids)
+                ))
+            known_agents = set()
+            if agent_ids:
+                known_agents = {agent_id for agent_id, in session.query(Agent.id).filter(
+                    Agent.tenant_uuid == tenant_uuid,
+                    Agent.id.in_(agent_ids)
+                )}
+        finally:
+            session.close()
+        
+        foreign = ([f"queue {queue_id}" for queue_id in queue_ids if queue_id not in known_queues]
+                   + [f"agent {agent_id}" for agent_id in agent_ids if agent_id not in known_agents])
+        if foreign:
+            raise ValueError(f"Not found: {', '.join(foreign)}")
+        return {queue_id: service_level or 0 for queue_id, service_level in known_queues.items()}
+    
+    def _add_metric_subscription(self, websocket: websockets.WebSocketServerProtocol,
+                                 queue_ids: Iterable[int], agent_ids: Iterable[int], interval: float,
+                                 service_levels: Optional[Dict[int, int]] = None):
+        """Start a metrics subscription for a connection."""
+        subscription = MetricsSubscription(
+            self._get_sender(websocket), self._get_redis(), queue_ids, agent_ids, interval, service_levels
+        )
+        self.metric_subscriptions.setdefault(websocket, []).append(subscription)
+        for subject in subscription.subjects:
+            self.metric_watchers.setdefault(subject, set()).add(subscription)
+    
+    def _get_sender(self, websocket: websockets.WebSocketServerProtocol) -> ClientSender:
+        """Get the outbound queue of a connection, creating it on first use."""
+        sender = self.senders.get(websocket)
+        if sender is None:
+            sender = ClientSender(websocket, self.send_queue_size, self.slow_consumer_policy,
+                                  self._remove_connection)
+            self.senders[websocket] = sender
+        return sender
+    
+    async def _subscribe_with_replay(self, websocket: websockets.WebSocketServerProtocol,
+                                     channels: List[Tuple[str, object]], last_event_id: str):
+        """Join channels and send the connection the events it missed on them.
+        
+        The channels are joined before the replay so no event falls between
+        the two; live events for the connection are held back until the
+        replay is over, then sent unless the replay already sent them.
+        Streams share event IDs, so an event on several replayed channels is
+        sent once.
+        """
+        check_stream_id(last_event_id)
+        replayed: Set[str] = set()
+        self._held[websocket] = []
+        try:
+            for channel_type, key in channels:
+                self._add_subscription(websocket, channel_type, key)
+            for channel_type, key in channels:
+                await self._replay(websocket, channel_type, key, last_event_id, replayed)
         finally:
-            await pubsub.unsubscribe()
-            await redis.close()
+            held = self._held.pop(websocket, [])
+        
+        sender = self.senders.get(websocket)
+        if sender is not None:
+            for entry_id, message, coalesce_key in held:
+                if entry_id not in replayed:
+                    sender.push(message, coalesce_key)
+    
+    async def _replay(self, websocket: websockets.WebSocketServerProtocol,
+                      channel_type: str, key, last_event_id: str, replayed: Set[str]):
+        """Send the events of a channel that follow the last one a client saw.
+        
+        Events whose ID is in ``replayed`` are skipped; sent ones are added.
+        """
+        entries = await self._get_redis().xrange(
+            stream_key(channel_type, key), f"({last_event_id}", '+', count=self.batch_size
+        )
+        while entries:
+            for entry_id, fields in entries:
+                entry_id = entry_id.decode()
+                payload = fields.get(EVENT_FIELD.encode())
+                if entry_id in replayed or payload is None:
+                    continue
+                replayed.add(entry_id)
+                await websocket.send(self._format(entry_id, payload.decode()))
+            last_event_id = entry_id
+            entries = await self._get_redis().xrange(
+                stream_key(channel_type, key), f"({last_event_id}", '+', count=self.batch_size
+            )
+    
+    async def run(self):
+        """Deliver events to local connections with the configured transport."""
+        if event_publisher.transport == 'pubsub':
+            await self.listen_events()
+        else:
+            await self.consume_events()
+    
+    async def listen_events(self):
+        """Receive published events through a single pattern subscription and fan them out."""
+        while True:
+            pubsub = self._get_redis().pubsub(ignore_subscribe_messages=True)
+            try:
+                await pubsub.psubscribe(f"{PUBSUB_CHANNEL_PREFIX}*")
+                async for message in pubsub.listen():
+                    await self.dispatch_event(None, message['data'].decode())
+            except RedisConnectionError:
+                logger.exception("Lost the event subscription, resubscribing")
+                await asyncio.sleep(1)
+            finally:
+                await pubsub.aclose()
+    
+    async def consume_events(self):
+        """Read the event stream through the node's consumer group and fan events out.
+        
+        The group starts at the end of the stream; events this node read
+        but never acknowledged are delivered first, then new events as they
+        arrive. Pending entries trimmed from the stream, and events that
+        cannot be dispatched, are logged and acknowledged.
+        """
+        redis = self._get_redis()
+        register_stream_parser(redis)
+        group = websocket_group(self.node_id)
+        try:
+            await redis.xgroup_create(EVENTS_STREAM, group, id='$', mkstream=True)
+        except ResponseError as e:
+            if 'BUSYGROUP' not in str(e):
+                raise
+        
+        last_id = '0'
+        while True:
+            try:
+                response = await redis.xreadgroup(
+                    group, self.node_id, {EVENTS_STREAM: last_id},
+                    count=self.batch_size, block=None if last_id == '0' else self.block
+                )
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Failed to read the event stream")
+                await asyncio.sleep(1)
+                continue
+            
+            entries = response[0][1] if response else []
+            if not entries:
+                last_id = '>'
+                continue
             
-            if agent_id in self.connections['agent']:
-                self.connections['agent'][agent_id].discard(websocket)
-                if not self.connections['agent'][agent_id]:
-                    del self.connections['agent'][agent_id]
+            for entry_id, fields in entries:
+                entry_id = entry_id.decode()
+                if fields is None:
+                    logger.warning("Event %s was trimmed from the stream before delivery", entry_id)
+                    continue
+                try:
+                    await self.dispatch_event(entry_id, fields[EVENT_FIELD.encode()].decode())
+                except Exception:
+                    logger.exception("Failed to dispatch event %s", entry_id)
+            try:
+                await redis.xack(EVENTS_STREAM, group, *[entry_id for entry_id, _ in entries])
+            except Exception:
+                logger.exception("Failed to acknowledge streamed events")
+    
+    async def dispatch_event(self, entry_id: Optional[str], payload: str):
+        """Send a serialized event once to every local connection watching it."""
+        event = json.loads(payload)
+        
+        # Metric subscribers only learn that their subject changed
+        for subject in (('queue', event.get('queue_id')), ('agent', event.get('agent_id'))):
+            for subscription in self.metric_watchers.get(subject, ()):
+                subscription.dirty.add(subject)
+        
+        recipients = set()
+        recipients.update(self.connections['tenant'].get(event.get('tenant_uuid'), ()))
+        if event.get('queue_id'):
+            recipients.update(self.connections['queue'].get(event['queue_id'], ()))
+        if event.get('agent_id'):
+            recipients.update(self.connections['agent'].get(event['agent_id'], ()))
+        
+        if recipients:
+            message = self._format(entry_id, payload)
+            coalesce_key = self._coalesce_key(event)
+            for websocket in recipients.intersection(self._held):
+                self._held[websocket].append((entry_id, message, coalesce_key))
+            self._enqueue_all(recipients.difference(self._held), message, coalesce_key)
+    
+    @staticmethod
+    def _format(entry_id: Optional[str], payload: str) -> str:
+        """Wrap an already serialized event without serializing it again."""
+        return '{"id": %s, "timestamp": "%s", "data": %s}' % (
+            json.dumps(entry_id), datetime.utcnow().isoformat(), payload
+        )
+    
+    @staticmethod
+    def _coalesce_key(event: Dict) -> Optional[Hashable]:
+        """Get the subject an event updates; a newer waiting event replaces an older one."""
+        for field in ('call_id', 'agent_id', 'queue_id'):
+            if event.get(field):
+                return (field, event[field])
+        return None
+    
+    def _enqueue_all(self, connections: Iterable[websockets.WebSocketServerProtocol], message_str: str,
+                     key: Optional[Hashable] = None):
+        """Queue a message for connections without waiting on any socket."""
+        for websocket in list(connections):
+            sender = self.senders.get(websocket)
+            if sender is not None:
+                sender.push(message_str, key)
     
     def _remove_connection(self, websocket: websockets.WebSocketServerProtocol):
-        """Remove a connection from all channels."""
-        # Remove from tenant channels
-        for tenant_connections in self.connections['tenant'].values():
-            tenant_connections.discard(websocket)
-        
-        # Remove from queue channels
-        for queue_connections in self.connections['queue'].values():
-            queue_connections.discard(websocket)
-        
-        # Remove from agent channels
-        for agent_connections in self.connections['agent'].values():
-            agent_connections.discard(websocket)
-        
-        # Clean up empty sets
-        for channel_type in self.connections:
-            empty_keys = [
-                key for key, connections in self.connections[channel_type].items()
-                if not connections
-            ]
-            for key in empty_keys:
+        """Remove a connection from its channels, touching only the ones it joined."""
+        sender = self.senders.pop(websocket, None)
+        if sender is not None:
+            self.dropped_messages += sender.dropped
+            sender.close(notify=False)
+        
+        self._close_metric_subscriptions(websocket)
+        
+        for channel_type, key in self.subscriptions.pop(websocket, ()):
+            self._discard_connection(channel_type, key, websocket)
+    
+    def _add_subscription(self, websocket: websockets.WebSocketServerProtocol, channel_type: str, key):
+        """Add a connection to a channel and to its reverse index."""
+        self.connections[channel_type].setdefault(key, set()).add(websocket)
+        self.subscriptions.setdefault(websocket, set()).add((channel_type, key))
+    
+    def _remove_subscription(self, websocket: websockets.WebSocketServerProtocol, channel_type: str, key):
+        """Remove a connection from one channel."""
+        channels = self.subscriptions.get(websocket)
+        if channels is not None:
+            channels.discard((channel_type, key))
+        self._discard_connection(channel_type, key, websocket)
+    
+    def _discard_connection(self, channel_type: str, key, websocket: websockets.WebSocketServerProtocol):
+        """Remove a connection from a channel's set, dropping the set once empty."""
+        connections = self.connections[channel_type].get(key)
+        if connections is not None:
+            connections.discard(websocket)
+            if not connections:
                 del self.connections[channel_type][key]
     
+    def _close_metric_subscriptions(self, websocket: websockets.WebSocketServerProtocol):
+        """Stop the metric subscriptions of a connection."""
+        for subscription in self.metric_subscriptions.pop(websocket, ()):
+            subscription.close()
+            for subject in subscription.subjects:
+                watchers = self.metric_watchers.get(subject)
+                if watchers is not None:
+                    watchers.discard(subscription)
+                    if not watchers:
+                        del self.metric_watchers[subject]
+    
     async def broadcast_tenant(self, tenant_uuid: str, message: Dict):
         """Broadcast message to all connections in a tenant."""
         if tenant_uuid in self.connections['tenant']:
-            message_str = json.dumps({
-                'timestamp': datetime.utcnow().isoformat(),
-                'data': message
-            })
-            
-            closed_connections = set()
-            for websocket in self.connections['tenant'][tenant_uuid]:
-                try:
-                    await websocket.send(message_str)
-                except websockets.ConnectionClosed:
-                    closed_connections.add(websocket)
-            
-            # Remove closed connections
-            for websocket in closed_connections:
-                self._remove_connection(websocket)
+            self._enqueue_all(self.connections['tenant'][tenant_uuid],
+                              self._format(None, json.dumps(message)))
     
     async def broadcast_queue(self, queue_id: int, message: Dict):
         """Broadcast message to all connections watching a queue."""
         if queue_id in self.connections['queue']:
-            message_str = json.dumps({
-                'timestamp': datetime.utcnow().isoformat(),
-                'data': message
-            })
-            
-            closed_connections = set()
-            for websocket in self.connections['queue'][queue_id]:
-                try:
-                    await websocket.send(message_str)
-                except websockets.ConnectionClosed:
-                    closed_connections.add(websocket)
-            
-            # Remove closed connections
-            for websocket in closed_connections:
-                self._remove_connection(websocket)
+            self._enqueue_all(self.connections['queue'][queue_id],
+                              self._format(None, json.dumps(message)))
     
     async def broadcast_agent(self, agent_id: int, message: Dict):
         """Broadcast message to all connections watching an agent."""
         if agent_id in self.connections['agent']:
-            message_str = json.dumps({
-                'timestamp': datetime.utcnow().isoformat(),
-                'data': message
-            })
-            
-            closed_connections = set()
-            for websocket in self.connections['agent'][agent_id]:
-                try:
-                    await websocket.send(message_str)
-                except websockets.ConnectionClosed:
-                    closed_connections.add(websocket)
-            
-            # Remove closed connections
-            for websocket in closed_connections:
-                self._remove_connection(websocket)
+            self._enqueue_all(self.connections['agent'][agent_id],
+                              self._format(None, json.dumps(message)))